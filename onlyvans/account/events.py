@@ -0,0 +1,189 @@
+import logging
+import queue
+import threading
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from creator.models import Tier
+from .models import CustomUser, Event
+
+EVENT_QUEUE_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+class EventBatch:
+    """
+    Events recorded in one transaction, written with a single insert once it commits.
+
+    The batch is registered as an on-commit callback of the transaction, so a rollback
+    discards it together with its events.
+
+    Attributes:
+    - savepoint_ids: The savepoints open when the batch was registered.
+    - events: The unsaved Event instances.
+    """
+
+    def __init__(self, savepoint_ids):
+        self.savepoint_ids = savepoint_ids
+        self.events = []
+
+    def __call__(self):
+        write_events(self.events)
+
+
+class BackgroundEventWriter:
+    """
+    A daemon thread that writes committed events off the request path.
+
+    Batches handed over by several transactions are merged into one insert of up to
+    `batch_size` events.
+
+    Attributes:
+    - batch_size: The maximum number of events per insert.
+    """
+
+    def __init__(self, batch_size=EVENT_QUEUE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, events):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='event-writer', daemon=True)
+                self.thread.start()
+        self.queue.put(events)
+
+    def run(self):
+        while True:
+            pending = list(self.queue.get())
+            batches = 1
+            while len(pending) < self.batch_size:
+                try:
+                    pending.extend(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+                batches += 1
+            try:
+                close_old_connections()
+                Event.objects.bulk_create(pending, batch_size=self.batch_size)
+            except Exception:
+                logger.exception('Could not write %d events', len(pending))
+            finally:
+                for _ in range(batches):
+                    self.queue.task_done()
+
+    def join(self):
+        """
+        Block until every submitted event has been written.
+        """
+        self.queue.join()
+
+
+background_writer = BackgroundEventWriter()
+
+
+def write_events(events):
+    """
+    Save events with one insert, or hand them to the background writer when
+    `EVENT_BACKGROUND_WRITES` is enabled.
+
+    Args:
+        events (list): Unsaved Event instances.
+    """
+    if not events:
+        return
+    if getattr(settings, 'EVENT_BACKGROUND_WRITES', False):
+        background_writer.submit(events)
+    else:
+        Event.objects.bulk_create(events)
+
+
+def _registered_batches(connection):
+    """
+    Read the open savepoints and the batches registered as on-commit callbacks of a connection.
+
+    Django keeps no public record of either, so this is the one place that reads the private
+    `savepoint_ids` and `run_on_commit` attributes of the connection. As of Django 5.0,
+    `run_on_commit` holds `(savepoint_ids, func, robust)` tuples;
+    `EventBatchTests.test_connection_internals` fails if that shape changes.
+
+    Args:
+        connection: The database connection, inside an atomic block.
+
+    Returns:
+        tuple: (savepoint_ids, batches) where `savepoint_ids` is the set of open savepoints
+        and `batches` lists the registered EventBatch callbacks in registration order.
+    """
+    batches = [func for _, func, _ in connection.run_on_commit if isinstance(func, EventBatch)]
+    return set(connection.savepoint_ids), batches
+
+
+def _current_batch(connection):
+    """
+    Get the batch of the current transaction or savepoint, registering a new one if needed.
+
+    Events recorded inside a savepoint get a batch of their own, so they are never written if
+    the savepoint is rolled back. Once the savepoint is released its batch is folded into the
+    enclosing one the next time the enclosing level records an event, so events recorded
+    around inner `atomic()` blocks are still written with one insert.
+    """
+    savepoint_ids, batches = _registered_batches(connection)
+    current, released = None, []
+    for func in batches:
+        if func.savepoint_ids == savepoint_ids:
+            current = func
+        elif not func.savepoint_ids <= savepoint_ids:
+            # Its savepoint ended; a rollback would have removed the callback
+            released.append(func)
+
+    if current is None:
+        current = EventBatch(savepoint_ids)
+        transaction.on_commit(current)
+    for batch in released:
+        current.events.extend(batch.events)
+        batch.events = []
+    return current
+
+
+def record_event(user, event_type, **payload):
+    """
+    Record an event of a user.
+
+    Inside a transaction the event is buffered and written with every other event of the
+    transaction in one insert after it commits. Outside a transaction it is written right away.
+
+    Args:
+        user (CustomUser): The user the event belongs to.
+        event_type (int): Type of the event, one of `Event.EVENT_TYPES`.
+        **payload: The variable parts of the event: `counterparty` and `tier` ids, `amount`, `title`.
+    """
+    event = Event(user=user, event_type=event_type, payload=payload)
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        write_events([event])
+        return
+    _current_batch(connection).events.append(event)
+
+
+def describe_events(events):
+    """
+    Render the descriptions of events, looking up counterparties and tiers with one query each.
+
+    Args:
+        events (iterable): Event instances. Each gets a `description` attribute.
+
+    Returns:
+        list: The events.
+    """
+    events = list(events)
+    counterparty_ids = {event.payload.get('counterparty') for event in events} - {None}
+    tier_ids = {event.payload.get('tier') for event in events} - {None}
+    usernames = dict(CustomUser.objects.filter(pk__in=counterparty_ids).values_list(
+        'pk', 'username')) if counterparty_ids else {}
+    tier_names = dict(Tier.objects.filter(pk__in=tier_ids).values_list(
+        'pk', 'name')) if tier_ids else {}
+    for event in events:
+        event.description = event.render_description(usernames, tier_names)
+    return events
@@ -1,8 +1,11 @@
-from django.db.models import Count
+import stripe
+from django.conf import settings
+from django.db.models import Sum
 from django.utils import timezone
 from creator.models import Tier, Post
 from client.models import Subscription
 from interactions.models import Like
+from .models import CustomUser, StripeAccountStatus
 
 def get_active_subscribers_count(user):
     """
@@ -27,7 +30,7 @@ def get_total_likes(user):
     Returns:
         int: The total number of likes across all posts by the user.
     """
-    total_likes = Post.objects.filter(user=user).aggregate(total_likes=Count('likes'))['total_likes'] or 0
+    total_likes = Post.objects.filter(user=user).aggregate(total_likes=Sum('likes_count'))['total_likes'] or 0
     return total_likes
 
 
@@ -55,3 +58,84 @@ def get_total_subscriptions(user):
         int: The total number of active subscriptions for the user.
     """
     return Subscription.objects.filter(user=user, end_date__gte=timezone.now(), status='ACTIVE').count()
+
+
+def _stripe_field(obj, name):
+    """
+    Read a field from a Stripe object or from a raw webhook payload.
+    """
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def store_stripe_account(user, account):
+    """
+    Cache the status of a Stripe account.
+
+    Args:
+        user (CustomUser): The user owning the account.
+        account (stripe.Account or dict): The account as returned by the API or sent in a webhook.
+
+    Returns:
+        StripeAccountStatus: The cached status.
+    """
+    capabilities = dict(_stripe_field(account, 'capabilities') or {})
+    requirements = _stripe_field(account, 'requirements')
+    status, _ = StripeAccountStatus.objects.update_or_create(user=user, defaults={
+        'account_id': user.stripe_account_id,
+        'capabilities': capabilities,
+        'transfers_active': capabilities.get('transfers') == 'active',
+        'requirements_due': bool(requirements and _stripe_field(requirements, 'currently_due')),
+        'fetched_at': timezone.now(),
+    })
+    return status
+
+
+def get_stripe_account_status(user):
+    """
+    Get the cached status of a user's Stripe account, fetching it from Stripe only when the
+    cache is missing, stale, invalidated or belongs to a different account.
+
+    Args:
+        user (CustomUser): A user with a Stripe account ID.
+
+    Returns:
+        StripeAccountStatus: The status of the account.
+
+    Raises:
+        stripe.error.StripeError: If the status had to be fetched and the request failed.
+    """
+    status = StripeAccountStatus.objects.filter(user=user).first()
+    fresh_after = timezone.now() - timezone.timedelta(seconds=settings.STRIPE_ACCOUNT_CACHE_TTL)
+    if (status is not None and status.account_id == user.stripe_account_id
+            and status.fetched_at is not None and status.fetched_at > fresh_after):
+        return status
+    return store_stripe_account(user, stripe.Account.retrieve(user.stripe_account_id))
+
+
+def invalidate_stripe_account_status(user):
+    """
+    Mark a user's cached Stripe account status as stale, so the next read fetches it again.
+
+    Args:
+        user (CustomUser): The user whose cached status is invalidated.
+    """
+    StripeAccountStatus.objects.filter(user=user).update(fetched_at=None)
+
+
+def apply_account_updated(account):
+    """
+    Refresh the cached status from an `account.updated` webhook payload.
+
+    Args:
+        account (dict): The account object of the webhook event.
+
+    Returns:
+        bool: True if the account belongs to a known user.
+    """
+    user = CustomUser.objects.filter(stripe_account_id=account.get('id')).first()
+    if user is None:
+        return False
+    store_stripe_account(user, account)
+    return True
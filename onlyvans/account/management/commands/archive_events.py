@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from account.partitions import archivable_months, archive_month, ensure_partitions, pa
+
+
+class Command(BaseCommand):
+    """
+    Custom management command to maintain the monthly event partitions.
+
+    Creates the partitions of the coming months on PostgreSQL, then moves every month older
+    than the retention window into a compressed Parquet file and drops it from the database.
+    Archived months stay readable from the event history page.
+    """
+    help = 'Архивируйте старые события в Parquet и подготовьте разделы на будущие месяцы.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=settings.EVENT_RETENTION_MONTHS,
+                            help='Number of recent months, including the current one, kept in the database.')
+        parser.add_argument('--ahead', type=int, default=2,
+                            help='Number of future months to create partitions for.')
+        parser.add_argument('--directory', default=None,
+                            help='Where to write the Parquet files. Defaults to EVENT_ARCHIVE_DIR.')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command. Prepares partitions, archives old months and writes
+        a summary to stdout.
+        """
+        if options['keep_months'] < 1:
+            raise CommandError('--keep-months must be at least 1.')
+
+        created = ensure_partitions(options['ahead'])
+        if created:
+            self.stdout.write(f'Создано разделов: {created}')
+
+        months = archivable_months(options['keep_months'])
+        if months and pa is None:
+            raise CommandError('Archiving events requires pyarrow.')
+        for month in months:
+            archive = archive_month(month, options['directory'])
+            self.stdout.write(f'{month:%Y-%m}: {archive.rows} событий -> {archive.path}')
+        self.stdout.write(self.style.SUCCESS(f'Архивировано месяцев: {len(months)}'))
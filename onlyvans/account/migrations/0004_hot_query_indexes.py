@@ -0,0 +1,17 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_alter_userprofile_instagram_url_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['user', '-timestamp'], name='event_user_recent_idx'),
+        ),
+    ]
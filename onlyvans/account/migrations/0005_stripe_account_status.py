@@ -0,0 +1,27 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeAccountStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.CharField(max_length=255)),
+                ('capabilities', models.JSONField(default=dict)),
+                ('transfers_active', models.BooleanField(default=False)),
+                ('requirements_due', models.BooleanField(default=True)),
+                ('fetched_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stripe_status', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
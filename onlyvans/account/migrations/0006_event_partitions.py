@@ -0,0 +1,99 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:43
+
+from datetime import datetime, time, timedelta
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def partition_events(apps, schema_editor):
+    """
+    Rebuild the event table as a table range partitioned by month on PostgreSQL.
+
+    Partitions are created for every month from the oldest event to two months ahead, plus a
+    default partition. The primary key has to include the partition key, so it becomes
+    (id, timestamp). Other databases keep the single table.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    execute = schema_editor.execute
+    execute('ALTER TABLE account_event RENAME TO account_event_legacy')
+    execute('ALTER INDEX event_user_recent_idx RENAME TO event_user_recent_legacy_idx')
+    execute(
+        'CREATE TABLE account_event ('
+        ' id bigserial,'
+        ' user_id bigint NOT NULL REFERENCES account_customuser (id) DEFERRABLE INITIALLY DEFERRED,'
+        ' event_type varchar(50) NOT NULL,'
+        ' description text NOT NULL,'
+        ' timestamp timestamp with time zone NOT NULL,'
+        ' PRIMARY KEY (id, timestamp)'
+        ') PARTITION BY RANGE (timestamp)')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT min(timestamp) FROM account_event_legacy')
+        oldest = cursor.fetchone()[0] or timezone.now()
+    month = timezone.localtime(oldest).date().replace(day=1)
+    last = timezone.localdate().replace(day=1) + timedelta(days=62)
+    while month <= last:
+        following = (month + timedelta(days=32)).replace(day=1)
+        execute(f'CREATE TABLE account_event_{month:%Y%m} PARTITION OF account_event '
+                f'FOR VALUES FROM (%s) TO (%s)', [
+                    timezone.make_aware(datetime.combine(month, time.min)),
+                    timezone.make_aware(datetime.combine(following, time.min)),
+                ])
+        month = following
+    execute('CREATE TABLE account_event_default PARTITION OF account_event DEFAULT')
+    execute('INSERT INTO account_event (id, user_id, event_type, description, timestamp) '
+            'SELECT id, user_id, event_type, description, timestamp FROM account_event_legacy')
+    execute("SELECT setval(pg_get_serial_sequence('account_event', 'id'), "
+            "coalesce((SELECT max(id) FROM account_event), 0) + 1, false)")
+    execute('DROP TABLE account_event_legacy')
+    execute('CREATE INDEX event_user_recent_idx ON account_event (user_id, timestamp DESC)')
+
+
+def unpartition_events(apps, schema_editor):
+    """
+    Turn the partitioned event table back into a single table.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    execute = schema_editor.execute
+    execute('ALTER TABLE account_event RENAME TO account_event_partitioned')
+    execute('ALTER INDEX event_user_recent_idx RENAME TO event_user_recent_partitioned_idx')
+    execute(
+        'CREATE TABLE account_event ('
+        ' id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,'
+        ' user_id bigint NOT NULL REFERENCES account_customuser (id) DEFERRABLE INITIALLY DEFERRED,'
+        ' event_type varchar(50) NOT NULL,'
+        ' description text NOT NULL,'
+        ' timestamp timestamp with time zone NOT NULL)')
+    execute('INSERT INTO account_event (id, user_id, event_type, description, timestamp) '
+            'SELECT id, user_id, event_type, description, timestamp FROM account_event_partitioned')
+    execute("SELECT setval(pg_get_serial_sequence('account_event', 'id'), "
+            "coalesce((SELECT max(id) FROM account_event), 0) + 1, false)")
+    execute('DROP TABLE account_event_partitioned')
+    execute('CREATE INDEX event_user_recent_idx ON account_event (user_id, timestamp DESC)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_stripe_account_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('path', models.CharField(max_length=500)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.RunPython(partition_events, unpartition_events),
+    ]
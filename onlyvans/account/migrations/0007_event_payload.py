@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0006_event_partitions'),
+    ]
+
+    operations = [
+        # Defaults let the free-form columns be restored when migrating backwards
+        migrations.AlterField(
+            model_name='event',
+            name='event_type',
+            field=models.CharField(default='', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='description',
+            field=models.TextField(default=''),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='kind',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='payload',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
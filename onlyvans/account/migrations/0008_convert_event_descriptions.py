@@ -0,0 +1,115 @@
+import re
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 2000
+
+# (old event_type, description pattern, new type code), tried in order
+PATTERNS = [
+    ('Registration', r'Новый аккаунт зарегестрирован', 1),
+    ('Profile Update', r'Улучшение профиля', 2),
+    ('Profile Update', r'Пароль изменен', 3),
+    ('POST_CREATED', r'Новая публикация: (?P<title>.*)', 4),
+    ('POST_DELETED', r'Удалена публикация: (?P<title>.*)', 5),
+    ('TIER_CREATED', r'Создана новая подписка: (?P<title>.*)', 6),
+    ('TIER_DELETED', r'Удалена подписка: (?P<title>.*)', 7),
+    ('SUBSCRIPTION', r'Подписался на (?P<name>\S+) подпиской (?P<title>.*) на 30 дней\.', 8),
+    ('SUBSCRIPTION', r'(?P<name>\S+) подписался на вашу подписку (?P<title>.*) на 30 дней\.', 9),
+    ('SUBSCRIPTION_EXTENDED', r'(?P<name>\S+) продлили свою подписку на (?P<title>.*)\.', 11),
+    ('SUBSCRIPTION_EXTENDED', r'(?P<title>.*) продлили подписку на (?P<name>\S+)\.', 10),
+    ('SUBSCRIPTION_CANCELLED', r'(?P<name>\S+) отменили подписку на уровни (?P<title>.*)\.', 13),
+    ('SUBSCRIPTION_CANCELLED', r'Отменил подписку (?P<name>\S+) (?P<title>.*)\.', 12),
+    ('SUBSCRIPTION', r'Подписался на (?P<name>\S+) подписку (?P<title>.*) на 30 дней\.', 14),
+    ('SUBSCRIPTION', r'(?P<name>\S+) обновил подписку на вашу (?P<title>.*) подписку на следующие 30 дней\.', 15),
+    ('SUBSCRIPTION', r"Subscription to (?P<name>\S+)'s (?P<title>.*) tier expired\.", 16),
+    ('SUBSCRIPTION', r'(?P<name>\S+) подписка на вашу подписку (?P<title>.*) истекла\.', 17),
+    ('Purchase', r'Заказано (?P<amount>\d+) монет', 18),
+    ('Withdrawal', r'Withdrew (?P<amount>\d+) points', 19),
+    ('Withdrawal', r'Вывод (?P<amount>\d+) монет не удался, монеты возвращены', 20),
+]
+PATTERNS = [(event_type, re.compile(pattern), kind) for event_type, pattern, kind in PATTERNS]
+
+
+def parse(event_type, description):
+    """
+    Turn an old free-form event into a type code and a payload. Counterparties are returned by
+    username in `name` and resolved to ids by the caller.
+    """
+    for pattern_type, pattern, kind in PATTERNS:
+        match = pattern.fullmatch(description) if pattern_type == event_type else None
+        if match:
+            payload = {key: value for key, value in match.groupdict().items()}
+            if 'amount' in payload:
+                payload['amount'] = int(payload['amount'])
+            return kind, payload
+    return 0, {'text': description, 'type': event_type}
+
+
+def convert_events(apps, schema_editor):
+    """
+    Convert the free-form type and description of every event, one committed chunk at a time.
+    """
+    Event = apps.get_model('account', 'Event')
+    CustomUser = apps.get_model('account', 'CustomUser')
+
+    last = 0
+    while True:
+        chunk = list(Event.objects.filter(pk__gt=last).order_by('pk').only(
+            'pk', 'event_type', 'description', 'timestamp')[:CHUNK_SIZE])
+        if not chunk:
+            break
+        last = chunk[-1].pk
+
+        parsed = [parse(event.event_type, event.description) for event in chunk]
+        names = {payload['name'] for _, payload in parsed if 'name' in payload}
+        user_ids = dict(CustomUser.objects.filter(username__in=names).values_list('username', 'pk'))
+        for event, (kind, payload) in zip(chunk, parsed):
+            if payload.get('name') in user_ids:
+                payload['counterparty'] = user_ids[payload.pop('name')]
+            event.kind, event.payload = kind, payload
+        with transaction.atomic():
+            Event.objects.bulk_update(chunk, ['kind', 'payload'])
+
+
+def restore_descriptions(apps, schema_editor):
+    """
+    Render converted events back into free-form types and descriptions.
+    """
+    Event = apps.get_model('account', 'Event')
+    CustomUser = apps.get_model('account', 'CustomUser')
+    old_types = {kind: event_type for event_type, _, kind in PATTERNS}
+    templates = {kind: pattern.pattern for _, pattern, kind in PATTERNS}
+
+    last = 0
+    while True:
+        chunk = list(Event.objects.filter(pk__gt=last).order_by('pk')[:CHUNK_SIZE])
+        if not chunk:
+            break
+        last = chunk[-1].pk
+
+        usernames = dict(CustomUser.objects.filter(
+            pk__in={event.payload.get('counterparty') for event in chunk}).values_list('pk', 'username'))
+        for event in chunk:
+            if event.kind not in templates:
+                event.event_type = event.payload.get('type', 'Legacy')
+                event.description = event.payload.get('text', '')
+                continue
+            values = dict(event.payload, name=usernames.get(event.payload.get('counterparty'),
+                                                            event.payload.get('name', '')))
+            event.event_type = old_types[event.kind]
+            event.description = re.sub(
+                r'\(\?P<(\w+)>[^)]*\)', lambda match: str(values.get(match.group(1), '')),
+                templates[event.kind]).replace('\\', '')
+        with transaction.atomic():
+            Event.objects.bulk_update(chunk, ['event_type', 'description'])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('account', '0007_event_payload'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_events, restore_descriptions),
+    ]
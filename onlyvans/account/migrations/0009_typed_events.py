@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0008_convert_event_descriptions'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='event',
+            name='description',
+        ),
+        migrations.RemoveField(
+            model_name='event',
+            name='event_type',
+        ),
+        migrations.RenameField(
+            model_name='event',
+            old_name='kind',
+            new_name='event_type',
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='event_type',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'LEGACY'), (1, 'REGISTRATION'), (2, 'PROFILE_UPDATE'), (3, 'PASSWORD_CHANGE'), (4, 'POST_CREATED'), (5, 'POST_DELETED'), (6, 'TIER_CREATED'), (7, 'TIER_DELETED'), (8, 'SUBSCRIBED'), (9, 'NEW_SUBSCRIBER'), (10, 'EXTENDED'), (11, 'SUBSCRIBER_EXTENDED'), (12, 'CANCELLED'), (13, 'SUBSCRIBER_CANCELLED'), (14, 'RENEWED'), (15, 'SUBSCRIBER_RENEWED'), (16, 'EXPIRED'), (17, 'SUBSCRIBER_EXPIRED'), (18, 'PURCHASE'), (19, 'WITHDRAWAL'), (20, 'WITHDRAWAL_FAILED')]),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['user', 'event_type', '-timestamp'], name='event_user_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['event_type', 'timestamp'], name='event_type_time_idx'),
+        ),
+    ]
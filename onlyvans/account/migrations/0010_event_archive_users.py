@@ -0,0 +1,40 @@
+# Generated by Django 5.0.3 on 2026-10-17 05:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def link_archive_users(apps, schema_editor):
+    """
+    Record the users of months archived before archives kept them, read from the Parquet files.
+    Archives whose file cannot be read, or all of them without pyarrow, stay without users.
+    """
+    try:
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+    except ImportError:
+        return
+
+    EventArchive = apps.get_model('account', 'EventArchive')
+    for archive in EventArchive.objects.all():
+        try:
+            user_ids = pc.unique(pq.read_table(archive.path, columns=['user_id'])['user_id']).to_pylist()
+        except OSError:
+            continue
+        archive.users.add(*user_ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0009_typed_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventarchive',
+            name='users',
+            field=models.ManyToManyField(blank=True, related_name='event_archives', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(link_archive_users, migrations.RunPython.noop),
+    ]
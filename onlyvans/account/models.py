@@ -74,17 +74,176 @@ class Event(models.Model):
     """
     Model representing an event associated with a user.
 
+    The type is a small integer and the variable parts of the event are kept in `payload`:
+    `counterparty` (user id), `tier` (tier id), `amount` (points) and `title` (post or tier
+    name). Descriptions are rendered from `DESCRIPTIONS` when the event is displayed, see
+    `account.events.describe_events`. Events converted from free-form text that did not match
+    a known type are LEGACY events with the original text in `payload['text']` and type in `payload['type']`.
+
     Fields:
         - user (ForeignKey): The user who triggered the event. Deletes events if the user is deleted.
-        - event_type (CharField): Type of the event.
-        - description (TextField): Description of the event.
+        - event_type (PositiveSmallIntegerField): Type of the event, one of `EVENT_TYPES`.
+        - payload (JSONField): The variable parts of the event.
         - timestamp (DateTimeField): Time when the event occurred. Automatically set to the current time when created.
     """
+    LEGACY = 0
+    REGISTRATION = 1
+    PROFILE_UPDATE = 2
+    PASSWORD_CHANGE = 3
+    POST_CREATED = 4
+    POST_DELETED = 5
+    TIER_CREATED = 6
+    TIER_DELETED = 7
+    SUBSCRIBED = 8
+    NEW_SUBSCRIBER = 9
+    EXTENDED = 10
+    SUBSCRIBER_EXTENDED = 11
+    CANCELLED = 12
+    SUBSCRIBER_CANCELLED = 13
+    RENEWED = 14
+    SUBSCRIBER_RENEWED = 15
+    EXPIRED = 16
+    SUBSCRIBER_EXPIRED = 17
+    PURCHASE = 18
+    WITHDRAWAL = 19
+    WITHDRAWAL_FAILED = 20
+
+    EVENT_TYPES = [
+        (LEGACY, 'LEGACY'),
+        (REGISTRATION, 'REGISTRATION'),
+        (PROFILE_UPDATE, 'PROFILE_UPDATE'),
+        (PASSWORD_CHANGE, 'PASSWORD_CHANGE'),
+        (POST_CREATED, 'POST_CREATED'),
+        (POST_DELETED, 'POST_DELETED'),
+        (TIER_CREATED, 'TIER_CREATED'),
+        (TIER_DELETED, 'TIER_DELETED'),
+        (SUBSCRIBED, 'SUBSCRIBED'),
+        (NEW_SUBSCRIBER, 'NEW_SUBSCRIBER'),
+        (EXTENDED, 'EXTENDED'),
+        (SUBSCRIBER_EXTENDED, 'SUBSCRIBER_EXTENDED'),
+        (CANCELLED, 'CANCELLED'),
+        (SUBSCRIBER_CANCELLED, 'SUBSCRIBER_CANCELLED'),
+        (RENEWED, 'RENEWED'),
+        (SUBSCRIBER_RENEWED, 'SUBSCRIBER_RENEWED'),
+        (EXPIRED, 'EXPIRED'),
+        (SUBSCRIBER_EXPIRED, 'SUBSCRIBER_EXPIRED'),
+        (PURCHASE, 'PURCHASE'),
+        (WITHDRAWAL, 'WITHDRAWAL'),
+        (WITHDRAWAL_FAILED, 'WITHDRAWAL_FAILED'),
+    ]
+
+    DESCRIPTIONS = {
+        LEGACY: '{text}',
+        REGISTRATION: 'Новый аккаунт зарегестрирован',
+        PROFILE_UPDATE: 'Улучшение профиля',
+        PASSWORD_CHANGE: 'Пароль изменен',
+        POST_CREATED: 'Новая публикация: {title}',
+        POST_DELETED: 'Удалена публикация: {title}',
+        TIER_CREATED: 'Создана новая подписка: {tier}',
+        TIER_DELETED: 'Удалена подписка: {title}',
+        SUBSCRIBED: 'Подписался на {counterparty} подпиской {tier} на 30 дней.',
+        NEW_SUBSCRIBER: '{counterparty} подписался на вашу подписку {tier} на 30 дней.',
+        EXTENDED: '{tier} продлили подписку на {counterparty}.',
+        SUBSCRIBER_EXTENDED: '{counterparty} продлили свою подписку на {tier}.',
+        CANCELLED: 'Отменил подписку {counterparty} {tier}.',
+        SUBSCRIBER_CANCELLED: '{counterparty} отменили подписку на уровни {tier}.',
+        RENEWED: 'Подписался на {counterparty} подписку {tier} на 30 дней.',
+        SUBSCRIBER_RENEWED: '{counterparty} обновил подписку на вашу {tier} подписку на следующие 30 дней.',
+        EXPIRED: "Subscription to {counterparty}'s {tier} tier expired.",
+        SUBSCRIBER_EXPIRED: '{counterparty} подписка на вашу подписку {tier} истекла.',
+        PURCHASE: 'Заказано {amount} монет',
+        WITHDRAWAL: 'Withdrew {amount} points',
+        WITHDRAWAL_FAILED: 'Вывод {amount} монет не удался, монеты возвращены',
+    }
+
     user = models.ForeignKey(
         CustomUser, on_delete=models.CASCADE, related_name='events')
-    event_type = models.CharField(max_length=50)
-    description = models.TextField()
+    event_type = models.PositiveSmallIntegerField(choices=EVENT_TYPES)
+    payload = models.JSONField(default=dict, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-timestamp'],
+                         name='event_user_recent_idx'),
+            models.Index(fields=['user', 'event_type', '-timestamp'],
+                         name='event_user_type_idx'),
+            models.Index(fields=['event_type', 'timestamp'],
+                         name='event_type_time_idx'),
+        ]
+
+    def render_description(self, usernames=None, tier_names=None):
+        """
+        Render the description of the event.
+
+        Args:
+            usernames (dict, optional): Usernames by user id, for the counterparty.
+            tier_names (dict, optional): Tier names by tier id. Deleted tiers fall back to `title`.
+
+        Returns:
+            str: The description shown to the user.
+        """
+        payload = self.payload
+        values = {
+            'counterparty': (usernames or {}).get(payload.get('counterparty'), payload.get('name', '')),
+            'tier': (tier_names or {}).get(payload.get('tier'), payload.get('title', '')),
+            'title': payload.get('title', ''),
+            'amount': payload.get('amount', ''),
+            'text': payload.get('text', ''),
+        }
+        return self.DESCRIPTIONS.get(self.event_type, '{text}').format(**values)
+
+    def __str__(self):
+        return f'{self.user.username} - {self.get_event_type_display()} at {self.timestamp}'
+
+
+class EventArchive(models.Model):
+    """
+    Model recording a month of events that was moved out of the database into a Parquet file.
+
+    Fields:
+        - month (DateField): The first day of the archived month.
+        - path (CharField): The Parquet file holding the month's events.
+        - rows (PositiveIntegerField): The number of archived events.
+        - archived_at (DateTimeField): When the month was archived.
+        - users (ManyToManyField): The users with events in the month, so each user is only
+          offered the archived months that hold their events.
+    """
+    month = models.DateField(unique=True)
+    path = models.CharField(max_length=500)
+    rows = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    users = models.ManyToManyField(CustomUser, related_name='event_archives', blank=True)
+
+    class Meta:
+        ordering = ['-month']
+
+    def __str__(self):
+        return f'Events of {self.month:%Y-%m} ({self.rows})'
+
+
+class StripeAccountStatus(models.Model):
+    """
+    Model caching the status of a creator's Stripe account, so pages can check it without calling Stripe.
+
+    Rows are refreshed when they are older than `STRIPE_ACCOUNT_CACHE_TTL`, when an
+    `account.updated` webhook arrives, and after being invalidated explicitly.
+
+    Fields:
+        - user (OneToOneField): The user owning the Stripe account.
+        - account_id (CharField): The Stripe account ID the status was fetched for.
+        - capabilities (JSONField): The account's capabilities as reported by Stripe.
+        - transfers_active (BooleanField): Whether the account can receive transfers.
+        - requirements_due (BooleanField): Whether Stripe still needs onboarding information.
+        - fetched_at (DateTimeField): When the status was last fetched. Null once invalidated.
+    """
+    user = models.OneToOneField(
+        CustomUser, on_delete=models.CASCADE, related_name='stripe_status')
+    account_id = models.CharField(max_length=255)
+    capabilities = models.JSONField(default=dict)
+    transfers_active = models.BooleanField(default=False)
+    requirements_due = models.BooleanField(default=True)
+    fetched_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
-        return f'{self.user.username} - {self.event_type} at {self.timestamp}'
+        return f'{self.user.username} - {self.account_id}'
@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+from datetime import date, datetime, time
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Event, EventArchive
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Archiving events to Parquet is optional
+    pa = pq = None
+
+EVENT_TABLE = Event._meta.db_table
+DEFAULT_PARTITION = f'{EVENT_TABLE}_default'
+ARCHIVE_COLUMNS = ('id', 'user_id', 'event_type', 'payload', 'timestamp')
+ARCHIVE_CHUNK_SIZE = 10_000
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(day):
+    """
+    Get the first day of the month of a date.
+    """
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    """
+    Move the first day of a month by `count` months.
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month):
+    """
+    Get the aware datetimes where a month starts and the next one starts.
+
+    Args:
+        month (date): The first day of the month.
+
+    Returns:
+        tuple: (start, end) datetimes; events of the month satisfy start <= timestamp < end.
+    """
+    return (timezone.make_aware(datetime.combine(month, time.min)),
+            timezone.make_aware(datetime.combine(add_months(month, 1), time.min)))
+
+
+def partition_name(month):
+    return f'{EVENT_TABLE}_{month:%Y%m}'
+
+
+def is_partitioned():
+    """
+    Check whether the event table is range partitioned. Only PostgreSQL partitions it;
+    other databases keep a single table.
+    """
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [EVENT_TABLE])
+        return cursor.fetchone() is not None
+
+
+def partition_months():
+    """
+    Get the months that have a partition of the event table.
+
+    Returns:
+        list: First days of the months, oldest first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = %s::regclass', [EVENT_TABLE])
+        names = [name for name, in cursor.fetchall()]
+    prefix = f'{EVENT_TABLE}_'
+    return sorted(
+        datetime.strptime(name[len(prefix):], '%Y%m').date()
+        for name in names if name != DEFAULT_PARTITION)
+
+
+def create_partition(cursor, month):
+    """
+    Create the partition of one month, moving its rows out of the default partition if needed.
+
+    Args:
+        cursor: A cursor on the PostgreSQL connection.
+        month (date): The first day of the month.
+    """
+    start, end = month_bounds(month)
+    name = partition_name(month)
+    cursor.execute(f'SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s LIMIT 1',
+                   [start, end])
+    if cursor.fetchone() is None:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {EVENT_TABLE} '
+                       f'FOR VALUES FROM (%s) TO (%s)', [start, end])
+        return
+
+    # Rows of the month already landed in the default partition; it has to be detached while
+    # the new partition takes them over, or PostgreSQL refuses to create it
+    with transaction.atomic():
+        cursor.execute(f'ALTER TABLE {EVENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+        cursor.execute(f'CREATE TABLE {name} PARTITION OF {EVENT_TABLE} FOR VALUES FROM (%s) TO (%s)',
+                       [start, end])
+        cursor.execute(f'INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} '
+                       f'WHERE timestamp >= %s AND timestamp < %s', [start, end])
+        cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s',
+                       [start, end])
+        cursor.execute(f'ALTER TABLE {EVENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+
+
+def ensure_partitions(ahead=2, today=None):
+    """
+    Create the partitions of the current month and the next `ahead` months. Does nothing
+    unless the event table is partitioned.
+
+    Args:
+        ahead (int): The number of future months to prepare.
+        today (date, optional): The current day. Defaults to today.
+
+    Returns:
+        int: The number of partitions created.
+    """
+    if not is_partitioned():
+        return 0
+    existing = set(partition_months())
+    current = month_start(today or timezone.localdate())
+    created = 0
+    with connection.cursor() as cursor:
+        for offset in range(ahead + 1):
+            month = add_months(current, offset)
+            if month not in existing:
+                create_partition(cursor, month)
+                created += 1
+    return created
+
+
+def archive_schema():
+    """
+    Get the Parquet schema of archived events. Requires pyarrow.
+    """
+    return pa.schema([
+        ('id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('event_type', pa.int16()),
+        ('payload', pa.string()),
+        ('timestamp', pa.timestamp('us', tz='UTC')),
+    ])
+
+
+def _archive_table(batch, schema):
+    """
+    Turn a batch of event rows into a pyarrow table, with payloads as JSON text.
+    """
+    records = [dict(zip(ARCHIVE_COLUMNS, row)) for row in batch]
+    for record in records:
+        record['payload'] = json.dumps(record['payload'], ensure_ascii=False)
+    return pa.Table.from_pylist(records, schema=schema)
+
+
+def _write_month(month, path, chunk_size):
+    """
+    Stream the events of a month into a zstd-compressed Parquet file, one row group per chunk.
+
+    Returns:
+        int: The number of events written.
+    """
+    start, end = month_bounds(month)
+    rows = Event.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by().values_list(
+        *ARCHIVE_COLUMNS).iterator(chunk_size=chunk_size)
+    schema = archive_schema()
+    written = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                writer.write_table(_archive_table(batch, schema))
+                written += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(_archive_table(batch, schema))
+            written += len(batch)
+    return written
+
+
+def archive_month(month, directory=None, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    Move the events of one month out of the database into a Parquet file.
+
+    The file is written first. Then, in one short transaction, the month's partition is
+    detached and dropped on PostgreSQL, or its rows are deleted when the month has no
+    partition of its own, and an EventArchive row records where the events went and whose
+    events they are.
+
+    Args:
+        month (date): The first day of the month.
+        directory (str, optional): Where to write the file. Defaults to `EVENT_ARCHIVE_DIR`.
+        chunk_size (int): The number of rows read and written at a time.
+
+    Returns:
+        EventArchive: The archive of the month.
+
+    Raises:
+        RuntimeError: If pyarrow is not installed.
+    """
+    if pa is None:
+        raise RuntimeError('Archiving events requires pyarrow.')
+
+    directory = directory or settings.EVENT_ARCHIVE_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'events-{month:%Y-%m}.parquet')
+    rows = _write_month(month, path, chunk_size)
+
+    start, end = month_bounds(month)
+    events = Event.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    own_partition = is_partitioned() and month in partition_months()
+    with transaction.atomic():
+        user_ids = list(events.order_by().values_list('user_id', flat=True).distinct())
+        if own_partition:
+            with connection.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE {EVENT_TABLE} DETACH PARTITION {partition_name(month)}')
+                cursor.execute(f'DROP TABLE {partition_name(month)}')
+        else:
+            events.delete()
+        archive, _ = EventArchive.objects.update_or_create(
+            month=month, defaults={'path': path, 'rows': rows})
+        archive.users.add(*user_ids)
+    return archive
+
+
+def archivable_months(keep_months, today=None):
+    """
+    Get the months older than the retention window that still have events in the database.
+
+    On PostgreSQL these are the old monthly partitions, plus months whose rows landed in the
+    default partition because their partition did not exist yet. Those rows are archived by
+    deleting them; see `archive_month`.
+
+    Args:
+        keep_months (int): The number of recent months, including the current one, to keep.
+        today (date, optional): The current day. Defaults to today.
+
+    Returns:
+        list: First days of the months, oldest first.
+    """
+    cutoff = add_months(month_start(today or timezone.localdate()), -(keep_months - 1))
+    months = set()
+    if is_partitioned():
+        months.update(month for month in partition_months() if month < cutoff)
+
+    old_events = Event.objects.filter(timestamp__lt=month_bounds(cutoff)[0])
+    first = old_events.order_by('timestamp').values_list('timestamp', flat=True).first()
+    if first is not None:
+        month = month_start(timezone.localtime(first).date())
+        while month < cutoff:
+            start, end = month_bounds(month)
+            if month not in months and Event.objects.filter(timestamp__gte=start, timestamp__lt=end).exists():
+                months.add(month)
+            month = add_months(month, 1)
+    return sorted(months)
+
+
+def read_archive(archive, user):
+    """
+    Read a user's events from an archived month, newest first.
+
+    Only the row groups and columns needed are read, filtered on `user_id` by pyarrow.
+
+    Args:
+        archive (EventArchive): The archived month.
+        user (CustomUser): The user whose events are read.
+
+    Returns:
+        list: Unsaved Event instances, or an empty list when pyarrow is not installed or the
+            file is missing. Their descriptions are rendered with `describe_events`.
+    """
+    if pa is None:
+        return []
+    try:
+        table = pq.read_table(archive.path, filters=[('user_id', '=', user.pk)])
+    except OSError:
+        logger.exception('Could not read the event archive of %s at %s', f'{archive.month:%Y-%m}', archive.path)
+        return []
+    events = []
+    for row in table.to_pylist():
+        if 'payload' in row:
+            row['payload'] = json.loads(row['payload'])
+        else:  # Archived before events had typed payloads
+            row['event_type'], row['payload'] = Event.LEGACY, {'text': row.pop('description')}
+        events.append(Event(**row))
+    events.sort(key=lambda event: (event.timestamp, event.id), reverse=True)
+    return events
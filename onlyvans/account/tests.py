@@ -0,0 +1,254 @@
+import tempfile
+import unittest
+from importlib import import_module
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from client.models import Subscription
+from client.tasks import renew_subscriptions
+from creator.models import Tier
+from finances.models import Wallet
+from .events import _registered_batches, background_writer, record_event
+from .models import Event, EventArchive
+from .partitions import add_months, archivable_months, month_start, pa
+
+
+class EventArchiveTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a user with one recent event and two events from a year ago.
+        """
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(
+            username='testuser', password='testpassword', email='user@example.com')
+        self.old_month = add_months(month_start(timezone.localdate()), -12)
+        Event.objects.create(user=self.user, event_type=Event.LEGACY, payload={'text': 'Recent event'})
+        old = Event.objects.bulk_create([
+            Event(user=self.user, event_type=Event.LEGACY, payload={'text': f'Old event {index}'})
+            for index in range(2)
+        ])
+        Event.objects.filter(pk__in=[event.pk for event in old]).update(
+            timestamp=timezone.make_aware(timezone.datetime.combine(self.old_month, timezone.datetime.min.time()))
+            + timezone.timedelta(days=3))
+
+    def test_archivable_months(self):
+        """
+        Only months older than the retention window are archived.
+        """
+        self.assertEqual(archivable_months(6), [self.old_month])
+        self.assertEqual(archivable_months(13), [])
+
+    def test_history_lists_archived_months(self):
+        """
+        The history page shows recent events and links to the archived months.
+        """
+        archive = EventArchive.objects.create(month=self.old_month, path='events.parquet', rows=2)
+        archive.users.add(self.user)
+        EventArchive.objects.create(month=add_months(self.old_month, 1), path='other.parquet', rows=1)
+        self.client.login(username='testuser', password='testpassword')
+
+        response = self.client.get(reverse('history'))
+        self.assertContains(response, 'Recent event')
+        self.assertContains(response, f'?month={self.old_month:%Y-%m}')
+        self.assertNotContains(response, f'?month={add_months(self.old_month, 1):%Y-%m}')
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_missing_archive_file_reads_as_empty(self):
+        """
+        An archived month whose file was moved away shows no events instead of failing.
+        """
+        archive = EventArchive.objects.create(month=self.old_month, path='/nonexistent/events.parquet', rows=2)
+        archive.users.add(self.user)
+        self.client.login(username='testuser', password='testpassword')
+
+        with self.assertLogs('account.partitions', 'ERROR'):
+            response = self.client.get(reverse('history'), {'month': f'{self.old_month:%Y-%m}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Recent event')
+
+    @unittest.skipIf(pa is not None, 'pyarrow is installed')
+    def test_archive_requires_pyarrow(self):
+        """
+        Without pyarrow the command refuses to archive and leaves the events in place.
+        """
+        with self.assertRaises(CommandError):
+            call_command('archive_events', stdout=StringIO())
+        self.assertEqual(Event.objects.count(), 3)
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_archive_and_read_back(self):
+        """
+        Archived months leave the database and stay readable from the history page.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('archive_events', directory=directory, stdout=StringIO())
+
+            self.assertEqual(list(Event.objects.values_list('payload__text', flat=True)), ['Recent event'])
+            archive = EventArchive.objects.get()
+            self.assertEqual((archive.month, archive.rows), (self.old_month, 2))
+            self.assertEqual(list(archive.users.all()), [self.user])
+
+            self.client.login(username='testuser', password='testpassword')
+            response = self.client.get(reverse('history'), {'month': f'{self.old_month:%Y-%m}'})
+            self.assertContains(response, 'Old event 1')
+            self.assertNotContains(response, 'Recent event')
+
+
+class EventDescriptionTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with a tier and a client.
+        """
+        self.client = Client()
+        self.creator = get_user_model().objects.create_user(
+            username='creator', password='testpassword', email='creator@example.com', is_content_creator=True)
+        self.fan = get_user_model().objects.create_user(
+            username='fan', password='testpassword', email='fan@example.com')
+        self.tier = Tier.objects.create(name='Gold', points_price=100, description='Tier', user=self.creator)
+
+    def test_descriptions_are_rendered_on_display(self):
+        """
+        Counterparties and tiers are resolved when the history is shown, and deleted tiers fall back to their title.
+        """
+        Event.objects.create(user=self.fan, event_type=Event.SUBSCRIBED,
+                             payload={'counterparty': self.creator.pk, 'tier': self.tier.pk})
+        Event.objects.create(user=self.fan, event_type=Event.EXPIRED,
+                             payload={'counterparty': self.creator.pk, 'tier': 0, 'title': 'Old tier'})
+        self.client.login(username='fan', password='testpassword')
+
+        response = self.client.get(reverse('history'))
+        self.assertContains(response, 'Подписался на creator подпиской Gold на 30 дней.')
+        self.assertContains(response, 'Subscription to creator&#x27;s Old tier tier expired.')
+
+    def test_subscription_events_keep_the_tier_name(self):
+        """
+        Subscription events store the tier's name, so they still render it after the tier is deleted.
+        """
+        past = timezone.now() - timezone.timedelta(days=1)
+        Subscription.objects.create(user=self.fan, tier=self.tier, status='ACTIVE', start_date=past, end_date=past)
+        renew_subscriptions()
+        self.tier.delete()
+        self.client.login(username='fan', password='testpassword')
+
+        response = self.client.get(reverse('history'))
+        self.assertContains(response, 'Subscription to creator&#x27;s Gold tier expired.')
+
+    def test_convert_free_form_events(self):
+        """
+        The migration parser turns known descriptions into types and payloads and keeps unknown ones as text.
+        """
+        migration = import_module('account.migrations.0008_convert_event_descriptions')
+
+        self.assertEqual(migration.parse('SUBSCRIPTION', 'fan подписался на вашу подписку Gold на 30 дней.'),
+                         (Event.NEW_SUBSCRIBER, {'name': 'fan', 'title': 'Gold'}))
+        self.assertEqual(migration.parse('Purchase', 'Заказано 50 монет'), (Event.PURCHASE, {'amount': 50}))
+        self.assertEqual(migration.parse('Other', 'Something'), (Event.LEGACY, {'text': 'Something', 'type': 'Other'}))
+
+
+class EventBatchTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with a tier and a client with points.
+        """
+        self.client = Client()
+        self.client_user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com')
+        Wallet.objects.create(user=self.client_user, balance=1000)
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True)
+        Wallet.objects.create(user=self.creator_user, balance=0)
+        self.tier = Tier.objects.create(
+            name='Basic', points_price=100, description='Basic tier', user=self.creator_user)
+
+    def event_inserts(self, queries):
+        return [query for query in queries if query['sql'].startswith(f'INSERT INTO "{Event._meta.db_table}"')]
+
+    def test_subscribe_writes_events_in_one_insert(self):
+        """
+        Both events of a subscription are written with a single insert once it commits.
+        """
+        self.client.login(username='testclient', password='testpassword')
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('client:subscribe-to-tier', args=['testcreator', self.tier.id]))
+
+        self.assertEqual(len(self.event_inserts(queries)), 1)
+        self.assertEqual(Event.objects.filter(event_type__in=[Event.SUBSCRIBED, Event.NEW_SUBSCRIBER]).count(), 2)
+
+    def test_events_around_inner_block_share_one_insert(self):
+        """
+        Events recorded before, inside and after inner atomic blocks go into the same insert.
+        """
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                record_event(self.client_user, Event.PROFILE_UPDATE)
+                for _ in range(2):
+                    with transaction.atomic():
+                        record_event(self.client_user, Event.PURCHASE, amount=100)
+                        with transaction.atomic():
+                            Wallet.objects.filter(user=self.client_user).update(balance=900)
+                record_event(self.client_user, Event.PASSWORD_CHANGE)
+
+        self.assertEqual(len(self.event_inserts(queries)), 1)
+        self.assertEqual(Event.objects.count(), 4)
+
+    def test_rolled_back_events_are_dropped(self):
+        """
+        Events recorded in a savepoint that rolls back are never written.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                record_event(self.client_user, Event.PROFILE_UPDATE)
+                try:
+                    with transaction.atomic():
+                        record_event(self.client_user, Event.PASSWORD_CHANGE)
+                        raise ValueError
+                except ValueError:
+                    pass
+                record_event(self.client_user, Event.REGISTRATION)
+
+        self.assertEqual(set(Event.objects.values_list('event_type', flat=True)),
+                         {Event.PROFILE_UPDATE, Event.REGISTRATION})
+
+    def test_connection_internals(self):
+        """
+        The connection internals read by `_registered_batches` keep the shape it expects.
+        """
+        with transaction.atomic():
+            record_event(self.client_user, Event.PROFILE_UPDATE)
+            with transaction.atomic():
+                for entry in connection.run_on_commit:
+                    self.assertIsInstance(entry, tuple)
+                    self.assertEqual(len(entry), 3)
+                    self.assertIsInstance(entry[0], set)
+                    self.assertTrue(callable(entry[1]))
+                    self.assertIsInstance(entry[2], bool)
+                savepoint_ids, batches = _registered_batches(connection)
+                self.assertEqual(len(savepoint_ids), len(connection.savepoint_ids))
+                self.assertEqual(len(batches), 1)
+                self.assertEqual(len(batches[0].events), 1)
+
+
+class BackgroundEventWriterTests(TransactionTestCase):
+
+    @override_settings(EVENT_BACKGROUND_WRITES=True)
+    def test_background_writes(self):
+        """
+        In background mode committed events are written by the writer thread.
+        """
+        user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com')
+        with transaction.atomic():
+            record_event(user, Event.PURCHASE, amount=100)
+        background_writer.join()
+
+        self.assertTrue(Event.objects.filter(event_type=Event.PURCHASE, payload__amount=100).exists())
@@ -1,6 +1,9 @@
 import stripe
 from creator.models import Post
+from creator.feed import feed_posts, prepare_feed
+from creator.pagination import KeysetPaginator
 from client.models import Subscription
+from interactions.helpers import has_messaging_permission
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
@@ -9,12 +12,14 @@ from django.contrib.auth.forms import AuthenticationForm
 from django.core.paginator import Paginator
 from django.db.models import Case, When, Value, BooleanField, Q, Count
 from django.shortcuts import get_object_or_404, render, redirect
-from interactions.models import Like
 from django.contrib.auth import update_session_auth_hash
 
 from .forms import CustomUserCreationForm, UserProfileForm, UserPasswordChangeForm, CustomUserUpdateForm
-from .helpers import get_active_subscribers_count, get_total_likes, get_total_likes_given, get_total_subscriptions
-from .models import UserProfile, CustomUser as User, Event
+from .helpers import (get_active_subscribers_count, get_stripe_account_status, get_total_likes,
+                      get_total_likes_given, get_total_subscriptions, invalidate_stripe_account_status)
+from .events import describe_events, record_event
+from .models import UserProfile, CustomUser as User, Event, EventArchive
+from .partitions import read_archive
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
@@ -55,11 +60,7 @@ def register(request):
             messages.success(
                 request, 'Ваш аккаунт успешно создан! Теперь можете войти в него.')
 
-            Event.objects.create(
-                user=user,
-                event_type='Registration',
-                description='Новый аккаунт зарегестрирован'
-            )
+            record_event(user, Event.REGISTRATION)
 
             return redirect('login')
     context = {'form': form}
@@ -130,8 +131,7 @@ def profile(request, username):
         user=request.user, status='ACTIVE', tier__user=user_viewed).first()
 
     if is_own_profile:
-        posts_list = Post.objects.filter(
-            user=user_viewed).order_by('-posted_at')
+        posts_list = Post.objects.filter(user=user_viewed)
         posts_list = posts_list.annotate(
             visible=Value(True, output_field=BooleanField()))
     else:
@@ -149,28 +149,19 @@ def profile(request, username):
                 default=Value(False),
                 output_field=BooleanField(),
             )
-        ).order_by('-posted_at')
+        )
 
-    paginator = Paginator(posts_list, 10)  # 10 posts per page
-    page_number = request.GET.get('page')
-    posts = paginator.get_page(page_number)
+    paginator = KeysetPaginator(feed_posts(posts_list), 10)  # 10 posts per page
+    posts = paginator.get_page(request.GET.get('cursor'))
+    posts.object_list = prepare_feed(posts.object_list, request.user)
 
-    recipient_subscription = Subscription.objects.filter(
-        user=user_viewed, status='ACTIVE').first()
-    can_message = (
-        (user_subscription and user_subscription.tier.message_permission) or
-        (recipient_subscription and recipient_subscription.tier.message_permission) or
-        is_own_profile
-    )
+    can_message = is_own_profile or has_messaging_permission(request.user, user_viewed)
 
     active_subscribers_count = get_active_subscribers_count(user_viewed)
     total_likes = get_total_likes(user_viewed)
     total_likes_given = get_total_likes_given(user_viewed)
     total_subscriptions = get_total_subscriptions(user_viewed)
 
-    liked_posts = Like.objects.filter(
-        user=request.user, post__in=posts_list).values_list('post_id', flat=True)
-
     return render(request, 'account/profile.html', {
         'user': request.user,
         'user_viewed': user_viewed,
@@ -183,7 +174,6 @@ def profile(request, username):
         'total_likes_given': total_likes_given,
         'total_subscriptions': total_subscriptions,
         'show_visibility': True,
-        'liked_posts': liked_posts,
     })
 
 
@@ -232,8 +222,9 @@ def create_stripe_account(request):
             messages.error(request, f"Stripe ошибка: {e}")
     else:
         try:
-            account = stripe.Account.retrieve(user.stripe_account_id)
-            if account.requirements.currently_due:
+            if get_stripe_account_status(user).requirements_due:
+                # The status changes during onboarding, so fetch it again afterwards
+                invalidate_stripe_account_status(user)
                 account_link = stripe.AccountLink.create(
                     account=user.stripe_account_id,
                     refresh_url=request.build_absolute_uri(
@@ -281,11 +272,7 @@ def update_profile(request):
             profile_form.save()
             messages.success(request, 'Ваш профиль был успешно улучшен!')
 
-            Event.objects.create(
-                user=request.user,
-                event_type='Profile Update',
-                description='Улучшение профиля'
-            )
+            record_event(request.user, Event.PROFILE_UPDATE)
 
             return redirect('update-profile')
         else:
@@ -329,11 +316,7 @@ def change_password(request):
             messages.success(
                 request, 'Ваш пароль был успешно обновлен!')
 
-            Event.objects.create(
-                user=request.user,
-                event_type='Profile Update',
-                description='Пароль изменен'
-            )
+            record_event(request.user, Event.PASSWORD_CHANGE)
 
             return redirect('update-profile')
         else:
@@ -350,6 +333,10 @@ def event_history(request):
     """
     View for displaying the user's event history.
 
+    Recent events are read from the database. Months moved out by `archive_events` are
+    chosen with the `month` parameter (YYYY-MM) and read from their Parquet file; only months
+    that hold events of the user are offered. Descriptions are rendered for the current page only.
+
     Args:
         request (HttpRequest): The request object.
 
@@ -357,10 +344,21 @@ def event_history(request):
         HttpResponse: The rendered event history page.
     """
     user = request.user
-    events_list = Event.objects.filter(user=user).order_by('-timestamp')
+    archives = list(user.event_archives.all())
+    archive = next((archive for archive in archives
+                    if f'{archive.month:%Y-%m}' == request.GET.get('month')), None)
+    if archive is not None:
+        events_list = read_archive(archive, user)
+    else:
+        events_list = Event.objects.filter(user=user).order_by('-timestamp')
 
     paginator = Paginator(events_list, 20)
     page_number = request.GET.get('page')
     events = paginator.get_page(page_number)
+    events.object_list = describe_events(events.object_list)
 
-    return render(request, 'account/event_history.html', {'events': events})
+    return render(request, 'account/event_history.html', {
+        'events': events,
+        'archives': archives,
+        'archive': archive,
+    })
@@ -0,0 +1,147 @@
+from django.db.models import Exists, Max, OuterRef, Q
+from creator.models import Post
+from .models import Subscription, TimelineEntry
+
+TIMELINE_BATCH_SIZE = 1000
+
+
+def get_visible_posts(subscription):
+    """
+    Get the posts of a creator that a subscription gives access to.
+
+    Args:
+        subscription (Subscription): The subscription granting access.
+
+    Returns:
+        QuerySet: Free posts of the tier's creator and the posts published under the subscribed tier.
+    """
+    return Post.objects.filter(
+        Q(is_free=True) | Q(tier_id=subscription.tier_id),
+        user_id=subscription.tier.user_id,
+    )
+
+
+def _write_entries(entries):
+    """
+    Insert timeline entries in batches, skipping the ones that are already materialized.
+
+    Args:
+        entries (iterable): TimelineEntry instances to insert. Consumed lazily.
+    """
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fill_timeline(subscription):
+    """
+    Materialize every post visible through a subscription into the subscriber's timeline.
+
+    Safe to call repeatedly: posts already present in the timeline are skipped.
+
+    Args:
+        subscription (Subscription): The active subscription whose posts should be added.
+    """
+    creator_id = subscription.tier.user_id
+    posts = get_visible_posts(subscription).values_list('id', 'posted_at')
+    _write_entries(
+        TimelineEntry(user_id=subscription.user_id, post_id=post_id,
+                      creator_id=creator_id, posted_at=posted_at)
+        for post_id, posted_at in posts.iterator(chunk_size=TIMELINE_BATCH_SIZE)
+    )
+
+
+def refresh_timeline(user, creator):
+    """
+    Rebuild the part of a client's timeline that comes from one creator.
+
+    Used when a subscription ends: the creator's posts are removed and then re-added
+    for any subscription to that creator that is still active.
+
+    Args:
+        user (CustomUser): The client whose timeline is refreshed.
+        creator (CustomUser): The creator whose posts are refreshed.
+    """
+    refresh_timelines([(user.id, creator.id)])
+
+
+def refresh_timelines(pairs):
+    """
+    Rebuild the timelines of many (client, creator) pairs at once.
+
+    Args:
+        pairs (iterable): Tuples of (client id, creator id).
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+
+    condition = Q()
+    for user_id, creator_id in pairs:
+        condition |= Q(user_id=user_id, creator_id=creator_id)
+    TimelineEntry.objects.filter(condition).delete()
+
+    condition = Q()
+    for user_id, creator_id in pairs:
+        condition |= Q(user_id=user_id, tier__user_id=creator_id)
+    active_subscriptions = Subscription.objects.filter(
+        condition, status='ACTIVE').select_related('tier')
+    for subscription in active_subscriptions:
+        fill_timeline(subscription)
+
+
+def fan_out_post(post):
+    """
+    Add a newly published post to the timelines of every client that can see it.
+
+    Free posts go to all active subscribers of the author, paid posts only to the
+    active subscribers of the post's tier.
+
+    Args:
+        post (Post): The published post.
+    """
+    subscribers = Subscription.objects.filter(
+        tier__user_id=post.user_id, status='ACTIVE')
+    if not post.is_free:
+        subscribers = subscribers.filter(tier_id=post.tier_id)
+
+    user_ids = subscribers.values_list('user_id', flat=True).distinct()
+    _write_entries(
+        TimelineEntry(user_id=user_id, post_id=post.id,
+                      creator_id=post.user_id, posted_at=post.posted_at)
+        for user_id in user_ids.iterator(chunk_size=TIMELINE_BATCH_SIZE)
+    )
+
+
+def prune_timelines(chunk_size=TIMELINE_BATCH_SIZE):
+    """
+    Delete timeline entries that no active subscription gives access to anymore.
+
+    Entries go stale when a post changes tier or loses it, or when a subscription ended outside
+    of the regular flows. The table is scanned in primary key ranges to keep each delete short.
+
+    Args:
+        chunk_size (int): Number of primary keys covered by each delete.
+
+    Returns:
+        int: The number of deleted entries.
+    """
+    active = Subscription.objects.filter(user=OuterRef('user'), status='ACTIVE')
+    stale = TimelineEntry.objects.alias(
+        has_creator_subscription=Exists(active.filter(tier__user=OuterRef('creator'))),
+        has_tier_subscription=Exists(active.filter(tier=OuterRef('post__tier'))),
+    ).exclude(
+        Q(post__is_free=True, has_creator_subscription=True) | Q(has_tier_subscription=True)
+    )
+
+    deleted = 0
+    last_id = TimelineEntry.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    for start in range(0, last_id + 1, chunk_size):
+        count, _ = stale.filter(id__gte=start, id__lt=start + chunk_size).delete()
+        deleted += count
+    return deleted
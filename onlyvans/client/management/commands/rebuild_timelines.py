@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from client.helpers import TIMELINE_BATCH_SIZE, fill_timeline, prune_timelines
+from client.models import Subscription
+
+
+class Command(BaseCommand):
+    """
+    Custom management command to backfill and prune the materialized client timelines.
+
+    Every active subscription is replayed into its subscriber's timeline, then entries that
+    are no longer backed by an active subscription are removed. Run it once after deploying
+    the timeline table and periodically afterwards to repair drift.
+    """
+    help = 'Заполните и очистите ленты подписчиков.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=TIMELINE_BATCH_SIZE,
+                            help='Number of rows processed per batch.')
+        parser.add_argument('--skip-backfill', action='store_true',
+                            help='Only prune stale entries.')
+        parser.add_argument('--skip-prune', action='store_true',
+                            help='Only backfill missing entries.')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command. Backfills and prunes the timelines and writes
+        a summary to stdout.
+        """
+        chunk_size = options['chunk_size']
+
+        if not options['skip_backfill']:
+            subscriptions = Subscription.objects.filter(
+                status='ACTIVE').select_related('tier')
+            filled = 0
+            for subscription in subscriptions.iterator(chunk_size=chunk_size):
+                fill_timeline(subscription)
+                filled += 1
+            self.stdout.write(f'Заполнено подписок: {filled}')
+
+        if not options['skip_prune']:
+            deleted = prune_timelines(chunk_size=chunk_size)
+            self.stdout.write(f'Удалено устаревших записей: {deleted}')
+
+        self.stdout.write(self.style.SUCCESS('Ленты успешно обновлены'))
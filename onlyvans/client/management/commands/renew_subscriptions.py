@@ -1,21 +1,100 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
 from django.core.management.base import BaseCommand
-from client.tasks import renew_subscriptions
+from django.db import connections
+from django.utils import timezone
+from client.models import RenewalPartition, RenewalRun
+from client.tasks import RENEWAL_CHUNK_SIZE, renew_partition
+from client.workers import init_worker, run_partition
 
 
 class Command(BaseCommand):
     """
     Custom management command to renew subscriptions that are due for renewal.
 
-    This command can be run using Django's management command system. It calls
-    the `renew_subscriptions` function to renew any subscriptions that are
-    due for renewal and outputs a success message upon completion.
+    This command can be run using Django's management command system. Due subscriptions
+    are split into disjoint partitions by client id, and with `--workers N` the partitions
+    are renewed in parallel by a pool of processes, each with its own database connection.
+
+    Every run is recorded under an idempotency key, which is printed when the run starts.
+    Running the command again with the key of a crashed run resumes it: the due cutoff of
+    the first attempt is reused and partitions that already finished are skipped. Without
+    `--run-key` the latest unfinished run is resumed, and a new run starts only when there
+    is none.
     """
     help = 'Возобновите подписки, которые можно.'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=RENEWAL_CHUNK_SIZE,
+                            help='Number of subscriptions processed per transaction.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes, and partitions of a new run.')
+        parser.add_argument('--run-key',
+                            help='Idempotency key of the run. Reuse the key of a crashed run to resume it. '
+                                 'Defaults to the latest unfinished run, or a new key if there is none.')
+
+    def handle(self, *args, **options):
         """
-        The entry point for the command. Calls the `renew_subscriptions` function
-        and writes a success message to stdout.
+        The entry point for the command. Renews every unfinished partition of the run and
+        writes per-partition throughput and the total wall time to stdout.
         """
-        renew_subscriptions()
+        workers = max(options['workers'], 1)
+        now = timezone.now()
+        run = None
+        if not options['run_key']:
+            run = RenewalRun.objects.filter(finished_at__isnull=True).order_by('-started_at', '-pk').first()
+        if run is None:
+            run, created = RenewalRun.objects.get_or_create(
+                key=options['run_key'] or now.strftime('renewal-%Y%m%d%H%M%S%f'),
+                defaults={'cutoff': now, 'partitions': workers},
+            )
+        else:
+            created = False
+        if created:
+            self.stdout.write(f'Запуск {run.key}')
+        else:
+            self.stdout.write(f'Возобновление запуска {run.key}')
+
+        finished = set(run.finished_partitions.values_list('index', flat=True))
+        pending = [index for index in range(run.partitions) if index not in finished]
+
+        started = time.monotonic()
+        if workers == 1 or len(pending) <= 1:
+            for index in pending:
+                self.report(renew_partition(run.pk, index, options['chunk_size']))
+        else:
+            # Forked workers must not share the parent's database sockets
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(pending)),
+                mp_context=multiprocessing.get_context(),
+                initializer=init_worker,
+            ) as pool:
+                futures = [pool.submit(run_partition, run.pk, index, options['chunk_size'])
+                           for index in pending]
+                for future in futures:
+                    self.report(RenewalPartition.objects.get(pk=future.result()))
+
+        run.finished_at = timezone.now()
+        run.save(update_fields=['finished_at'])
+
+        totals = run.finished_partitions.all()
+        renewed = sum(partition.renewed for partition in totals)
+        expired = sum(partition.expired for partition in totals)
+        self.stdout.write(f'Продлено: {renewed}, истекло: {expired}')
+        self.stdout.write(f'Общее время: {time.monotonic() - started:.2f} с')
         self.stdout.write(self.style.SUCCESS('Успешно продленные подписки'))
+
+    def report(self, partition):
+        """
+        Write the counts and throughput of a finished partition to stdout.
+
+        Args:
+            partition (RenewalPartition): The finished partition.
+        """
+        processed = partition.renewed + partition.expired
+        rate = processed / partition.elapsed if partition.elapsed else 0
+        self.stdout.write(
+            f'Раздел {partition.index}: продлено {partition.renewed}, истекло {partition.expired}, '
+            f'{partition.elapsed:.2f} с ({rate:.0f} подписок/с)')
@@ -0,0 +1,53 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from client.scheduler import SCHEDULER_HORIZON, SCHEDULER_MAX_SLEEP, RenewalScheduler
+from client.tasks import RENEWAL_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Custom management command that renews subscriptions continuously as they fall due.
+
+    Unlike `renew_subscriptions`, which scans every due subscription when it is run, this
+    command keeps running. It holds the upcoming end dates in memory, sleeps until the next
+    one, and wakes up early when a subscription is created, extended or cancelled. Errors of
+    one cycle, such as a lost database connection, are logged and the loop goes on.
+    """
+    help = 'Продлевайте подписки непрерывно по мере наступления срока.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=RENEWAL_CHUNK_SIZE,
+                            help='Number of subscriptions processed per transaction.')
+        parser.add_argument('--horizon', type=int, default=int(SCHEDULER_HORIZON.total_seconds()),
+                            help='How far ahead, in seconds, upcoming end dates are loaded.')
+        parser.add_argument('--max-sleep', type=float, default=SCHEDULER_MAX_SLEEP,
+                            help='Maximum number of seconds between checks.')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command. Runs the scheduler loop until interrupted.
+        """
+        scheduler = RenewalScheduler(
+            horizon=timezone.timedelta(seconds=options['horizon']),
+            chunk_size=options['chunk_size'],
+            max_sleep=options['max_sleep'],
+        )
+        scheduler.listen()
+        self.stdout.write(self.style.SUCCESS('Планировщик продлений запущен'))
+        try:
+            while True:
+                try:
+                    renewed, expired = scheduler.run_once()
+                    if renewed or expired:
+                        self.stdout.write(f'Продлено: {renewed}, истекло: {expired}')
+                    scheduler.wait(scheduler.seconds_until_next(timezone.now()))
+                except Exception:
+                    logger.exception('Renewal scheduler cycle failed')
+                    scheduler.reset()
+                    time.sleep(scheduler.retry_delay.total_seconds())
+        except KeyboardInterrupt:
+            self.stdout.write('Планировщик продлений остановлен')
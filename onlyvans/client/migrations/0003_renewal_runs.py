@@ -0,0 +1,41 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client', '0002_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenewalRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('cutoff', models.DateTimeField()),
+                ('partitions', models.PositiveIntegerField(default=1)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RenewalPartition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('renewed', models.PositiveIntegerField(default=0)),
+                ('expired', models.PositiveIntegerField(default=0)),
+                ('elapsed', models.FloatField(default=0)),
+                ('finished_at', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='finished_partitions', to='client.renewalrun')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='renewalpartition',
+            constraint=models.UniqueConstraint(fields=('run', 'index'), name='unique_renewal_partition'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client', '0003_renewal_runs'),
+        ('creator', '0004_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'status'], name='subscription_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('status', 'ACTIVE')), fields=['tier', 'user'], name='subscription_tier_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('status', 'ACTIVE')), fields=['end_date'], name='subscription_active_end_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='ended_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 from account.models import CustomUser
-from creator.models import Tier
+from creator.models import Tier, Post
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
@@ -26,12 +26,21 @@ class Subscription(models.Model):
         max_length=10, choices=STATUS_CHOICES, default='ACTIVE')
     start_date = models.DateTimeField(auto_now_add=True)
     end_date = models.DateTimeField()
+    ended_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['user', 'tier'], condition=models.Q(
                 status='ACTIVE'), name='unique_active_subscription_to_tier')
         ]
+        indexes = [
+            models.Index(fields=['user', 'status'],
+                         name='subscription_user_status_idx'),
+            models.Index(fields=['tier', 'user'], condition=models.Q(status='ACTIVE'),
+                         name='subscription_tier_active_idx'),
+            models.Index(fields=['end_date'], condition=models.Q(status='ACTIVE'),
+                         name='subscription_active_end_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} - {self.tier.name} subscription'
@@ -70,3 +79,93 @@ class Subscription(models.Model):
             if other_active_subscriptions.exists():
                 raise ValidationError(
                     "У вас уже есть подписка на этого автора.")
+
+
+class TimelineEntry(models.Model):
+    """
+    Model representing a post materialized into a client's dashboard timeline.
+
+    Entries are written when a creator publishes a post and when a subscription starts, is extended
+    or ends, so the dashboard reads a page of its feed with one index range scan instead of
+    resolving subscriptions on every request.
+
+    Fields:
+        - user (ForeignKey): The client whose timeline contains the post.
+        - post (ForeignKey): The post shown in the timeline.
+        - creator (ForeignKey): The author of the post. Used to drop a creator's posts when a subscription ends.
+        - posted_at (DateTimeField): Copy of the post's publication time, used for ordering.
+    """
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    creator = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name='+')
+    posted_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-posted_at', '-post'],
+                         name='timeline_user_recent_idx'),
+            models.Index(fields=['user', 'creator'],
+                         name='timeline_user_creator_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} - {self.post.title}'
+
+
+class RenewalRun(models.Model):
+    """
+    Model representing one run of the subscription renewal command.
+
+    The key is the run's idempotency key. The due cutoff is frozen when the run starts, so
+    resuming a crashed run with the same key renews exactly the subscriptions the first
+    attempt was responsible for, and partitions that already finished are skipped.
+
+    Fields:
+        - key (CharField): Unique idempotency key of the run.
+        - cutoff (DateTimeField): Subscriptions ending at or before this time are due in this run.
+        - partitions (PositiveIntegerField): Number of disjoint partitions the due subscriptions are split into.
+        - started_at (DateTimeField): When the run was first started.
+        - finished_at (DateTimeField): When every partition finished. Null while the run is incomplete.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    cutoff = models.DateTimeField()
+    partitions = models.PositiveIntegerField(default=1)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.key
+
+
+class RenewalPartition(models.Model):
+    """
+    Model representing a finished partition of a renewal run.
+
+    Fields:
+        - run (ForeignKey): The run the partition belongs to.
+        - index (PositiveIntegerField): The partition number, from 0 to `run.partitions - 1`.
+        - renewed (PositiveIntegerField): Number of renewed subscriptions.
+        - expired (PositiveIntegerField): Number of expired subscriptions.
+        - elapsed (FloatField): Time spent on the partition, in seconds.
+        - finished_at (DateTimeField): When the partition finished.
+    """
+    run = models.ForeignKey(
+        RenewalRun, on_delete=models.CASCADE, related_name='finished_partitions')
+    index = models.PositiveIntegerField()
+    renewed = models.PositiveIntegerField(default=0)
+    expired = models.PositiveIntegerField(default=0)
+    elapsed = models.FloatField(default=0)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['run', 'index'], name='unique_renewal_partition')
+        ]
@@ -0,0 +1,213 @@
+import heapq
+import select
+import time
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Subscription
+from .tasks import RENEWAL_CHUNK_SIZE, renew_subscriptions
+
+RENEWAL_CHANNEL = 'subscription_renewals'
+SCHEDULER_HORIZON = timezone.timedelta(minutes=15)
+SCHEDULER_MAX_SLEEP = 60
+SCHEDULER_RETRY_DELAY = timezone.timedelta(seconds=30)
+
+
+def notify_schedule_change(subscription):
+    """
+    Tell a running renewal scheduler that a subscription's end date or status changed.
+
+    On PostgreSQL this sends a `NOTIFY` on `RENEWAL_CHANNEL` once the surrounding transaction
+    commits. Other databases have no notification channel; there the scheduler only sees
+    end dates that move past its loaded window.
+
+    Args:
+        subscription (Subscription): The subscription that was created, extended or cancelled.
+    """
+    if connection.vendor != 'postgresql':
+        return
+
+    def send():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [RENEWAL_CHANNEL, str(subscription.pk)])
+
+    transaction.on_commit(send)
+
+
+class RenewalScheduler:
+    """
+    Keeps the end dates of upcoming renewals in a min-heap and renews subscriptions as they fall due.
+
+    The heap holds `(end_date, subscription_id)` pairs for active subscriptions ending before
+    `loaded_until`. The window is extended with a range query on `(status, end_date)` that only
+    reads rows past the previous window, so the table is never scanned in full after start-up.
+    Entries are never removed when a subscription is extended or cancelled: renewal re-checks
+    status and end date, so stale entries cost one cheap lookup and are dropped.
+
+    The heap only decides when to wake up. Each run renews every ACTIVE subscription past its
+    end date, so rows the previous run did not handle, because another runner held their lock
+    or their chunk failed, are not lost; while such rows remain, another run is scheduled
+    `retry_delay` later.
+
+    Attributes:
+    - horizon: How far ahead of now the window of upcoming renewals is loaded.
+    - chunk_size: The number of subscriptions renewed per transaction.
+    - max_sleep: Upper bound in seconds on how long the scheduler waits between checks.
+    - retry_delay: How long to wait before retrying overdue subscriptions a run left behind.
+    """
+
+    def __init__(self, horizon=SCHEDULER_HORIZON, chunk_size=RENEWAL_CHUNK_SIZE, max_sleep=SCHEDULER_MAX_SLEEP,
+                 retry_delay=SCHEDULER_RETRY_DELAY):
+        self.horizon = horizon
+        self.chunk_size = chunk_size
+        self.max_sleep = max_sleep
+        self.retry_delay = retry_delay
+        self.heap = []
+        self.loaded_until = None
+        self.retry_at = None
+        self.listening = None
+
+    def push(self, end_date, subscription_id):
+        heapq.heappush(self.heap, (end_date, subscription_id))
+
+    def load(self, now):
+        """
+        Extend the window of loaded end dates up to `now + horizon`.
+
+        Args:
+            now (datetime): The current time.
+
+        Returns:
+            int: The number of subscriptions added to the heap.
+        """
+        until = now + self.horizon
+        upcoming = Subscription.objects.filter(status='ACTIVE', end_date__lte=until)
+        if self.loaded_until is not None:
+            upcoming = upcoming.filter(end_date__gt=self.loaded_until)
+
+        loaded = 0
+        for end_date, subscription_id in upcoming.order_by('end_date').values_list('end_date', 'id').iterator():
+            self.push(end_date, subscription_id)
+            loaded += 1
+        self.loaded_until = until
+        return loaded
+
+    def reschedule(self, subscription_ids):
+        """
+        Re-read changed subscriptions and push the ones that end inside the loaded window.
+
+        Subscriptions ending later are picked up by `load` when the window reaches them.
+
+        Args:
+            subscription_ids (iterable): IDs of subscriptions that were created or changed.
+        """
+        if self.loaded_until is None:
+            return
+        changed = Subscription.objects.filter(
+            pk__in=list(subscription_ids), status='ACTIVE', end_date__lte=self.loaded_until)
+        for end_date, subscription_id in changed.values_list('end_date', 'id'):
+            self.push(end_date, subscription_id)
+
+    def pop_due(self, now):
+        """
+        Remove and return the IDs of every subscription due at `now`.
+
+        Args:
+            now (datetime): The current time.
+
+        Returns:
+            list: IDs of due subscriptions, without duplicates.
+        """
+        due = set()
+        while self.heap and self.heap[0][0] <= now:
+            due.add(heapq.heappop(self.heap)[1])
+        return sorted(due)
+
+    def seconds_until_next(self, now):
+        """
+        Get how long the scheduler can sleep before the next renewal or window refresh.
+
+        Args:
+            now (datetime): The current time.
+
+        Returns:
+            float: Seconds to wait, between 0 and `max_sleep`.
+        """
+        wake_at = self.loaded_until - self.horizon / 2
+        if self.heap:
+            wake_at = min(wake_at, self.heap[0][0])
+        if self.retry_at is not None:
+            wake_at = min(wake_at, self.retry_at)
+        return min(max((wake_at - now).total_seconds(), 0), self.max_sleep)
+
+    def run_once(self, now=None):
+        """
+        Refresh the window and renew every subscription that is due.
+
+        A run starts when the heap has a due entry or a retry is scheduled, and renews every
+        overdue ACTIVE subscription through the `(status, end_date)` index, not only the
+        popped ones.
+
+        Args:
+            now (datetime, optional): The current time. Defaults to `timezone.now()`.
+
+        Returns:
+            tuple: (renewed, expired) counts.
+        """
+        now = now or timezone.now()
+        if self.loaded_until is None or now + self.horizon / 2 >= self.loaded_until:
+            self.load(now)
+
+        due = self.pop_due(now)
+        if not due and (self.retry_at is None or now < self.retry_at):
+            return 0, 0
+        self.retry_at = None
+        try:
+            counts = renew_subscriptions(self.chunk_size, now=now)
+        except Exception:
+            self.retry_at = now + self.retry_delay
+            raise
+        if Subscription.objects.filter(status='ACTIVE', end_date__lte=now).exists():
+            self.retry_at = now + self.retry_delay
+        return counts
+
+    def wait(self, timeout):
+        """
+        Sleep until the next renewal is due or a subscription change is announced.
+
+        On PostgreSQL the scheduler listens on `RENEWAL_CHANNEL` and wakes up as soon as
+        `notify_schedule_change` fires. If the connection was closed, e.g. after an error, it
+        is reopened and `LISTEN` is sent again. Elsewhere it simply sleeps.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait.
+        """
+        if connection.vendor != 'postgresql':
+            time.sleep(timeout)
+            return
+
+        if connection.connection is None or connection.connection is not self.listening:
+            self.listen()
+        raw = connection.connection
+        if not raw.notifies and select.select([raw], [], [], timeout) == ([], [], []):
+            return
+        raw.poll()
+        changed = {int(notify.payload) for notify in raw.notifies}
+        raw.notifies.clear()
+        self.reschedule(changed)
+
+    def listen(self):
+        """
+        Subscribe the scheduler's connection to `RENEWAL_CHANNEL` on PostgreSQL.
+        """
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {RENEWAL_CHANNEL}')
+        self.listening = connection.connection
+
+    def reset(self):
+        """
+        Drop the connection after an error, so the next cycle reconnects and listens again.
+        """
+        connection.close()
+        self.listening = None
@@ -1,68 +1,187 @@
+import time
+from django.db import transaction
+from django.db.models.functions import Mod
 from django.utils import timezone
-from .models import Subscription
+from .models import RenewalPartition, RenewalRun, Subscription
 from account.models import Event
+from creator.earnings import record_earnings, subscription_earnings
+from finances.ledger import consolidate_shards, post_entries
+from finances.models import Wallet
+from interactions.models import refresh_messaging_permissions
+from .helpers import refresh_timelines
 
+RENEWAL_PERIOD = timezone.timedelta(days=30)
+RENEWAL_CHUNK_SIZE = 500
 
-def renew_subscriptions():
+
+def _renew_chunk(subscriptions, now):
     """
-    Function to renew subscriptions that are due for renewal.
-    This function checks all active subscriptions that have reached their end date and attempts to renew them
-    if the user has enough points in their wallet. If the user does not have enough points, the subscription is marked as expired.
+    Renew or expire one chunk of due subscriptions. Must run inside a transaction.
+
+    The wallets of every client in the chunk are locked in primary key order and read once.
+    Creator wallets are only credited, so they are not locked and striped ones take the
+    credits on their shards. Each subscription is renewed for another period if its client still has
+    enough points, taking earlier renewals in the same chunk into account, and expired
+    otherwise. Every renewal is posted as a ledger entry; entries, balances, subscriptions,
+    events and earnings rollups are then written with one statement each. Timelines and
+    messaging permissions of expired subscriptions are refreshed in batches.
+
+    Args:
+        subscriptions (list): Due subscriptions, locked by the caller, with tiers and users selected.
+        now (datetime): The time of the run.
+
+    Returns:
+        tuple: (renewed, expired) counts.
     """
-    now = timezone.now()  # Get the current time with timezone support
+    client_ids = {subscription.user_id for subscription in subscriptions}
+    creator_ids = {subscription.tier.user_id for subscription in subscriptions}
 
-    # Get all active subscriptions that have reached their end date
-    subscriptions = Subscription.objects.filter(
-        status='ACTIVE', end_date__lte=now)
+    Wallet.objects.bulk_create(
+        [Wallet(user_id=user_id) for user_id in creator_ids], ignore_conflicts=True)
+    wallets = {
+        wallet.user_id: wallet
+        for wallet in Wallet.objects.select_for_update().filter(
+            user_id__in=client_ids).order_by('pk')
+    }
+    striped = [wallet.pk for wallet in wallets.values() if wallet.shards]
+    if striped:
+        consolidate_shards(striped)
+        wallets.update({wallet.user_id: wallet for wallet in Wallet.objects.filter(pk__in=striped)})
+    wallets.update({
+        wallet.user_id: wallet
+        for wallet in Wallet.objects.filter(user_id__in=creator_ids - client_ids)
+    })
+    balances = {user_id: wallet.balance for user_id, wallet in wallets.items()}
 
+    entries, earnings, renewed, expired, events = [], [], [], [], []
     for subscription in subscriptions:
-        user = subscription.user
-        tier = subscription.tier
+        user, tier = subscription.user, subscription.tier
+        creator = tier.user
 
-        # Check if the user has enough points to renew the subscription
-        if user.wallet.balance >= tier.points_price:
-            # Deduct points from the user's wallet
-            user.wallet.balance -= tier.points_price
-            user.wallet.save()
+        if balances.get(user.id, 0) >= tier.points_price:
+            balances[user.id] -= tier.points_price
+            balances[creator.id] += tier.points_price
+            entries.append(('RENEWAL', f'{user.username} -> {creator.username}: {tier.name}', [
+                ('WALLET', wallets[user.id].pk, -tier.points_price),
+                ('WALLET', wallets[creator.id].pk, tier.points_price),
+            ], tier.pk))
+            earnings.extend(subscription_earnings(subscription, 'renewals', tier.points_price, now))
 
-            # Add points to the creator's wallet
-            creator = tier.user
-            creator.wallet.balance += tier.points_price
-            creator.wallet.save()
-
-            # Extend the subscription for another 30 days
             subscription.start_date = now
-            subscription.end_date = now + timezone.timedelta(days=30)
-            subscription.save()
+            subscription.end_date = now + RENEWAL_PERIOD
+            renewed.append(subscription)
 
-            # Create subscription event for the user
-            Event.objects.create(
+            events.append(Event(
                 user=user,
-                event_type='SUBSCRIPTION',
-                description=f'Подписался на {creator.username} подписку {tier.name} на 30 дней.'
-            )
-
-            # Create subscription event for the creator
-            Event.objects.create(
+                event_type=Event.RENEWED,
+                payload={'counterparty': creator.id, 'tier': tier.id, 'title': tier.name}
+            ))
+            events.append(Event(
                 user=creator,
-                event_type='SUBSCRIPTION',
-                description=f'{user.username} обновил подписку на вашу {tier.name} подписку на следующие 30 дней.'
-            )
+                event_type=Event.SUBSCRIBER_RENEWED,
+                payload={'counterparty': user.id, 'tier': tier.id, 'title': tier.name}
+            ))
         else:
-            # If the user does not have enough points, mark the subscription as expired
             subscription.status = 'EXPIRED'
-            subscription.save()
+            subscription.ended_at = now
+            expired.append(subscription)
+            earnings.extend(subscription_earnings(subscription, 'expirations', when=now))
 
-            # Create expired subscription event for the user
-            Event.objects.create(
+            events.append(Event(
                 user=user,
-                event_type='SUBSCRIPTION',
-                description=f'Subscription to {creator.username}\'s {tier.name} tier expired.'
-            )
-
-            # Create expired subscription event for the creator
-            Event.objects.create(
+                event_type=Event.EXPIRED,
+                payload={'counterparty': creator.id, 'tier': tier.id, 'title': tier.name}
+            ))
+            events.append(Event(
                 user=creator,
-                event_type='SUBSCRIPTION',
-                description=f'{user.username} подписка на вашу подписку {tier.name} истекла.'
-            )
+                event_type=Event.SUBSCRIBER_EXPIRED,
+                payload={'counterparty': user.id, 'tier': tier.id, 'title': tier.name}
+            ))
+
+    if entries:
+        post_entries(entries)
+    Subscription.objects.bulk_update(
+        renewed + expired, ['start_date', 'end_date', 'status', 'ended_at'])
+    Event.objects.bulk_create(events)
+    record_earnings(earnings)
+    expired_pairs = [(subscription.user_id, subscription.tier.user_id) for subscription in expired]
+    refresh_timelines(expired_pairs)
+    refresh_messaging_permissions(expired_pairs)
+    return len(renewed), len(expired)
+
+
+def renew_subscriptions(chunk_size=RENEWAL_CHUNK_SIZE, queryset=None, now=None):
+    """
+    Function to renew subscriptions that are due for renewal.
+    This function checks all active subscriptions that have reached their end date and attempts to renew them
+    if the user has enough points in their wallet. If the user does not have enough points, the subscription is marked as expired.
+
+    Due subscriptions are claimed in chunks with `SELECT ... FOR UPDATE SKIP LOCKED`, so several
+    runs can work side by side without renewing the same subscription twice. Each chunk is
+    processed in its own transaction.
+
+    Args:
+        chunk_size (int): The number of subscriptions processed per transaction.
+        queryset (QuerySet, optional): Restricts the run to a subset of subscriptions.
+        now (datetime, optional): The due cutoff. Defaults to the current time.
+
+    Returns:
+        tuple: (renewed, expired) counts for the whole run.
+    """
+    now = now or timezone.now()
+    queryset = Subscription.objects.all() if queryset is None else queryset
+    due = queryset.filter(status='ACTIVE', end_date__lte=now).select_related(
+        'user', 'tier__user').order_by('end_date', 'pk')
+
+    renewed = expired = 0
+    while True:
+        with transaction.atomic():
+            chunk = list(due.select_for_update(skip_locked=True, of=('self',))[:chunk_size])
+            if not chunk:
+                break
+            chunk_renewed, chunk_expired = _renew_chunk(chunk, now)
+        renewed += chunk_renewed
+        expired += chunk_expired
+    return renewed, expired
+
+
+def partition_queryset(index, partitions):
+    """
+    Get the subscriptions that belong to one partition of a renewal run.
+
+    Subscriptions are split by client id modulo the number of partitions, so all subscriptions
+    of a client, and therefore all debits of the client's wallet, land in the same partition.
+
+    Args:
+        index (int): The partition number.
+        partitions (int): The total number of partitions.
+
+    Returns:
+        QuerySet: The subscriptions of the partition.
+    """
+    if partitions == 1:
+        return Subscription.objects.all()
+    return Subscription.objects.alias(partition=Mod('user_id', partitions)).filter(partition=index)
+
+
+def renew_partition(run_id, index, chunk_size=RENEWAL_CHUNK_SIZE):
+    """
+    Renew the due subscriptions of one partition of a run and record that it finished.
+
+    Args:
+        run_id (int): The ID of the RenewalRun.
+        index (int): The partition number.
+        chunk_size (int): The number of subscriptions processed per transaction.
+
+    Returns:
+        RenewalPartition: The finished partition with its counts and elapsed time.
+    """
+    run = RenewalRun.objects.get(pk=run_id)
+    started = time.monotonic()
+    renewed, expired = renew_subscriptions(
+        chunk_size, partition_queryset(index, run.partitions), now=run.cutoff)
+    partition, _ = RenewalPartition.objects.update_or_create(
+        run=run, index=index,
+        defaults={'renewed': renewed, 'expired': expired, 'elapsed': time.monotonic() - started},
+    )
+    return partition
@@ -0,0 +1,325 @@
+from io import StringIO
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from unittest.mock import patch
+from account.models import Event
+from creator.models import Tier, Post
+from finances.models import Wallet
+from .models import RenewalPartition, RenewalRun, Subscription, TimelineEntry
+from .scheduler import RenewalScheduler
+from .tasks import renew_subscriptions
+
+
+class TimelineTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with two tiers and a few posts, and a client with points.
+        """
+        self.client = Client()
+
+        self.client_user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com', is_content_creator=False
+        )
+        Wallet.objects.create(user=self.client_user, balance=1000)
+
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        Wallet.objects.create(user=self.creator_user, balance=0)
+
+        self.basic_tier = Tier.objects.create(
+            name='Basic', points_price=100, description='Basic tier', user=self.creator_user)
+        self.premium_tier = Tier.objects.create(
+            name='Premium', points_price=300, description='Premium tier', user=self.creator_user)
+
+        self.free_post = Post.objects.create(
+            title='Free', text='Free post', is_free=True, user=self.creator_user)
+        self.basic_post = Post.objects.create(
+            title='Basic', text='Basic post', tier=self.basic_tier, user=self.creator_user)
+        self.premium_post = Post.objects.create(
+            title='Premium', text='Premium post', tier=self.premium_tier, user=self.creator_user)
+
+    def timeline_post_ids(self):
+        return set(TimelineEntry.objects.filter(user=self.client_user).values_list('post_id', flat=True))
+
+    def test_subscribe_fills_timeline(self):
+        """
+        Subscribing to a tier materializes the free posts and the posts of that tier.
+        """
+        self.client.login(username='testclient', password='testpassword')
+
+        self.client.get(reverse('client:subscribe-to-tier', args=['testcreator', self.basic_tier.id]))
+
+        self.assertEqual(self.timeline_post_ids(), {self.free_post.id, self.basic_post.id})
+
+        response = self.client.get(reverse('client:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post.id for post in response.context['posts']],
+                         [self.basic_post.id, self.free_post.id])
+
+    def test_new_post_fans_out_to_subscribers(self):
+        """
+        Publishing a post adds it only to the timelines of clients that can see it.
+        """
+        self.client.login(username='testclient', password='testpassword')
+        self.client.get(reverse('client:subscribe-to-tier', args=['testcreator', self.basic_tier.id]))
+
+        self.creator_user.stripe_account_id = 'acct_1234'
+        self.creator_user.save()
+        self.client.login(username='testcreator', password='testpassword')
+        self.client.post(reverse('creator:create-post'), data={
+            'title': 'Premium 2', 'text': 'Another premium post', 'tier': self.premium_tier.id})
+        self.client.post(reverse('creator:create-post'), data={
+            'title': 'Basic 2', 'text': 'Another basic post', 'tier': self.basic_tier.id})
+
+        basic_post = Post.objects.get(title='Basic 2')
+        self.assertEqual(self.timeline_post_ids(), {self.free_post.id, self.basic_post.id, basic_post.id})
+
+    def test_cancel_removes_creator_posts(self):
+        """
+        Cancelling a subscription removes the creator's posts from the timeline.
+        """
+        self.client.login(username='testclient', password='testpassword')
+        self.client.get(reverse('client:subscribe-to-tier', args=['testcreator', self.basic_tier.id]))
+        subscription = Subscription.objects.get(user=self.client_user)
+
+        self.client.get(reverse('client:cancel_subscription', args=[subscription.id]))
+
+        self.assertEqual(self.timeline_post_ids(), set())
+
+    def test_flows_do_not_overwrite_a_subscription_expired_meanwhile(self):
+        """
+        Extending or cancelling a subscription a worker expired after the view read it changes nothing.
+        """
+        self.client.login(username='testclient', password='testpassword')
+        self.client.get(reverse('client:subscribe-to-tier', args=['testcreator', self.basic_tier.id]))
+        subscription = Subscription.objects.get(user=self.client_user)
+        Subscription.objects.filter(pk=subscription.pk).update(status='EXPIRED')
+
+        for name in ('client:extend_subscription', 'client:cancel_subscription'):
+            with patch('client.views.get_object_or_404', return_value=subscription):
+                response = self.client.get(reverse(name, args=[subscription.id]))
+            self.assertRedirects(response, reverse('client:subscriptions'), fetch_redirect_response=False)
+
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.status, 'EXPIRED')
+        self.assertEqual(Wallet.objects.get(user=self.client_user).total_balance, 900)
+
+    def test_rebuild_timelines_command(self):
+        """
+        The rebuild command backfills active subscriptions and prunes entries without access.
+        """
+        now = timezone.now()
+        Subscription.objects.create(
+            user=self.client_user, tier=self.premium_tier, status='ACTIVE',
+            start_date=now, end_date=now + timezone.timedelta(days=30))
+        TimelineEntry.objects.create(
+            user=self.client_user, post=self.basic_post, creator=self.creator_user,
+            posted_at=self.basic_post.posted_at)
+
+        call_command('rebuild_timelines', stdout=StringIO())
+
+        self.assertEqual(self.timeline_post_ids(), {self.free_post.id, self.premium_post.id})
+
+
+class RenewSubscriptionsTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with a tier and three clients with due subscriptions.
+        """
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        self.tier = Tier.objects.create(
+            name='Basic', points_price=100, description='Basic tier', user=self.creator_user)
+        self.post = Post.objects.create(
+            title='Basic', text='Basic post', tier=self.tier, user=self.creator_user)
+
+        past = timezone.now() - timezone.timedelta(days=1)
+        self.subscriptions = {}
+        for username, balance in [('rich', 250), ('poor', 50), ('nowallet', None)]:
+            user = get_user_model().objects.create_user(
+                username=username, password='testpassword', email=f'{username}@example.com')
+            if balance is not None:
+                Wallet.objects.create(user=user, balance=balance)
+            self.subscriptions[username] = Subscription.objects.create(
+                user=user, tier=self.tier, status='ACTIVE', start_date=past, end_date=past)
+            TimelineEntry.objects.create(
+                user=user, post=self.post, creator=self.creator_user, posted_at=self.post.posted_at)
+
+    def test_renew_subscriptions(self):
+        """
+        Clients with enough points are charged and renewed, the others expire.
+        """
+        renewed, expired = renew_subscriptions(chunk_size=2)
+
+        self.assertEqual((renewed, expired), (1, 2))
+        statuses = {name: Subscription.objects.get(pk=sub.pk).status for name, sub in self.subscriptions.items()}
+        self.assertEqual(statuses, {'rich': 'ACTIVE', 'poor': 'EXPIRED', 'nowallet': 'EXPIRED'})
+        self.assertGreater(Subscription.objects.get(pk=self.subscriptions['rich'].pk).end_date, timezone.now())
+
+        self.assertEqual(Wallet.objects.get(user__username='rich').balance, 150)
+        self.assertEqual(Wallet.objects.get(user__username='poor').balance, 50)
+        self.assertEqual(Wallet.objects.get(user=self.creator_user).balance, 100)
+        self.assertEqual(Event.objects.filter(user=self.creator_user).count(), 3)
+        self.assertEqual(set(TimelineEntry.objects.values_list('user__username', flat=True)), {'rich'})
+
+    def test_renew_subscriptions_is_idempotent(self):
+        """
+        A second run finds nothing due and charges nobody again.
+        """
+        renew_subscriptions()
+
+        self.assertEqual(renew_subscriptions(), (0, 0))
+        self.assertEqual(Wallet.objects.get(user__username='rich').balance, 150)
+
+    def test_resume_skips_finished_partitions(self):
+        """
+        Resuming a run with the same key renews only the partitions that did not finish.
+        """
+        run = RenewalRun.objects.create(key='renewal-test', cutoff=timezone.now(), partitions=2)
+        rich = self.subscriptions['rich']
+        finished_index = rich.user_id % 2
+        RenewalPartition.objects.create(run=run, index=finished_index)
+
+        call_command('renew_subscriptions', run_key='renewal-test', stdout=StringIO())
+
+        run.refresh_from_db()
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(run.finished_partitions.count(), 2)
+        for subscription in self.subscriptions.values():
+            status = Subscription.objects.get(pk=subscription.pk).status
+            self.assertEqual(status, 'ACTIVE' if subscription.user_id % 2 == finished_index else 'EXPIRED')
+        self.assertEqual(Wallet.objects.get(user__username='rich').balance, 250)
+
+    def test_run_without_key_resumes_the_unfinished_run(self):
+        """
+        Without a key the command resumes the unfinished run, or starts a new one and prints its key.
+        """
+        crashed = RenewalRun.objects.create(key='renewal-crashed', cutoff=timezone.now(), partitions=1)
+        stdout = StringIO()
+
+        call_command('renew_subscriptions', stdout=stdout)
+
+        self.assertIn('Возобновление запуска renewal-crashed', stdout.getvalue())
+        crashed.refresh_from_db()
+        self.assertIsNotNone(crashed.finished_at)
+        self.assertEqual(RenewalRun.objects.count(), 1)
+
+        stdout = StringIO()
+        call_command('renew_subscriptions', stdout=stdout)
+
+        run = RenewalRun.objects.exclude(pk=crashed.pk).get()
+        self.assertIn(f'Запуск {run.key}', stdout.getvalue())
+
+    def test_scheduler_renews_due_subscriptions(self):
+        """
+        The scheduler renews subscriptions from its heap and waits for ones that are not due yet.
+        """
+        later = timezone.now() + timezone.timedelta(minutes=5)
+        Subscription.objects.filter(pk=self.subscriptions['poor'].pk).update(end_date=later)
+        scheduler = RenewalScheduler()
+
+        self.assertEqual(scheduler.run_once(), (1, 1))
+        self.assertEqual(Subscription.objects.get(pk=self.subscriptions['poor'].pk).status, 'ACTIVE')
+        self.assertEqual([subscription_id for _, subscription_id in scheduler.heap], [self.subscriptions['poor'].pk])
+        self.assertGreater(scheduler.seconds_until_next(timezone.now()), 0)
+
+        self.assertEqual(scheduler.run_once(later), (0, 1))
+        self.assertEqual(Subscription.objects.get(pk=self.subscriptions['poor'].pk).status, 'EXPIRED')
+
+    def test_scheduler_retries_subscriptions_a_failed_run_left_behind(self):
+        """
+        Due subscriptions whose run failed are renewed by a later run, although they left the heap.
+        """
+        scheduler = RenewalScheduler()
+        now = timezone.now()
+        with patch('client.scheduler.renew_subscriptions', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                scheduler.run_once(now)
+        self.assertEqual(scheduler.heap, [])
+        self.assertEqual(scheduler.run_once(now), (0, 0))
+
+        self.assertEqual(scheduler.run_once(now + scheduler.retry_delay), (1, 2))
+        self.assertIsNone(scheduler.retry_at)
+
+
+class QueryPlanTests(TestCase):
+
+    def setUp(self):
+        """
+        Seed creators, tiers, posts, clients, subscriptions in every status and events.
+        """
+        now = timezone.now()
+        self.creators = [
+            get_user_model().objects.create_user(
+                username=f'creator{i}', password='testpassword', email=f'creator{i}@example.com',
+                is_content_creator=True)
+            for i in range(5)
+        ]
+        tiers = [Tier.objects.create(name=f'Tier {i}', points_price=100, description='Tier', user=creator)
+                 for i, creator in enumerate(self.creators)]
+        Post.objects.bulk_create([
+            Post(title='Post', text='Text', is_free=True, user=creator)
+            for creator in self.creators for _ in range(40)
+        ])
+
+        self.clients = [
+            get_user_model().objects.create_user(
+                username=f'client{i}', password='testpassword', email=f'client{i}@example.com')
+            for i in range(20)
+        ]
+        statuses = ['ACTIVE', 'CANCELLED', 'EXPIRED']
+        Subscription.objects.bulk_create([
+            Subscription(user=client, tier=tier, status=statuses[(i + j) % 3],
+                         start_date=now, end_date=now + timezone.timedelta(days=i + j))
+            for i, client in enumerate(self.clients) for j, tier in enumerate(tiers)
+        ])
+        Event.objects.bulk_create([
+            Event(user=client, event_type=event_type, payload={'counterparty': self.creators[0].pk})
+            for client in self.clients for event_type in list(dict(Event.EVENT_TYPES))
+        ])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            if connection.vendor == 'postgresql':
+                # The seeded tables are small enough for a sequential scan to look cheaper
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIn(index_name, queryset.explain())
+
+    def test_hot_queries_use_their_indexes(self):
+        """
+        Each hot query is planned with the index declared for its access path.
+        """
+        now = timezone.now()
+        client, creator = self.clients[0], self.creators[0]
+
+        self.assertUsesIndex(
+            Subscription.objects.filter(user=client, status='EXPIRED'),
+            'subscription_user_status_idx')
+        self.assertUsesIndex(
+            Subscription.objects.filter(tier__user=creator, status='ACTIVE').values('user_id'),
+            'subscription_tier_active_idx')
+        self.assertUsesIndex(
+            Subscription.objects.filter(status='ACTIVE', end_date__lte=now).order_by('end_date'),
+            'subscription_active_end_idx')
+        self.assertUsesIndex(
+            Post.objects.filter(user=creator).order_by('-posted_at', '-id')[:11],
+            'post_user_recent_idx')
+        self.assertUsesIndex(
+            Event.objects.filter(user=client).order_by('-timestamp')[:20],
+            'event_user_recent_idx')
+        self.assertUsesIndex(
+            Event.objects.filter(user=client, event_type=Event.SUBSCRIBED).values('timestamp'),
+            'event_user_type_idx')
+        self.assertUsesIndex(
+            Event.objects.filter(event_type=Event.SUBSCRIBED, timestamp__gte=now).values('timestamp'),
+            'event_type_time_idx')
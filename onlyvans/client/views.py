@@ -1,15 +1,21 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from account.events import record_event
 from account.models import CustomUser as User, Event
-from creator.models import Tier, Post
-from .models import Subscription
-from interactions.models import Like
+from creator.models import Tier
+from .models import Subscription, TimelineEntry
+from .helpers import fill_timeline, refresh_timeline
+from .scheduler import notify_schedule_change
+from finances.ledger import InsufficientFunds, transfer
 from finances.models import Wallet
-from django.db.models import Q, Value, CharField, Count
+from django.db import transaction
+from django.db.models import Q, Count
 from .decorators import client_required
 import random
-from django.core.paginator import Paginator
+from creator.earnings import record_earnings, subscription_earnings
+from creator.feed import feed_posts, prepare_feed
+from creator.pagination import KeysetPaginator
 from django.utils import timezone
 
 
@@ -19,36 +25,28 @@ def dashboard(request):
     """
     Display the client's dashboard with posts from followed creators.
 
-    Retrieves active subscriptions of the user, followed creators, and their posts,
-    then paginates the posts and returns the dashboard view.
+    Reads a page of the client's materialized timeline, which already holds the posts
+    of followed creators the client has access to, and returns the dashboard view.
 
     Args:
         request: The HTTP request object.
 
     Returns:
-        Rendered dashboard HTML page with posts and liked posts.
+        Rendered dashboard HTML page with posts.
     """
     user = request.user
-    active_subscriptions = Subscription.objects.filter(
-        user=user, status='ACTIVE')
-    followed_creators = [sub.tier.user for sub in active_subscriptions]
-    posts_list = Post.objects.filter(
-        Q(user__in=followed_creators, is_free=True) |
-        Q(user__in=followed_creators, tier__in=[
-          sub.tier for sub in active_subscriptions])
-    ).distinct().order_by('-posted_at')
-
-    posts_list = posts_list.annotate(
-        visible=Value(True, output_field=CharField()))
-    paginator = Paginator(posts_list, 10)
-    page_number = request.GET.get('page')
-    posts = paginator.get_page(page_number)
-    liked_posts = Like.objects.filter(
-        user=request.user, post__in=posts_list).values_list('post_id', flat=True)
+    entries = feed_posts(TimelineEntry.objects.filter(user=user).select_related(
+        'post'), prefix='post__')
+
+    paginator = KeysetPaginator(entries, 10, id_field='post_id')
+    posts = paginator.get_page(request.GET.get('cursor'))
+    posts.object_list = prepare_feed(
+        [entry.post for entry in posts.object_list], user)
+    for post in posts.object_list:
+        post.visible = True
 
     return render(request, 'client/dashboard.html', {
         'posts': posts,
-        'liked_posts': liked_posts,
     })
 
 
@@ -161,35 +159,30 @@ def subscribe_to_tier(request, username, tier_id):
             request, 'У вас уже есть активная подписка на этого автора.')
         return redirect('client:subscriptions')
 
-    if user.wallet.balance < tier.points_price:
+    if user.wallet.total_balance < tier.points_price:
         messages.error(request, 'У вас недостаточно монет для подписки.')
         return redirect('client:select-tier', username=username)
 
-    user.wallet.balance -= tier.points_price
-    user.wallet.save()
-    creator.wallet.balance += tier.points_price
-    creator.wallet.save()
-
     now = timezone.now()
-    Subscription.objects.create(
-        user=user,
-        tier=tier,
-        status='ACTIVE',
-        start_date=now,
-        end_date=now + timezone.timedelta(days=30)
-    )
-
-    Event.objects.create(
-        user=user,
-        event_type='SUBSCRIPTION',
-        description=f'Подписался на {creator.username} подпиской {tier.name} на 30 дней.'
-    )
-
-    Event.objects.create(
-        user=creator,
-        event_type='SUBSCRIPTION',
-        description=f'{user.username} подписался на вашу подписку {tier.name} на 30 дней.'
-    )
+    try:
+        with transaction.atomic():
+            transfer(user.wallet, creator.wallet, tier.points_price, 'SUBSCRIPTION',
+                     f'{user.username} -> {creator.username}: {tier.name}', tier=tier)
+            subscription = Subscription.objects.create(
+                user=user,
+                tier=tier,
+                status='ACTIVE',
+                start_date=now,
+                end_date=now + timezone.timedelta(days=30)
+            )
+            record_earnings(subscription_earnings(subscription, 'new_subscriptions', tier.points_price, now))
+            record_event(user, Event.SUBSCRIBED, counterparty=creator.pk, tier=tier.pk, title=tier.name)
+            record_event(creator, Event.NEW_SUBSCRIBER, counterparty=user.pk, tier=tier.pk, title=tier.name)
+    except InsufficientFunds:
+        messages.error(request, 'У вас недостаточно монет для подписки.')
+        return redirect('client:select-tier', username=username)
+    fill_timeline(subscription)
+    notify_schedule_change(subscription)
 
     messages.success(request, 'Подписка успешно оформлена.')
     return redirect('client:dashboard')
@@ -217,6 +210,23 @@ def subscriptions(request):
     })
 
 
+def _lock_active_subscription(subscription):
+    """
+    Lock a subscription for the rest of the transaction and re-read it.
+
+    A renewal worker may have renewed or expired the row since the view read it, so the
+    flows write to the locked copy and only while it is still active.
+
+    Args:
+        subscription (Subscription): The subscription read by the view.
+
+    Returns:
+        Subscription: The locked subscription, or None if it is no longer active.
+    """
+    return Subscription.objects.select_for_update(of=('self',)).select_related('tier__user').filter(
+        pk=subscription.pk, status='ACTIVE').first()
+
+
 @login_required(login_url='login')
 @client_required
 def extend_subscription(request, subscription_id):
@@ -237,31 +247,31 @@ def extend_subscription(request, subscription_id):
     user = request.user
     tier = subscription.tier
 
-    if user.wallet.balance < tier.points_price:
+    if user.wallet.total_balance < tier.points_price:
         messages.error(
             request, 'У вас недостаточно монет для продления этой подписки.')
         return redirect('client:subscriptions')
 
-    user.wallet.balance -= tier.points_price
-    user.wallet.save()
     creator = tier.user
-    creator.wallet.balance += tier.points_price
-    creator.wallet.save()
-
-    subscription.end_date += timezone.timedelta(days=30)
-    subscription.save()
-
-    Event.objects.create(
-        user=user,
-        event_type='SUBSCRIPTION_EXTENDED',
-        description=f'{tier.name} продлили подписку на {creator.username}.'
-    )
-
-    Event.objects.create(
-        user=creator,
-        event_type='SUBSCRIPTION_EXTENDED',
-        description=f'{user.username} продлили свою подписку на {tier.name}.'
-    )
+    try:
+        with transaction.atomic():
+            subscription = _lock_active_subscription(subscription)
+            if subscription is None:
+                messages.error(request, 'Подписка больше не активна.')
+                return redirect('client:subscriptions')
+            transfer(user.wallet, creator.wallet, tier.points_price, 'EXTENSION',
+                     f'{user.username} -> {creator.username}: {tier.name}', tier=tier)
+            subscription.end_date += timezone.timedelta(days=30)
+            subscription.save(update_fields=['end_date'])
+            record_earnings(subscription_earnings(subscription, 'renewals', tier.points_price))
+            record_event(user, Event.EXTENDED, counterparty=creator.pk, tier=tier.pk, title=tier.name)
+            record_event(creator, Event.SUBSCRIBER_EXTENDED, counterparty=user.pk, tier=tier.pk, title=tier.name)
+    except InsufficientFunds:
+        messages.error(
+            request, 'У вас недостаточно монет для продления этой подписки.')
+        return redirect('client:subscriptions')
+    fill_timeline(subscription)
+    notify_schedule_change(subscription)
 
     messages.success(request, 'Вы успешно продлили подписку.')
     return redirect('client:subscriptions')
@@ -284,20 +294,21 @@ def cancel_subscription(request, subscription_id):
     """
     subscription = get_object_or_404(
         Subscription, id=subscription_id, user=request.user, status='ACTIVE')
-    subscription.status = 'CANCELLED'
-    subscription.save()
-
-    Event.objects.create(
-        user=request.user,
-        event_type='SUBSCRIPTION_CANCELLED',
-        description=f'Отменил подписку {subscription.tier.user.username} {subscription.tier.name}.'
-    )
-
-    Event.objects.create(
-        user=subscription.tier.user,
-        event_type='SUBSCRIPTION_CANCELLED',
-        description=f'{request.user.username} отменили подписку на уровни {subscription.tier.name}.'
-    )
+    with transaction.atomic():
+        subscription = _lock_active_subscription(subscription)
+        if subscription is None:
+            messages.error(request, 'Подписка больше не активна.')
+            return redirect('client:subscriptions')
+        subscription.status = 'CANCELLED'
+        subscription.ended_at = timezone.now()
+        subscription.save(update_fields=['status', 'ended_at'])
+        record_earnings(subscription_earnings(subscription, 'cancellations', when=subscription.ended_at))
+        record_event(request.user, Event.CANCELLED, counterparty=subscription.tier.user_id,
+                     tier=subscription.tier_id, title=subscription.tier.name)
+        record_event(subscription.tier.user, Event.SUBSCRIBER_CANCELLED, counterparty=request.user.pk,
+                     tier=subscription.tier_id, title=subscription.tier.name)
+    refresh_timeline(request.user, subscription.tier.user)
+    notify_schedule_change(subscription)
 
     messages.success(request, 'Подписка успешно отменена.')
     return redirect('client:subscriptions')
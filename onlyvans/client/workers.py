@@ -0,0 +1,33 @@
+"""
+Entry points for renewal worker processes.
+
+Worker processes may be started with the 'spawn' method, in which case they import this
+module before Django is configured. Nothing here imports models at module level.
+"""
+
+
+def init_worker():
+    """
+    Configure Django in a worker process and make sure it opens its own database connection.
+    """
+    import django
+    django.setup()
+
+    from django.db import connections
+    connections.close_all()
+
+
+def run_partition(run_id, index, chunk_size):
+    """
+    Renew one partition of a run inside a worker process.
+
+    Args:
+        run_id (int): The ID of the RenewalRun.
+        index (int): The partition number.
+        chunk_size (int): The number of subscriptions processed per transaction.
+
+    Returns:
+        int: The ID of the finished RenewalPartition.
+    """
+    from .tasks import renew_partition
+    return renew_partition(run_id, index, chunk_size).pk
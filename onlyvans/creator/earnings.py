@@ -0,0 +1,85 @@
+from collections import defaultdict
+from django.db import connection
+from django.utils import timezone
+from .models import DailyEarnings
+
+EARNINGS_FIELDS = ('new_subscriptions', 'renewals', 'cancellations', 'expirations', 'points_earned')
+EARNINGS_BATCH_SIZE = 500
+
+
+def subscription_earnings(subscription, field, points=0, when=None):
+    """
+    Describe how one subscription event changes the creator's daily earnings.
+
+    Args:
+        subscription (Subscription): The subscription, with its tier selected.
+        field (str): The counter to increment, e.g. 'new_subscriptions' or 'expirations'.
+        points (int): Points the creator earned with the event.
+        when (datetime, optional): When the event happened. Defaults to now.
+
+    Returns:
+        list: Changes for `record_earnings`.
+    """
+    key = (subscription.tier.user_id, subscription.tier_id, timezone.localdate(when or timezone.now()))
+    changes = [(*key, field, 1)]
+    if points:
+        changes.append((*key, 'points_earned', points))
+    return changes
+
+
+def record_earnings(changes):
+    """
+    Add changes to the daily earnings rollups with one upsert per batch of rows.
+
+    Changes to the same creator, tier and day are summed before writing, and each row is
+    inserted or incremented in place with `INSERT ... ON CONFLICT DO UPDATE`, so concurrent
+    writers never lose an increment. The conflict target matches the unique index on
+    `COALESCE(tier_id, 0)`, so rows of deleted tiers are incremented too.
+
+    Args:
+        changes (iterable): (creator_id, tier_id, day, field, amount) tuples.
+    """
+    totals = defaultdict(lambda: dict.fromkeys(EARNINGS_FIELDS, 0))
+    for creator_id, tier_id, day, field, amount in changes:
+        totals[(creator_id, tier_id, day)][field] += amount
+
+    rows = list(totals.items())
+    table = DailyEarnings._meta.db_table
+    columns = ', '.join(EARNINGS_FIELDS)
+    updates = ', '.join(f'{field} = {table}.{field} + excluded.{field}' for field in EARNINGS_FIELDS)
+    placeholder = '(' + ', '.join(['%s'] * (3 + len(EARNINGS_FIELDS))) + ')'
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), EARNINGS_BATCH_SIZE):
+            batch = rows[start:start + EARNINGS_BATCH_SIZE]
+            params = []
+            for (creator_id, tier_id, day), values in batch:
+                params.extend([creator_id, tier_id, day, *(values[field] for field in EARNINGS_FIELDS)])
+            cursor.execute(
+                f'INSERT INTO {table} (creator_id, tier_id, day, {columns}) '
+                f'VALUES {", ".join([placeholder] * len(batch))} '
+                f'ON CONFLICT (creator_id, COALESCE(tier_id, 0), day) DO UPDATE SET {updates}',
+                params,
+            )
+
+
+def merge_tier_earnings(tier_id):
+    """
+    Move the rollups of a tier that is being deleted into the creator's rows of deleted tiers.
+
+    The rows are added to the existing deleted-tier rows of the same creator and day with the
+    upsert of `record_earnings` and then removed, so a second deleted tier with activity on
+    the same day does not collide with the first. Must run inside the transaction that
+    deletes the tier.
+
+    Args:
+        tier_id (int): The ID of the tier being deleted.
+    """
+    rows = DailyEarnings.objects.filter(tier_id=tier_id)
+    record_earnings(
+        (creator_id, None, day, field, amount)
+        for creator_id, day, *amounts in rows.values_list('creator_id', 'day', *EARNINGS_FIELDS)
+        for field, amount in zip(EARNINGS_FIELDS, amounts)
+        if amount
+    )
+    rows.delete()
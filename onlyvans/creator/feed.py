@@ -0,0 +1,45 @@
+from django.db.models import Prefetch, prefetch_related_objects
+from interactions.models import Like
+from .models import Media
+
+
+def feed_posts(queryset, prefix=''):
+    """
+    Select the author and tier of feed posts in the same query as the posts themselves.
+
+    Args:
+        queryset (QuerySet): The queryset returning the posts, or rows pointing to them.
+        prefix (str): Lookup path from the queryset's model to the post, e.g. 'post__'.
+
+    Returns:
+        QuerySet: The queryset with the related objects joined in.
+    """
+    return queryset.select_related(f'{prefix}user', f'{prefix}tier')
+
+
+def prepare_feed(posts, user):
+    """
+    Load everything the feed template needs for a page of posts in a constant number of queries.
+
+    Media files are prefetched into `post.media_list` and the posts the viewer liked are
+    read with a single query; like counts come from the stored `Post.likes_count` column.
+    The number of queries does not depend on the number of posts on the page.
+
+    Args:
+        posts (list): The posts shown on the page.
+        user (CustomUser): The user viewing the feed.
+
+    Returns:
+        list: The same posts with `media_list` and `is_liked` attributes set.
+    """
+    posts = list(posts)
+    if not posts:
+        return posts
+
+    prefetch_related_objects(
+        posts, Prefetch('media', queryset=Media.objects.order_by('id'), to_attr='media_list'))
+
+    liked = set(Like.objects.filter(user=user, post__in=posts).values_list('post_id', flat=True))
+    for post in posts:
+        post.is_liked = post.id in liked
+    return posts
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils.dateparse import parse_date
+from client.models import Subscription
+from creator.earnings import record_earnings
+from creator.models import DailyEarnings
+from finances.models import JournalLine
+
+PAYMENT_FIELDS = {'SUBSCRIPTION': 'new_subscriptions', 'EXTENSION': 'renewals', 'RENEWAL': 'renewals'}
+ENDED_FIELDS = {'CANCELLED': 'cancellations', 'EXPIRED': 'expirations'}
+
+
+class Command(BaseCommand):
+    """
+    Custom management command to rebuild the daily creator earnings rollups.
+
+    New subscriptions, renewals and earned points are recomputed from the subscription payments
+    in the ledger, credited to the creator whose wallet received them, so payments for tiers
+    that were deleted since are kept under a NULL tier; cancellations and expirations from the subscriptions themselves, dated by
+    `ended_at`, or by `end_date` for subscriptions that ended before `ended_at` was recorded.
+    Rollups in the selected date range are replaced in one transaction.
+    """
+    help = 'Пересчитайте ежедневную статистику доходов авторов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, help='First day to rebuild, YYYY-MM-DD.')
+        parser.add_argument('--end', type=parse_date, help='Last day to rebuild, YYYY-MM-DD.')
+
+    def in_range(self, queryset, options):
+        if options['start']:
+            queryset = queryset.filter(day__gte=options['start'])
+        if options['end']:
+            queryset = queryset.filter(day__lte=options['end'])
+        return queryset
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command. Replaces the rollups and writes the number of rows to stdout.
+        """
+        payments = self.in_range(JournalLine.objects.filter(
+            entry__kind__in=PAYMENT_FIELDS, wallet__isnull=False, amount__gt=0,
+        ).annotate(day=TruncDate('entry__created_at')), options).values(
+            'wallet__user_id', 'entry__tier_id', 'entry__kind', 'day',
+        ).annotate(count=Count('pk'), points=Sum('amount')).order_by()
+
+        ended = self.in_range(Subscription.objects.filter(
+            status__in=ENDED_FIELDS,
+        ).annotate(day=TruncDate(Coalesce('ended_at', 'end_date'))), options).values(
+            'tier__user_id', 'tier_id', 'status', 'day',
+        ).annotate(count=Count('pk')).order_by()
+
+        changes = []
+        for row in payments:
+            key = (row['wallet__user_id'], row['entry__tier_id'], row['day'])
+            changes.append((*key, PAYMENT_FIELDS[row['entry__kind']], row['count']))
+            changes.append((*key, 'points_earned', row['points']))
+        for row in ended:
+            changes.append((row['tier__user_id'], row['tier_id'], row['day'], ENDED_FIELDS[row['status']], row['count']))
+
+        with transaction.atomic():
+            self.in_range(DailyEarnings.objects.all(), options).delete()
+            record_earnings(changes)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано строк: {self.in_range(DailyEarnings.objects.all(), options).count()}'))
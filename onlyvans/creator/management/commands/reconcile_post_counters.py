@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from creator.models import Post
+from interactions.models import Comment, Like
+
+
+def _count_subquery(model):
+    """
+    Build a correlated subquery counting the rows of `model` that point to the outer post.
+
+    Args:
+        model (Model): Like or Comment.
+
+    Returns:
+        Coalesce: The count expression, 0 for posts without rows.
+    """
+    rows = model.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+        total=Count('pk')).values('total')
+    return Coalesce(Subquery(rows), 0)
+
+
+class Command(BaseCommand):
+    """
+    Custom management command to recompute drifted like and comment counters on posts.
+
+    Posts are processed in primary key ranges. For each range, the posts whose stored
+    counters differ from the actual number of likes or comments are found with one query
+    and repaired with one set-based update.
+    """
+    help = 'Пересчитайте счетчики отметок нравится и комментариев у публикаций.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Number of post ids covered by each batch.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted posts without repairing them.')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command. Walks the posts table in chunks and writes
+        the number of repaired posts to stdout.
+        """
+        chunk_size = options['chunk_size']
+        first = Post.objects.order_by('pk').values_list('pk', flat=True).first()
+        last = Post.objects.order_by('-pk').values_list('pk', flat=True).first()
+        if first is None:
+            self.stdout.write(self.style.SUCCESS('Нет публикаций для проверки'))
+            return
+
+        drifted_total = 0
+        for start in range(first, last + 1, chunk_size):
+            chunk = Post.objects.filter(pk__gte=start, pk__lt=start + chunk_size)
+            drifted = list(chunk.annotate(
+                actual_likes=_count_subquery(Like),
+                actual_comments=_count_subquery(Comment),
+            ).exclude(
+                likes_count=F('actual_likes'), comments_count=F('actual_comments')
+            ).values_list('pk', flat=True))
+
+            if drifted and not options['dry_run']:
+                Post.objects.filter(pk__in=drifted).update(
+                    likes_count=_count_subquery(Like),
+                    comments_count=_count_subquery(Comment),
+                )
+            drifted_total += len(drifted)
+
+        if options['dry_run']:
+            self.stdout.write(f'Найдено расхождений: {drifted_total}')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Исправлено публикаций: {drifted_total}'))
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    """
+    Fill the new counters from the existing likes and comments.
+    """
+    Post = apps.get_model('creator', 'Post')
+    Like = apps.get_model('interactions', 'Like')
+    Comment = apps.get_model('interactions', 'Comment')
+
+    def count(model):
+        rows = model.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+            total=Count('pk')).values('total')
+        return Coalesce(Subquery(rows), 0)
+
+    Post.objects.update(likes_count=count(Like), comments_count=count(Comment))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('creator', '0002_alter_post_is_free'),
+        ('interactions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
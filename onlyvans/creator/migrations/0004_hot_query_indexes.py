@@ -0,0 +1,19 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('creator', '0003_post_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', '-posted_at', '-id'], name='post_user_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('creator', '0004_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyEarnings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('new_subscriptions', models.PositiveIntegerField(default=0)),
+                ('renewals', models.PositiveIntegerField(default=0)),
+                ('cancellations', models.PositiveIntegerField(default=0)),
+                ('expirations', models.PositiveIntegerField(default=0)),
+                ('points_earned', models.PositiveIntegerField(default=0)),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_earnings', to=settings.AUTH_USER_MODEL)),
+                ('tier', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='creator.tier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['creator', 'day'], name='earnings_creator_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyearnings',
+            constraint=models.UniqueConstraint(fields=('creator', 'tier', 'day'), name='unique_daily_earnings'),
+        ),
+    ]
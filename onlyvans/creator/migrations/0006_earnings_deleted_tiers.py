@@ -0,0 +1,44 @@
+# Generated by Django 5.0.3 on 2026-10-17 05:25
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+EARNINGS_FIELDS = ('new_subscriptions', 'renewals', 'cancellations', 'expirations', 'points_earned')
+
+
+def merge_deleted_tier_rows(apps, schema_editor):
+    """
+    Merge the rows of deleted tiers that share a creator and day, which the old constraint let through.
+    """
+    DailyEarnings = apps.get_model('creator', 'DailyEarnings')
+    kept = {}
+    for row in DailyEarnings.objects.filter(tier__isnull=True).order_by('pk'):
+        key = (row.creator_id, row.day)
+        if key not in kept:
+            kept[key] = row
+            continue
+        for field in EARNINGS_FIELDS:
+            setattr(kept[key], field, getattr(kept[key], field) + getattr(row, field))
+        kept[key].save(update_fields=EARNINGS_FIELDS)
+        row.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('creator', '0005_earnings_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_deleted_tier_rows, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='dailyearnings',
+            name='unique_daily_earnings',
+        ),
+        migrations.AddConstraint(
+            model_name='dailyearnings',
+            constraint=models.UniqueConstraint(models.F('creator'), django.db.models.functions.comparison.Coalesce('tier', 0), models.F('day'), name='unique_daily_earnings'),
+        ),
+    ]
@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.db.models.functions import Coalesce
 from account.models import CustomUser
 from django.core.exceptions import ValidationError
 from .helpers import get_upload_to
@@ -46,6 +50,8 @@ class Post(models.Model):
     - is_free: Boolean indicating if the post is free.
     - tier: The tier associated with the post.
     - user: The user who created the post.
+    - likes_count: Number of likes on the post, maintained when likes are added or removed.
+    - comments_count: Number of comments on the post, maintained when comments are added or removed.
     """
 
     title = models.CharField(max_length=100)
@@ -56,24 +62,18 @@ class Post(models.Model):
     tier = models.ForeignKey(Tier, on_delete=models.SET_NULL, null=True)
     user = models.ForeignKey(
         CustomUser, on_delete=models.CASCADE, related_name='user_posts')
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-posted_at', '-id'],
+                         name='post_user_recent_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
-    @property
-    def likes_count(self):
-        """
-        Returns the number of likes for the post.
-        """
-        return self.likes.count()
-
-    @property
-    def comments_count(self):
-        """
-        Returns the number of comments on the post.
-        """
-        return self.comments.count()
-
 
 class Media(models.Model):
     """
@@ -111,3 +111,55 @@ class Media(models.Model):
 
     def __str__(self):
         return self.file.name
+
+
+class DailyEarnings(models.Model):
+    """
+    Model representing a creator's subscription activity and earnings for one tier on one day.
+
+    Rows are incremented by the subscription flows as they happen and can be rebuilt from the
+    ledger with the `backfill_earnings` command, so earnings pages never scan transactions.
+
+    Attributes:
+    - creator: The creator who earned the points.
+    - tier: The tier the activity belongs to. Null once the tier is deleted, when its rows are
+      merged into the creator's deleted-tier rows by `merge_deleted_tier_earnings`.
+    - day: The day of the activity.
+    - new_subscriptions: Number of new subscriptions.
+    - renewals: Number of renewals and extensions.
+    - cancellations: Number of cancelled subscriptions.
+    - expirations: Number of subscriptions that expired.
+    - points_earned: Points credited to the creator.
+    """
+
+    creator = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name='daily_earnings')
+    tier = models.ForeignKey(Tier, on_delete=models.SET_NULL, null=True)
+    day = models.DateField()
+    new_subscriptions = models.PositiveIntegerField(default=0)
+    renewals = models.PositiveIntegerField(default=0)
+    cancellations = models.PositiveIntegerField(default=0)
+    expirations = models.PositiveIntegerField(default=0)
+    points_earned = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Rows of deleted tiers share the NULL tier; COALESCE makes them conflict like any other tier
+            models.UniqueConstraint(
+                F('creator'), Coalesce('tier', 0), F('day'), name='unique_daily_earnings')
+        ]
+        indexes = [
+            models.Index(fields=['creator', 'day'], name='earnings_creator_day_idx'),
+        ]
+
+
+@receiver(pre_delete, sender=Tier)
+def merge_deleted_tier_earnings(sender, instance, **kwargs):
+    """
+    Signal receiver that merges a tier's rollups into its creator's deleted-tier rows.
+
+    Runs inside the deletion's transaction, before `SET_NULL` would move the rows to the NULL
+    tier, where they could conflict with the rows of a tier deleted earlier.
+    """
+    from .earnings import merge_tier_earnings
+    merge_tier_earnings(instance.pk)
@@ -0,0 +1,136 @@
+import base64
+import json
+from datetime import datetime
+from django.db.models import Q
+
+
+class KeysetPage:
+    """
+    A page of results produced by `KeysetPaginator`.
+
+    Attributes:
+    - object_list: The objects on this page, newest first.
+    - next_cursor: Opaque token for the following (older) page, or None on the last page.
+    - previous_cursor: Opaque token for the preceding (newer) page, or None on the first page.
+    """
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset in descending `(timestamp, id)` order using opaque cursors.
+
+    Unlike `django.core.paginator.Paginator`, no `COUNT(*)` is issued and pages are fetched
+    with a range condition on the sort key instead of an `OFFSET`, so every page costs the
+    same no matter how deep the user scrolls.
+
+    Attributes:
+    - queryset: The queryset to paginate. Its own ordering is replaced.
+    - per_page: The number of objects on each page.
+    - time_field: Name of the timestamp field the results are sorted by.
+    - id_field: Name of the unique field used to break ties between equal timestamps.
+    """
+
+    def __init__(self, queryset, per_page, time_field='posted_at', id_field='id'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.time_field = time_field
+        self.id_field = id_field
+
+    def _encode(self, obj, direction):
+        """
+        Build a cursor pointing at an object.
+
+        Args:
+            obj (Model): The boundary object of a page.
+            direction (str): 'n' for the next page, 'p' for the previous page.
+
+        Returns:
+            str: The URL-safe cursor.
+        """
+        payload = [direction, getattr(obj, self.time_field).isoformat(), getattr(obj, self.id_field)]
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+    def _decode(self, cursor):
+        """
+        Parse a cursor produced by `_encode`.
+
+        Args:
+            cursor (str): The cursor taken from the request.
+
+        Returns:
+            tuple: (direction, timestamp, id), or None if the cursor is missing or malformed.
+        """
+        if not cursor:
+            return None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, timestamp, object_id = json.loads(base64.urlsafe_b64decode(padded))
+            if direction not in ('n', 'p'):
+                return None
+            return direction, datetime.fromisoformat(timestamp), int(object_id)
+        except (ValueError, TypeError):
+            return None
+
+    def get_page(self, cursor=None):
+        """
+        Return the page a cursor points to. Missing or invalid cursors return the first page.
+
+        Args:
+            cursor (str, optional): A cursor taken from a previous page.
+
+        Returns:
+            KeysetPage: The requested page.
+        """
+        time_field, id_field = self.time_field, self.id_field
+        position = self._decode(cursor)
+
+        if position is None:
+            rows = list(self.queryset.order_by(f'-{time_field}', f'-{id_field}')[:self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        elif position[0] == 'n':
+            _, timestamp, object_id = position
+            rows = list(self.queryset.filter(
+                Q(**{f'{time_field}__lt': timestamp}) |
+                Q(**{time_field: timestamp, f'{id_field}__lt': object_id})
+            ).order_by(f'-{time_field}', f'-{id_field}')[:self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, True
+            rows = rows[:self.per_page]
+        else:
+            _, timestamp, object_id = position
+            rows = list(self.queryset.filter(
+                Q(**{f'{time_field}__gt': timestamp}) |
+                Q(**{time_field: timestamp, f'{id_field}__gt': object_id})
+            ).order_by(time_field, id_field)[:self.per_page + 1])
+            if len(rows) <= self.per_page:
+                # Reached the newest objects: serve a full first page instead of a partial one
+                return self.get_page()
+            has_more, has_before = True, True
+            rows = rows[:self.per_page][::-1]
+
+        next_cursor = self._encode(rows[-1], 'n') if rows and has_more else None
+        previous_cursor = self._encode(rows[0], 'p') if rows and has_before else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
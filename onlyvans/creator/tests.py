@@ -0,0 +1,260 @@
+from io import StringIO
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from client.models import Subscription
+from finances.models import Wallet
+from interactions.models import Comment, Like
+from .feed import prepare_feed
+from .earnings import record_earnings
+from .models import DailyEarnings, Post, Tier
+from .pagination import KeysetPaginator
+
+
+class KeysetPaginatorTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with 25 posts, some of them sharing a timestamp.
+        """
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        for i in range(25):
+            Post.objects.create(title=f'Post {i}', text='Text', is_free=True, user=self.creator_user)
+        base = timezone.now()
+        for i, post in enumerate(Post.objects.order_by('id')):
+            # Every pair of posts shares a timestamp to exercise the id tie-breaker
+            Post.objects.filter(pk=post.pk).update(posted_at=base + timezone.timedelta(minutes=i // 2))
+        self.expected = list(Post.objects.order_by('-posted_at', '-id').values_list('id', flat=True))
+
+    def test_walk_forward_and_back(self):
+        """
+        Following next cursors visits every post exactly once, and previous cursors walk back.
+        """
+        paginator = KeysetPaginator(Post.objects.all(), 10)
+
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+
+        self.assertEqual([post.id for page in pages for post in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+        self.assertEqual(len(pages), 3)
+
+        previous = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual([post.id for post in previous], [post.id for post in pages[1]])
+        first = paginator.get_page(previous.previous_cursor)
+        self.assertEqual([post.id for post in first], [post.id for post in pages[0]])
+        self.assertFalse(first.has_previous())
+
+    def test_invalid_cursor_returns_first_page(self):
+        """
+        A malformed cursor falls back to the first page.
+        """
+        page = KeysetPaginator(Post.objects.all(), 10).get_page('not-a-cursor')
+        self.assertEqual([post.id for post in page], self.expected[:10])
+
+    def test_dashboard_uses_cursor(self):
+        """
+        The creator dashboard pages through posts with the cursor query parameter.
+        """
+        client = Client()
+        client.login(username='testcreator', password='testpassword')
+
+        response = client.get(reverse('creator:dashboard'))
+        next_cursor = response.context['posts'].next_cursor
+        response = client.get(reverse('creator:dashboard'), {'cursor': next_cursor})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post.id for post in response.context['posts']], self.expected[10:20])
+
+
+class FeedQueryTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with a tier and a client who likes some posts.
+        """
+        self.client = Client()
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        self.client_user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com', is_content_creator=False
+        )
+        self.tier = Tier.objects.create(
+            name='Basic', points_price=100, description='Basic tier', user=self.creator_user)
+
+    def create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(title=f'Post {i}', text='Text', tier=self.tier, user=self.creator_user)
+            Like.objects.create(user=self.client_user, post=post)
+
+    def count_dashboard_queries(self):
+        self.client.login(username='testcreator', password='testpassword')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('creator:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        """
+        Rendering a full page of posts costs as many queries as rendering two posts.
+        """
+        self.create_posts(2)
+        small_page = self.count_dashboard_queries()
+        self.create_posts(8)
+        full_page = self.count_dashboard_queries()
+
+        self.assertEqual(small_page, full_page)
+
+    def test_prepare_feed_sets_likes(self):
+        """
+        The feed builder exposes like counts and the viewer's likes on each post.
+        """
+        self.create_posts(3)
+        posts = prepare_feed(Post.objects.all(), self.client_user)
+
+        self.assertTrue(all(post.likes_count == 1 and post.is_liked for post in posts))
+        self.assertTrue(all(post.media_list == [] for post in posts))
+        self.assertFalse(any(post.is_liked for post in prepare_feed(Post.objects.all(), self.creator_user)))
+
+
+class PostCounterTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with a post and a client.
+        """
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        self.client_user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com', is_content_creator=False
+        )
+        self.post = Post.objects.create(title='Post', text='Text', is_free=True, user=self.creator_user)
+
+    def test_counters_follow_likes_and_comments(self):
+        """
+        Creating and deleting likes and comments keeps the stored counters in sync.
+        """
+        like = Like.objects.create(user=self.client_user, post=self.post)
+        Comment.objects.create(user=self.client_user, post=self.post, text='Nice')
+        Comment.objects.create(user=self.creator_user, post=self.post, text='Thanks')
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 2))
+
+        like.delete()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (0, 2))
+
+    def test_reconcile_post_counters(self):
+        """
+        The reconciliation command repairs counters that drifted from the actual rows.
+        """
+        Like.objects.create(user=self.client_user, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=7, comments_count=3)
+
+        call_command('reconcile_post_counters', chunk_size=1, stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 0))
+
+
+class EarningsTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with a tier and a client with points.
+        """
+        self.client = Client()
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        self.client_user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com', is_content_creator=False
+        )
+        Wallet.objects.create(user=self.client_user, balance=1000)
+        Wallet.objects.create(user=self.creator_user, balance=0)
+        self.tier = Tier.objects.create(
+            name='Basic', points_price=100, description='Basic tier', user=self.creator_user)
+
+    def rollups(self):
+        return list(DailyEarnings.objects.values_list(
+            'tier_id', 'new_subscriptions', 'renewals', 'cancellations', 'expirations', 'points_earned'))
+
+    def test_flows_maintain_rollups(self):
+        """
+        Subscribing, extending and cancelling update one rollup row, and the backfill rebuilds it identically.
+        """
+        self.client.login(username='testclient', password='testpassword')
+        self.client.get(reverse('client:subscribe-to-tier', args=['testcreator', self.tier.id]))
+        subscription = Subscription.objects.get(user=self.client_user)
+        self.client.get(reverse('client:extend_subscription', args=[subscription.id]))
+        self.client.get(reverse('client:cancel_subscription', args=[subscription.id]))
+
+        expected = [(self.tier.id, 1, 1, 1, 0, 200)]
+        self.assertEqual(self.rollups(), expected)
+
+        DailyEarnings.objects.all().delete()
+        call_command('backfill_earnings', stdout=StringIO())
+        self.assertEqual(self.rollups(), expected)
+
+    def test_rollups_of_deleted_tiers_are_incremented_and_backfilled(self):
+        """
+        Rows of a deleted tier are incremented in place, and the backfill keeps its payments.
+        """
+        self.client.login(username='testclient', password='testpassword')
+        self.client.get(reverse('client:subscribe-to-tier', args=['testcreator', self.tier.id]))
+        self.tier.delete()
+
+        day = timezone.localdate()
+        record_earnings([(self.creator_user.pk, None, day, 'renewals', 1)])
+        record_earnings([(self.creator_user.pk, None, day, 'renewals', 1)])
+        self.assertEqual(self.rollups(), [(None, 1, 2, 0, 0, 100)])
+
+        DailyEarnings.objects.all().delete()
+        call_command('backfill_earnings', stdout=StringIO())
+        self.assertEqual(self.rollups(), [(None, 1, 0, 0, 0, 100)])
+
+    def test_deleting_tiers_with_rollups_on_the_same_day(self):
+        """
+        Deleting two tiers with activity on the same day merges both into one deleted-tier row.
+        """
+        other_tier = Tier.objects.create(
+            name='Premium', points_price=200, description='Premium tier', user=self.creator_user)
+        day = timezone.localdate()
+        record_earnings([
+            (self.creator_user.pk, self.tier.pk, day, 'cancellations', 1),
+            (self.creator_user.pk, self.tier.pk, day, 'points_earned', 100),
+            (self.creator_user.pk, other_tier.pk, day, 'cancellations', 1),
+            (self.creator_user.pk, other_tier.pk, day, 'points_earned', 200),
+        ])
+        self.client.login(username='testcreator', password='testpassword')
+
+        self.client.post(reverse('creator:delete-tier', args=[self.tier.id]))
+        response = self.client.post(reverse('creator:delete-tier', args=[other_tier.id]))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Tier.objects.exists())
+        self.assertEqual(self.rollups(), [(None, 0, 0, 2, 0, 300)])
+
+    def test_earnings_page_reads_rollups(self):
+        """
+        The earnings page shows the rollups of the selected period.
+        """
+        DailyEarnings.objects.create(
+            creator=self.creator_user, tier=self.tier, day=timezone.localdate(), renewals=2, points_earned=200)
+        self.client.login(username='testcreator', password='testpassword')
+
+        with self.assertNumQueries(6):  # session, user, daily rows, summary, navbar wallet, tier rows
+            response = self.client.get(reverse('creator:earnings'), {'days': 7})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['summary']['points_earned'], 200)
+        self.assertEqual(response.context['daily'][0]['share'], 100)
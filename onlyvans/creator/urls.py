@@ -10,6 +10,7 @@ urlpatterns = [
     path('tiers/create/', views.create_tier, name="create-tier"),
     path('tiers/delete/<int:tier_id>/', views.delete_tier, name='delete-tier'),
     path('post/<int:post_id>/delete/', views.post_delete, name='post_delete'),
+    path('earnings/', views.earnings, name='earnings'),
 ]
 
 """
@@ -22,4 +23,5 @@ Paths:
 - 'tiers/create/': Handles the creation of a new tier. View: views.create_tier
 - 'tiers/delete/<int:tier_id>/': Handles the deletion of a tier specified by tier_id. View: views.delete_tier
 - 'post/<int:post_id>/delete/': Handles the deletion of a post specified by post_id. View: views.post_delete
+- 'earnings/': Displays the creator's daily subscription activity and earnings. View: views.earnings
 """
@@ -2,13 +2,16 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from .decorators import creator_required
 from .forms import PostForm, MediaForm, TierForm
+from account.events import record_event
 from account.models import CustomUser, Event
 from client.models import Subscription
-from .models import Media, Post, Tier
-from interactions.models import Like
-from django.db.models import Value, CharField
+from client.helpers import fan_out_post
+from .models import DailyEarnings, Media, Post, Tier
+from django.db.models import Value, CharField, Sum
+from django.utils import timezone
 from django.contrib import messages
-from django.core.paginator import Paginator
+from .feed import feed_posts, prepare_feed
+from .pagination import KeysetPaginator
 
 
 @login_required(login_url='login')
@@ -18,8 +21,7 @@ def dashboard(request):
     Display the creator's dashboard with their posts.
 
     Retrieves posts created by the logged-in creator, paginates them, and renders
-    them in the 'creator/dashboard.html' template. Also fetches posts liked by the
-    creator for display.
+    them in the 'creator/dashboard.html' template together with their media and likes.
 
     Args:
         request: The HTTP request object.
@@ -27,19 +29,14 @@ def dashboard(request):
     Returns:
         HttpResponse: The rendered dashboard page.
     """
-    posts_list = Post.objects.filter(user=request.user).annotate(
-        visible=Value(True, output_field=CharField())).order_by('-posted_at')
-    paginator = Paginator(posts_list, 10)
-
-    page_number = request.GET.get('page')
-    posts = paginator.get_page(page_number)
-
-    liked_posts = Like.objects.filter(
-        user=request.user, post__in=posts_list).values_list('post_id', flat=True)
+    posts_list = feed_posts(Post.objects.filter(user=request.user).annotate(
+        visible=Value(True, output_field=CharField())))
+    paginator = KeysetPaginator(posts_list, 10)
+    posts = paginator.get_page(request.GET.get('cursor'))
+    posts.object_list = prepare_feed(posts.object_list, request.user)
 
     context = {
         'posts': posts,
-        'liked_posts': liked_posts,
         'show_visibility': False
     }
     return render(request, 'creator/dashboard.html', context)
@@ -85,14 +82,11 @@ def create_post(request):
                     'media_form': media_form,
                 })
             else:
-                Event.objects.create(
-                    user=request.user,
-                    event_type='POST_CREATED',
-                    description=f'Новая публикация: {post.title}'
-                )
+                record_event(request.user, Event.POST_CREATED, title=post.title)
 
             for file in files:
                 Media.objects.create(post=post, file=file)
+            fan_out_post(post)
 
             return redirect('creator:dashboard')
 
@@ -124,11 +118,7 @@ def post_delete(request, post_id):
     """
     post = get_object_or_404(Post, id=post_id)
     if request.user == post.user:
-        Event.objects.create(
-            user=request.user,
-            event_type='POST_DELETED',
-            description=f'Удалена публикация: {post.title}'
-        )
+        record_event(request.user, Event.POST_DELETED, title=post.title)
         post.delete()
         messages.success(request, 'Публикация успешно удалена.')
     else:
@@ -198,11 +188,7 @@ def create_tier(request):
             tier.save()
             messages.success(request, 'Подписка успешно создана.')
 
-            Event.objects.create(
-                user=request.user,
-                event_type='TIER_CREATED',
-                description=f'Создана новая подписка: {tier.name}'
-            )
+            record_event(request.user, Event.TIER_CREATED, tier=tier.pk, title=tier.name)
 
             return redirect('creator:tiers')
     else:
@@ -239,12 +225,45 @@ def delete_tier(request, tier_id):
             return redirect('creator:tiers')
 
         tier.delete()
-        Event.objects.create(
-            user=request.user,
-            event_type='TIER_DELETED',
-            description=f'Удалена подписка: {tier.name}'
-        )
+        record_event(request.user, Event.TIER_DELETED, title=tier.name)
         messages.success(request, "Подписка успешно удалена.")
         return redirect('creator:tiers')
 
     return render(request, 'creator/tiers.html', {'tier': tier})
+
+
+@login_required(login_url='login')
+@creator_required
+def earnings(request):
+    """
+    Display the creator's subscription activity and earned points per day and per tier.
+
+    Only the daily rollups are read, so the page costs the same no matter how many
+    payments the creator received.
+
+    Args:
+        request: The HTTP request object.
+
+    Returns:
+        HttpResponse: The rendered earnings page.
+    """
+    try:
+        days = min(max(int(request.GET.get('days', 30)), 1), 365)
+    except ValueError:
+        days = 30
+    since = timezone.localdate() - timezone.timedelta(days=days - 1)
+    rollups = DailyEarnings.objects.filter(creator=request.user, day__gte=since)
+    totals = {field: Sum(field) for field in
+              ('new_subscriptions', 'renewals', 'cancellations', 'expirations', 'points_earned')}
+
+    daily = list(rollups.values('day').annotate(**totals).order_by('day'))
+    best_day = max((row['points_earned'] for row in daily), default=0)
+    for row in daily:
+        row['share'] = round(100 * row['points_earned'] / best_day) if best_day else 0
+
+    return render(request, 'creator/earnings.html', {
+        'days': days,
+        'daily': daily,
+        'tiers': rollups.values('tier__name').annotate(**totals).order_by('-points_earned'),
+        'summary': rollups.aggregate(**totals),
+    })
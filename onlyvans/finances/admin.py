@@ -3,5 +3,5 @@ from .models import Wallet
 
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
-    list_display = ('user', 'balance')
+    list_display = ('user', 'balance', 'shards')
     search_fields = ('user__username',)
\ No newline at end of file
@@ -0,0 +1,205 @@
+import csv
+from datetime import datetime, time
+from itertools import islice
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from account.events import describe_events
+from account.models import Event
+from .models import Transaction
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def describe_event_rows(rows, chunk_size):
+    """
+    Replace the type codes and payloads of exported event rows with type names and rendered
+    descriptions, looking up counterparties and tiers once per chunk.
+
+    Args:
+        rows (iterable): Event rows in the order of `EXPORTS['events']['columns']`.
+        chunk_size (int): The number of rows described at a time.
+
+    Yields:
+        tuple: The row with its type name and description.
+    """
+    names = dict(Event.EVENT_TYPES)
+    for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+        events = describe_events(Event(event_type=row[2], payload=row[4]) for row in chunk)
+        for row, event in zip(chunk, events):
+            yield row[0], row[1], names.get(row[2], row[2]), row[3], event.description
+
+
+EXPORTS = {
+    'transactions': {
+        'model': Transaction,
+        'type_field': 'type',
+        'columns': [
+            ('id', 'id'), ('user', 'user__username'), ('type', 'type'), ('amount', 'amount'),
+            ('timestamp', 'timestamp'), ('description', 'description'),
+        ],
+    },
+    'events': {
+        'model': Event,
+        'type_field': 'event_type',
+        'types': {name: code for code, name in Event.EVENT_TYPES},
+        'columns': [
+            ('id', 'id'), ('user', 'user__username'), ('event_type', 'event_type'),
+            ('timestamp', 'timestamp'), ('description', 'payload'),
+        ],
+        'transform': describe_event_rows,
+    },
+}
+
+
+def parse_day(value):
+    """
+    Parse a YYYY-MM-DD bound of an export.
+
+    Args:
+        value (str): The day, or an empty string for no bound.
+
+    Returns:
+        date: The day, or None if `value` is empty.
+
+    Raises:
+        ValueError: If the value is not a valid date, e.g. '2024-02-30' or 'yesterday'.
+    """
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f'Invalid date: {value}')
+    return day
+
+
+def export_rows(kind, user=None, type=None, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Iterate over the rows of a history export without loading them all into memory.
+
+    Rows are read with a server-side cursor in `chunk_size` batches, ordered by primary key.
+
+    Args:
+        kind (str): 'transactions' or 'events'.
+        user (CustomUser, optional): Only export rows of this user.
+        type (str, optional): Only export rows of this transaction or event type, e.g. 'PURCHASE'.
+        start (date, optional): Only export rows from this day on.
+        end (date, optional): Only export rows up to and including this day.
+        chunk_size (int): The number of rows fetched from the database at a time.
+
+    Returns:
+        iterator: Tuples of column values, in the order of `EXPORTS[kind]['columns']`.
+    """
+    export = EXPORTS[kind]
+    queryset = export['model'].objects.all()
+    if user is not None:
+        queryset = queryset.filter(user=user)
+    if type and 'types' in export:
+        queryset = queryset.filter(**{export['type_field']: export['types'].get(type.upper(), -1)})
+    elif type:
+        queryset = queryset.filter(**{export['type_field']: type})
+    if start:
+        queryset = queryset.filter(timestamp__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end:
+        queryset = queryset.filter(timestamp__lte=timezone.make_aware(datetime.combine(end, time.max)))
+
+    lookups = [lookup for _, lookup in export['columns']]
+    rows = queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=chunk_size)
+    if 'transform' in export:
+        rows = export['transform'](rows, chunk_size)
+    return rows
+
+
+class Echo:
+    """
+    A file-like object that hands back whatever is written to it, so csv.writer can feed a generator.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(kind, rows):
+    """
+    Render export rows as CSV lines, one string per row, starting with the header.
+
+    Args:
+        kind (str): 'transactions' or 'events'.
+        rows (iterable): Rows produced by `export_rows`.
+
+    Yields:
+        str: One CSV line.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in EXPORTS[kind]['columns']])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def parquet_schema(kind):
+    """
+    Get the Parquet schema of an export. Requires pyarrow.
+
+    Args:
+        kind (str): 'transactions' or 'events'.
+
+    Returns:
+        pyarrow.Schema: The schema of the export's columns.
+    """
+    types = {
+        'id': pa.int64(),
+        'amount': pa.decimal128(10, 2),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name, _ in EXPORTS[kind]['columns']])
+
+
+def _row_group(batch, schema):
+    """
+    Turn a batch of rows into a pyarrow table with the export's schema.
+    """
+    columns = zip(*batch)
+    return pa.Table.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+
+
+def write_parquet(kind, rows, path, row_group_size=EXPORT_CHUNK_SIZE):
+    """
+    Write export rows to a Parquet file, one row group per `row_group_size` rows.
+
+    Only one row group is held in memory at a time.
+
+    Args:
+        kind (str): 'transactions' or 'events'.
+        rows (iterable): Rows produced by `export_rows`.
+        path (str): The file to write.
+        row_group_size (int): The number of rows per row group.
+
+    Returns:
+        int: The number of rows written.
+
+    Raises:
+        RuntimeError: If pyarrow is not installed.
+    """
+    if pa is None:
+        raise RuntimeError('Parquet export requires pyarrow.')
+
+    schema = parquet_schema(kind)
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= row_group_size:
+                writer.write_table(_row_group(batch, schema))
+                written += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(_row_group(batch, schema))
+            written += len(batch)
+    return written
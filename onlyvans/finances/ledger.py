@@ -0,0 +1,210 @@
+import random
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from .models import JournalEntry, JournalLine, Wallet, WalletShard
+
+
+class InsufficientFunds(Exception):
+    """
+    Raised when posting an entry would take a wallet balance below zero.
+    """
+
+
+def _credit_shard(wallet_id, index, points):
+    """
+    Add points to one shard of a striped wallet, creating the shard on first use.
+
+    Args:
+        wallet_id (int): The ID of the striped wallet.
+        index (int): The shard number.
+        points (int): The number of points to add.
+    """
+    shard = WalletShard.objects.filter(wallet_id=wallet_id, index=index)
+    if not shard.update(balance=F('balance') + points):
+        WalletShard.objects.bulk_create(
+            [WalletShard(wallet_id=wallet_id, index=index)], ignore_conflicts=True)
+        shard.update(balance=F('balance') + points)
+
+
+def consolidate_shards(wallet_ids=None):
+    """
+    Fold the balances of wallet shards back into their wallets. Must run inside a transaction.
+
+    Args:
+        wallet_ids (list, optional): Restricts consolidation to these wallets.
+
+    Returns:
+        int: The number of wallets whose balance changed.
+    """
+    shards = WalletShard.objects.select_for_update().filter(balance__gt=0).order_by('pk')
+    if wallet_ids is not None:
+        shards = shards.filter(wallet_id__in=wallet_ids)
+
+    totals = defaultdict(int)
+    shard_ids = []
+    for shard in shards:
+        totals[shard.wallet_id] += shard.balance
+        shard_ids.append(shard.pk)
+    if not shard_ids:
+        return 0
+
+    WalletShard.objects.filter(pk__in=shard_ids).update(balance=0)
+    apply_wallet_deltas(totals, striped={})
+    return len(totals)
+
+
+def apply_wallet_deltas(deltas, striped=None):
+    """
+    Apply balance changes to many wallets with one guarded UPDATE statement.
+
+    Every wallet is changed with an `F()` expression, so concurrent postings are never lost.
+    Wallets that lose points are only updated if their balance covers the loss; if any of them
+    does not, nothing is changed and InsufficientFunds is raised.
+
+    Credits to striped wallets go to a random shard instead of the wallet row. Striped wallets
+    that lose points are consolidated first, so the guard sees their full balance.
+
+    Args:
+        deltas (dict): Mapping of wallet id to the signed number of points to add.
+        striped (dict, optional): Mapping of striped wallet id to its shard count. Looked up when omitted.
+
+    Raises:
+        InsufficientFunds: If a wallet does not have enough points.
+    """
+    deltas = {wallet_id: delta for wallet_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    if striped is None:
+        striped = dict(Wallet.objects.filter(pk__in=deltas, shards__gt=0).values_list('pk', 'shards'))
+    debited = [wallet_id for wallet_id in striped if deltas[wallet_id] < 0]
+    if debited:
+        consolidate_shards(debited)
+    for wallet_id, shards in striped.items():
+        if deltas[wallet_id] > 0:
+            _credit_shard(wallet_id, random.randrange(shards), deltas.pop(wallet_id))
+    if not deltas:
+        return
+
+    guard = Q()
+    for wallet_id, delta in deltas.items():
+        guard |= Q(pk=wallet_id, balance__gte=-delta) if delta < 0 else Q(pk=wallet_id)
+
+    updated = Wallet.objects.filter(guard).update(balance=F('balance') + Case(
+        *[When(pk=wallet_id, then=Value(delta)) for wallet_id, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+    if updated != len(deltas):
+        raise InsufficientFunds('Недостаточно монет.')
+
+
+@transaction.atomic
+def post_entries(entries, apply_balances=True):
+    """
+    Post journal entries and apply them to the wallet balances in one transaction.
+
+    Whatever the number of entries, this costs four statements: one insert for the entries,
+    one for their lines, one lookup of striped wallets and one guarded update for the balances.
+
+    Args:
+        entries (list): (kind, description, lines) or (kind, description, lines, tier_id) tuples,
+            where lines is a list of (account, wallet_id, amount) tuples summing to zero.
+            wallet_id is None for external accounts; tier_id marks subscription payments.
+        apply_balances (bool): Whether to apply the lines to the wallets. Only reconciliation
+            records entries for balances that are already in place.
+
+    Returns:
+        list: The posted JournalEntry instances.
+
+    Raises:
+        ValueError: If the lines of an entry do not balance.
+        InsufficientFunds: If a wallet does not have enough points.
+    """
+    for kind, _, lines, *_ in entries:
+        if sum(amount for _, _, amount in lines) != 0:
+            raise ValueError(f'Unbalanced {kind} journal entry.')
+
+    journal = JournalEntry.objects.bulk_create([
+        JournalEntry(kind=kind, description=description, tier_id=tier_id[0] if tier_id else None)
+        for kind, description, _, *tier_id in entries
+    ])
+
+    deltas = defaultdict(int)
+    lines = []
+    for entry, (_, _, entry_lines, *_) in zip(journal, entries):
+        for account, wallet_id, amount in entry_lines:
+            lines.append(JournalLine(entry=entry, account=account, wallet_id=wallet_id, amount=amount))
+            if wallet_id is not None:
+                deltas[wallet_id] += amount
+    JournalLine.objects.bulk_create(lines)
+
+    if apply_balances:
+        apply_wallet_deltas(deltas)
+    return journal
+
+
+def transfer(source, destination, points, kind, description='', tier=None):
+    """
+    Move points from one wallet to another.
+
+    Args:
+        source (Wallet): The wallet the points are taken from.
+        destination (Wallet): The wallet the points are added to.
+        points (int): The number of points to move.
+        kind (str): The kind of the journal entry.
+        description (str): A description of the movement.
+        tier (Tier, optional): The tier paid for, for subscription payments.
+
+    Returns:
+        JournalEntry: The posted entry.
+
+    Raises:
+        InsufficientFunds: If the source wallet does not have enough points.
+    """
+    return post_entries([(kind, description, [
+        ('WALLET', source.pk, -points),
+        ('WALLET', destination.pk, points),
+    ], tier.pk if tier else None)])[0]
+
+
+def deposit(wallet, points, kind='PURCHASE', description=''):
+    """
+    Add points bought outside the platform to a wallet.
+
+    Args:
+        wallet (Wallet): The wallet receiving the points.
+        points (int): The number of points.
+        kind (str): The kind of the journal entry.
+        description (str): A description of the movement.
+
+    Returns:
+        JournalEntry: The posted entry.
+    """
+    return post_entries([(kind, description, [
+        ('PURCHASES', None, -points),
+        ('WALLET', wallet.pk, points),
+    ])])[0]
+
+
+def withdraw(wallet, points, kind='WITHDRAWAL', description=''):
+    """
+    Take points out of a wallet to be paid out outside the platform.
+
+    Args:
+        wallet (Wallet): The wallet the points are taken from.
+        points (int): The number of points.
+        kind (str): The kind of the journal entry.
+        description (str): A description of the movement.
+
+    Returns:
+        JournalEntry: The posted entry.
+
+    Raises:
+        InsufficientFunds: If the wallet does not have enough points.
+    """
+    return post_entries([(kind, description, [
+        ('WALLET', wallet.pk, -points),
+        ('PAYOUTS', None, points),
+    ])])[0]
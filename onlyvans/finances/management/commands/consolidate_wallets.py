@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from finances.ledger import consolidate_shards
+from finances.models import Wallet
+
+
+class Command(BaseCommand):
+    """
+    Custom management command to fold the shard balances of striped wallets back into the wallets.
+
+    Striped wallets collect credits on their shards. Reads and debits already account for the
+    shards, so this command only keeps the number of pending shard credits small. Each wallet
+    is consolidated in its own short transaction.
+    """
+    help = 'Объедините части кошельков с основным балансом.'
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command. Consolidates every striped wallet and writes a
+        summary to stdout.
+        """
+        consolidated = 0
+        for wallet_id in Wallet.objects.filter(shards__gt=0).values_list('pk', flat=True).iterator():
+            with transaction.atomic():
+                consolidated += consolidate_shards([wallet_id])
+        self.stdout.write(self.style.SUCCESS(f'Объединено кошельков: {consolidated}'))
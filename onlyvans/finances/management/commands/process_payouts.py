@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from finances.payouts import PAYOUT_BATCH_SIZE, PAYOUT_CONCURRENCY, PAYOUT_MAX_ATTEMPTS, process_payouts
+
+
+class Command(BaseCommand):
+    """
+    Custom management command to send queued creator payouts through Stripe.
+
+    Payout throughput is tuned with `--batch-size` and `--concurrency` independently of the
+    web workers, which only queue payouts. Without `--loop` the command drains the queue and exits.
+    """
+    help = 'Отправьте выплаты авторам из очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PAYOUT_BATCH_SIZE,
+                            help='Number of payouts claimed per batch.')
+        parser.add_argument('--concurrency', type=int, default=PAYOUT_CONCURRENCY,
+                            help='Maximum number of transfers in flight.')
+        parser.add_argument('--max-attempts', type=int, default=PAYOUT_MAX_ATTEMPTS,
+                            help='Attempts before a payout fails and its points are returned.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new payouts.')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between polls in loop mode.')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command. Processes the queue and writes the counts to stdout.
+        """
+        while True:
+            paid, retried, failed = process_payouts(
+                options['batch_size'], options['concurrency'], options['max_attempts'])
+            if paid or retried or failed or not options['loop']:
+                self.stdout.write(f'Выплачено: {paid}, повтор: {retried}, не удалось: {failed}')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
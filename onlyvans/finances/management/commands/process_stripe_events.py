@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from finances.webhooks import WEBHOOK_BATCH_SIZE, process_stripe_events
+
+
+class Command(BaseCommand):
+    """
+    Custom management command to process the Stripe events stored by the webhook.
+
+    Without `--loop` the command processes every pending event and exits. With it, the command
+    keeps polling for new events every `--interval` seconds.
+    """
+    help = 'Обработайте события Stripe, полученные через вебхук.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=WEBHOOK_BATCH_SIZE,
+                            help='Number of events processed per transaction.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new events.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between polls in loop mode.')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command. Processes pending events and writes the counts to stdout.
+        """
+        while True:
+            processed, credited = process_stripe_events(options['batch_size'])
+            if processed or not options['loop']:
+                self.stdout.write(f'Обработано событий: {processed}, зачислено покупок: {credited}')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
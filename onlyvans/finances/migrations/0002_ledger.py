@@ -0,0 +1,33 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('PURCHASE', 'Purchase'), ('SUBSCRIPTION', 'Subscription'), ('RENEWAL', 'Renewal'), ('WITHDRAWAL', 'Withdrawal')], max_length=20)),
+                ('description', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JournalLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account', models.CharField(choices=[('WALLET', 'Wallet'), ('PURCHASES', 'Stripe purchases'), ('PAYOUTS', 'Stripe payouts')], default='WALLET', max_length=20)),
+                ('amount', models.IntegerField()),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='finances.journalentry')),
+                ('wallet', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='journal_lines', to='finances.wallet')),
+            ],
+        ),
+    ]
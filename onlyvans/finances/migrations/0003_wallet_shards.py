@@ -0,0 +1,32 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0002_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='WalletShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('balance', models.IntegerField(default=0)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wallet_shards', to='finances.wallet')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='walletshard',
+            constraint=models.UniqueConstraint(fields=('wallet', 'index'), name='unique_wallet_shard'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('creator', '0005_earnings_rollups'),
+        ('finances', '0005_payouts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalentry',
+            name='tier',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='creator.tier'),
+        ),
+        migrations.AlterField(
+            model_name='journalentry',
+            name='kind',
+            field=models.CharField(choices=[('PURCHASE', 'Purchase'), ('SUBSCRIPTION', 'Subscription'), ('EXTENSION', 'Extension'), ('RENEWAL', 'Renewal'), ('WITHDRAWAL', 'Withdrawal'), ('PAYOUT_REVERSAL', 'Payout reversal')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0006_journalentry_tier'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='journalentry',
+            name='kind',
+            field=models.CharField(choices=[('PURCHASE', 'Purchase'), ('SUBSCRIPTION', 'Subscription'), ('EXTENSION', 'Extension'), ('RENEWAL', 'Renewal'), ('WITHDRAWAL', 'Withdrawal'), ('PAYOUT_REVERSAL', 'Payout reversal'), ('ADJUSTMENT', 'Reconciliation adjustment')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='journalline',
+            name='account',
+            field=models.CharField(choices=[('WALLET', 'Wallet'), ('PURCHASES', 'Stripe purchases'), ('PAYOUTS', 'Stripe payouts'), ('ADJUSTMENTS', 'Reconciliation adjustments')], default='WALLET', max_length=20),
+        ),
+    ]
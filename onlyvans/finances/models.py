@@ -1,4 +1,6 @@
+import uuid
 from django.db import models
+from django.utils import timezone
 from account.models import CustomUser
 
 
@@ -6,12 +8,47 @@ class Wallet(models.Model):
     """
     Model representing a user's wallet.
 
+    A wallet with `shards` greater than zero is striped: credits are spread over that many
+    WalletShard rows instead of all queueing on this row's lock. Shard balances are folded back
+    into `balance` before any debit and by the `consolidate_wallets` command.
+
     Fields:
         user (OneToOneField): The user to whom this wallet belongs. Deletes the wallet if the user is deleted.
-        balance (IntegerField): The current balance of points in the wallet. Defaults to 0.
+        balance (IntegerField): The consolidated balance of points in the wallet. Defaults to 0.
+        shards (PositiveSmallIntegerField): Number of shards credits are spread over. 0 disables striping.
     """
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='wallet')
     balance = models.IntegerField(default=0)
+    shards = models.PositiveSmallIntegerField(default=0)
+
+    @property
+    def total_balance(self):
+        """
+        The points available in the wallet, including credits not yet consolidated from its shards.
+        """
+        if not self.shards:
+            return self.balance
+        pending = self.wallet_shards.aggregate(total=models.Sum('balance'))['total']
+        return self.balance + (pending or 0)
+
+
+class WalletShard(models.Model):
+    """
+    Model representing one stripe of a striped wallet. Shards only ever receive credits.
+
+    Fields:
+        wallet (ForeignKey): The striped wallet.
+        index (PositiveSmallIntegerField): The shard number, from 0 to `wallet.shards - 1`.
+        balance (IntegerField): Points credited to the shard since it was last consolidated.
+    """
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='wallet_shards')
+    index = models.PositiveSmallIntegerField()
+    balance = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'index'], name='unique_wallet_shard')
+        ]
 
 
 class Transaction(models.Model):
@@ -20,7 +57,8 @@ class Transaction(models.Model):
 
     Fields:
         user (ForeignKey): The user who made the transaction. Deletes transactions if the user is deleted.
-        type (CharField): The type of the transaction. Choices are 'PURCHASE', 'SUBSCRIPTION', 'DONATION', 'WITHDRAWAL'.
+        type (CharField): The type of the transaction. Choices are 'PURCHASE', 'SUBSCRIPTION', 'DONATION', 'WITHDRAWAL',
+            'WITHDRAWAL_REVERSAL'.
         amount (DecimalField): The amount of the transaction, allowing for up to 10 digits with 2 decimal places.
         timestamp (DateTimeField): The time when the transaction was made. Automatically set to the current date and time when the transaction is created.
         description (TextField): A description of the transaction. Can be blank or null.
@@ -30,9 +68,158 @@ class Transaction(models.Model):
         ('SUBSCRIPTION', 'Subscription'),
         ('DONATION', 'Donation'),
         ('WITHDRAWAL', 'Withdrawal'),
+        ('WITHDRAWAL_REVERSAL', 'Withdrawal reversal'),
     ]
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='transactions')
     type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     timestamp = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True, null=True)
+
+
+class JournalEntry(models.Model):
+    """
+    Model representing one movement of points, recorded as a balanced set of journal lines.
+
+    Fields:
+        kind (CharField): The business operation that moved the points.
+        description (TextField): A description of the movement. Can be blank.
+        tier (ForeignKey): The tier paid for, for subscription payments. Null otherwise.
+        created_at (DateTimeField): When the entry was posted.
+    """
+    KINDS = [
+        ('PURCHASE', 'Purchase'),
+        ('SUBSCRIPTION', 'Subscription'),
+        ('EXTENSION', 'Extension'),
+        ('RENEWAL', 'Renewal'),
+        ('WITHDRAWAL', 'Withdrawal'),
+        ('PAYOUT_REVERSAL', 'Payout reversal'),
+        ('ADJUSTMENT', 'Reconciliation adjustment'),
+    ]
+    kind = models.CharField(max_length=20, choices=KINDS)
+    description = models.TextField(blank=True)
+    tier = models.ForeignKey('creator.Tier', on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class JournalLine(models.Model):
+    """
+    Model representing one side of a journal entry. The lines of an entry always sum to zero.
+
+    Points held by users live in their wallets. Points entering or leaving the platform
+    are booked against the external accounts, which have no wallet.
+
+    Fields:
+        entry (ForeignKey): The journal entry the line belongs to.
+        account (CharField): The account the line is booked to.
+        wallet (ForeignKey): The wallet for 'WALLET' lines. Null for external accounts.
+        amount (IntegerField): Points added to the account, negative when points leave it.
+    """
+    ACCOUNTS = [
+        ('WALLET', 'Wallet'),
+        ('PURCHASES', 'Stripe purchases'),
+        ('PAYOUTS', 'Stripe payouts'),
+        ('ADJUSTMENTS', 'Reconciliation adjustments'),
+    ]
+    entry = models.ForeignKey(JournalEntry, on_delete=models.CASCADE, related_name='lines')
+    account = models.CharField(max_length=20, choices=ACCOUNTS, default='WALLET')
+    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT, null=True, blank=True, related_name='journal_lines')
+    amount = models.IntegerField()
+
+
+class PointsPurchase(models.Model):
+    """
+    Model representing a purchase of points through a Stripe Checkout session.
+
+    The number of points is stored when the session is created and credited once, when Stripe
+    reports the session as paid through a webhook.
+
+    Fields:
+        user (ForeignKey): The user buying the points.
+        session_id (CharField): The ID of the Stripe Checkout session.
+        points (PositiveIntegerField): The number of points bought.
+        status (CharField): 'PENDING' until the points are credited, then 'CREDITED'.
+        created_at (DateTimeField): When the checkout session was created.
+        credited_at (DateTimeField): When the points were credited. Null while pending.
+    """
+    STATUSES = [
+        ('PENDING', 'Pending'),
+        ('CREDITED', 'Credited'),
+    ]
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='points_purchases')
+    session_id = models.CharField(max_length=255, unique=True)
+    points = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUSES, default='PENDING')
+    created_at = models.DateTimeField(auto_now_add=True)
+    credited_at = models.DateTimeField(null=True, blank=True)
+
+
+class StripeEvent(models.Model):
+    """
+    Model representing a raw event received from the Stripe webhook, stored before it is processed.
+
+    Fields:
+        event_id (CharField): The ID of the Stripe event. Redelivered events are stored once.
+        type (CharField): The type of the event, e.g. 'checkout.session.completed'.
+        payload (JSONField): The event as sent by Stripe.
+        received_at (DateTimeField): When the webhook delivered the event.
+        processed_at (DateTimeField): When the event was processed. Null while pending.
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['received_at'], condition=models.Q(processed_at__isnull=True),
+                         name='stripe_event_pending_idx'),
+        ]
+
+
+class Payout(models.Model):
+    """
+    Model representing a queued transfer of a creator's withdrawn points to their Stripe account.
+
+    The points are taken from the wallet when the payout is queued. `process_payouts` sends the
+    transfer with the payout's idempotency key, so retrying a payout never pays twice. A payout
+    that keeps failing is marked 'FAILED' and its points are returned to the wallet.
+
+    Fields:
+        user (ForeignKey): The creator being paid.
+        points (PositiveIntegerField): The number of withdrawn points.
+        amount_cents (PositiveIntegerField): The amount to transfer, in cents.
+        destination (CharField): The Stripe account receiving the transfer.
+        status (CharField): 'QUEUED', 'PROCESSING', 'PAID' or 'FAILED'.
+        idempotency_key (UUIDField): Sent with every transfer attempt of the payout.
+        attempts (PositiveIntegerField): Number of transfer attempts made.
+        last_error (TextField): The error of the last failed attempt.
+        transfer_id (CharField): The ID of the Stripe transfer once paid.
+        next_attempt_at (DateTimeField): The payout is not picked up before this time.
+        created_at (DateTimeField): When the payout was queued.
+        updated_at (DateTimeField): When the payout last changed.
+    """
+    STATUSES = [
+        ('QUEUED', 'Queued'),
+        ('PROCESSING', 'Processing'),
+        ('PAID', 'Paid'),
+        ('FAILED', 'Failed'),
+    ]
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='payouts')
+    points = models.PositiveIntegerField()
+    amount_cents = models.PositiveIntegerField()
+    destination = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUSES, default='QUEUED')
+    idempotency_key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    transfer_id = models.CharField(max_length=255, blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='payout_queue_idx'),
+        ]
@@ -0,0 +1,145 @@
+from concurrent.futures import ThreadPoolExecutor
+import stripe
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from account.models import Event
+from .ledger import post_entries
+from .models import Payout, Transaction, Wallet
+
+PAYOUT_BATCH_SIZE = 50
+PAYOUT_CONCURRENCY = 4
+PAYOUT_MAX_ATTEMPTS = 5
+PAYOUT_RETRY_DELAY = timezone.timedelta(minutes=1)
+PAYOUT_LEASE = timezone.timedelta(minutes=10)
+
+# Errors that may go away on their own; any other Stripe error fails the payout at once
+RETRYABLE_ERRORS = (stripe.error.APIConnectionError, stripe.error.APIError, stripe.error.RateLimitError)
+
+
+def claim_payouts(batch_size=PAYOUT_BATCH_SIZE):
+    """
+    Claim a batch of payouts that are due, marking them as processing.
+
+    Payouts left processing for longer than `PAYOUT_LEASE` belong to a worker that died and
+    are claimed again; their idempotency key makes the retry safe.
+
+    Args:
+        batch_size (int): The maximum number of payouts to claim.
+
+    Returns:
+        list: The claimed payouts.
+    """
+    now = timezone.now()
+    due = Payout.objects.filter(
+        Q(status='QUEUED', next_attempt_at__lte=now) |
+        Q(status='PROCESSING', updated_at__lte=now - PAYOUT_LEASE)
+    ).order_by('next_attempt_at', 'pk')
+    with transaction.atomic():
+        payouts = list(due.select_for_update(skip_locked=True)[:batch_size])
+        Payout.objects.filter(pk__in=[payout.pk for payout in payouts]).update(
+            status='PROCESSING', updated_at=now)
+    return payouts
+
+
+def send_transfer(payout):
+    """
+    Send the Stripe transfer of a payout. Makes no database queries, so it is safe to run in a thread.
+
+    Args:
+        payout (Payout): The payout to send.
+
+    Returns:
+        tuple: (transfer_id, None, False) on success, (None, error message, retryable) on failure.
+            Only connection, API and rate-limit errors are retryable.
+    """
+    try:
+        transfer = stripe.Transfer.create(
+            amount=payout.amount_cents,
+            currency='usd',
+            destination=payout.destination,
+            description='Points Withdrawal',
+            idempotency_key=str(payout.idempotency_key),
+        )
+        return transfer.id, None, False
+    except stripe.error.StripeError as e:
+        return None, str(e), isinstance(e, RETRYABLE_ERRORS)
+
+
+def _fail_payouts(payouts):
+    """
+    Mark payouts as failed and return their points to the creators' wallets. Must run inside a transaction.
+
+    Each reversal is recorded as a WITHDRAWAL_REVERSAL transaction next to the original
+    WITHDRAWAL, so the history shows the points coming back.
+
+    Args:
+        payouts (list): Payouts that ran out of attempts or failed permanently.
+    """
+    user_ids = {payout.user_id for payout in payouts}
+    wallets = dict(Wallet.objects.filter(user_id__in=user_ids).values_list('user_id', 'pk'))
+    post_entries([
+        ('PAYOUT_REVERSAL', f'Payout {payout.idempotency_key}', [
+            ('PAYOUTS', None, -payout.points),
+            ('WALLET', wallets[payout.user_id], payout.points),
+        ])
+        for payout in payouts
+    ])
+    Transaction.objects.bulk_create([
+        Transaction(user_id=payout.user_id, type='WITHDRAWAL_REVERSAL', amount=payout.points,
+                    description='Points Withdrawal reversal')
+        for payout in payouts
+    ])
+    Event.objects.bulk_create([
+        Event(user_id=payout.user_id, event_type=Event.WITHDRAWAL_FAILED, payload={'amount': payout.points})
+        for payout in payouts
+    ])
+
+
+def process_payouts(batch_size=PAYOUT_BATCH_SIZE, concurrency=PAYOUT_CONCURRENCY, max_attempts=PAYOUT_MAX_ATTEMPTS):
+    """
+    Drain the payout queue in batches, sending up to `concurrency` transfers at a time.
+
+    Transfers run in a thread pool while the database is only touched from the calling thread,
+    before and after each batch. Payouts that failed with a retryable error are retried with a
+    growing delay and reversed once they have failed `max_attempts` times; other errors, such
+    as an invalid destination, reverse them at once.
+
+    Args:
+        batch_size (int): The number of payouts claimed per batch.
+        concurrency (int): The maximum number of transfers in flight.
+        max_attempts (int): The number of attempts before a payout fails for good.
+
+    Returns:
+        tuple: (paid, retried, failed) counts.
+    """
+    paid = retried = failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            payouts = claim_payouts(batch_size)
+            if not payouts:
+                break
+
+            results = list(pool.map(send_transfer, payouts))
+            now = timezone.now()
+            exhausted = []
+            with transaction.atomic():
+                for payout, (transfer_id, error, retryable) in zip(payouts, results):
+                    attempts = payout.attempts + 1
+                    if transfer_id:
+                        Payout.objects.filter(pk=payout.pk).update(
+                            status='PAID', transfer_id=transfer_id, attempts=attempts, last_error='', updated_at=now)
+                        paid += 1
+                    elif attempts >= max_attempts or not retryable:
+                        Payout.objects.filter(pk=payout.pk).update(
+                            status='FAILED', attempts=attempts, last_error=error, updated_at=now)
+                        exhausted.append(payout)
+                    else:
+                        Payout.objects.filter(pk=payout.pk).update(
+                            status='QUEUED', attempts=attempts, last_error=error, updated_at=now,
+                            next_attempt_at=now + PAYOUT_RETRY_DELAY * 2 ** payout.attempts)
+                        retried += 1
+                if exhausted:
+                    _fail_payouts(exhausted)
+                    failed += len(exhausted)
+    return paid, retried, failed
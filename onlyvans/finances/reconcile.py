@@ -0,0 +1,141 @@
+from collections import defaultdict
+from django.db.models import Case, F, Max, Value, When
+from .ledger import consolidate_shards, post_entries
+from .models import JournalLine, Wallet, WalletShard
+
+try:
+    import numpy as np
+except ImportError:  # Reconciliation falls back to plain Python without numpy
+    np = None
+
+RECONCILE_CHUNK_SIZE = 100_000
+REPAIR_BATCH_SIZE = 500
+
+
+def _chunks(queryset, chunk_size):
+    """
+    Stream (id, amount) pairs from a queryset in lists of `chunk_size` rows.
+
+    Args:
+        queryset (QuerySet): A values_list queryset returning (id, amount) pairs.
+        chunk_size (int): The number of rows per list and per database round trip.
+
+    Yields:
+        list: Up to `chunk_size` pairs.
+    """
+    chunk = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _sum_by_id(queryset, size, chunk_size):
+    """
+    Sum amounts per id over a stream of (id, amount) pairs.
+
+    With numpy each chunk is added with one vectorized `np.add.at` in int64, so totals stay
+    exact and only one chunk of rows is held in memory at a time. Ids of `size` and above
+    belong to wallets created after `size` was read and are left out, as `find_mismatches`
+    does not compare those wallets.
+
+    Args:
+        queryset (QuerySet): A values_list queryset returning (id, amount) pairs.
+        size (int): One more than the largest id.
+        chunk_size (int): The number of rows processed at a time.
+
+    Returns:
+        numpy.ndarray or defaultdict: Totals indexed by id.
+    """
+    if np is None:
+        totals = defaultdict(int)
+        for chunk in _chunks(queryset, chunk_size):
+            for row_id, amount in chunk:
+                totals[row_id] += amount
+        return totals
+
+    totals = np.zeros(size, dtype=np.int64)
+    for chunk in _chunks(queryset, chunk_size):
+        rows = np.asarray(chunk, dtype=np.int64)
+        rows = rows[rows[:, 0] < size]
+        np.add.at(totals, rows[:, 0], rows[:, 1])
+    return totals
+
+
+def find_mismatches(chunk_size=RECONCILE_CHUNK_SIZE):
+    """
+    Compare every wallet's balance with the balance implied by its ledger lines.
+
+    A wallet's actual balance is its consolidated balance plus its shard balances. Its expected
+    balance is the sum of its journal lines. Run this inside a transaction with a consistent
+    snapshot so concurrent postings do not show up as mismatches.
+
+    Args:
+        chunk_size (int): The number of rows processed at a time.
+
+    Returns:
+        list: (wallet_id, actual, expected) tuples for wallets whose balances differ.
+    """
+    size = (Wallet.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+    pending = _sum_by_id(WalletShard.objects.order_by().values_list('wallet_id', 'balance'), size, chunk_size)
+    expected = _sum_by_id(
+        JournalLine.objects.filter(wallet__isnull=False).order_by().values_list('wallet_id', 'amount'),
+        size, chunk_size)
+
+    mismatches = []
+    wallets = Wallet.objects.filter(pk__lt=size).order_by().values_list('pk', 'balance')
+    for chunk in _chunks(wallets, chunk_size):
+        if np is None:
+            for wallet_id, balance in chunk:
+                if balance + pending[wallet_id] != expected[wallet_id]:
+                    mismatches.append((wallet_id, balance + pending[wallet_id], expected[wallet_id]))
+            continue
+
+        rows = np.asarray(chunk, dtype=np.int64)
+        wallet_ids = rows[:, 0]
+        actual = rows[:, 1] + pending[wallet_ids]
+        differs = actual != expected[wallet_ids]
+        mismatches.extend(zip(wallet_ids[differs].tolist(), actual[differs].tolist(),
+                              expected[wallet_ids][differs].tolist()))
+    return mismatches
+
+
+def repair_wallets(mismatches, batch_size=REPAIR_BATCH_SIZE):
+    """
+    Set wallet balances to what the ledger says. Must run inside a transaction.
+
+    The shards of striped wallets are folded into their balance first. Corrections are then
+    applied with `F()` expressions, one UPDATE per batch, and unlike `apply_wallet_deltas` they
+    are never guarded: a ledger total below zero or below the pending shards is set as it is.
+
+    Args:
+        mismatches (list): (wallet_id, actual, expected) tuples from `find_mismatches`.
+        batch_size (int): The number of wallets corrected per statement.
+    """
+    deltas = {wallet_id: expected - actual for wallet_id, actual, expected in mismatches if expected != actual}
+    consolidate_shards(list(deltas))
+    wallet_ids = sorted(deltas)
+    for start in range(0, len(wallet_ids), batch_size):
+        batch = wallet_ids[start:start + batch_size]
+        Wallet.objects.filter(pk__in=batch).update(balance=F('balance') + Case(
+            *[When(pk=wallet_id, then=Value(deltas[wallet_id])) for wallet_id in batch]))
+
+
+def adopt_balances(mismatches):
+    """
+    Post adjustment entries so the ledger agrees with the current wallet balances, without
+    changing any balance. Used once for balances that predate the ledger.
+
+    Args:
+        mismatches (list): (wallet_id, actual, expected) tuples from `find_mismatches`.
+    """
+    post_entries([
+        ('ADJUSTMENT', 'Reconciliation', [
+            ('ADJUSTMENTS', None, expected - actual),
+            ('WALLET', wallet_id, actual - expected),
+        ])
+        for wallet_id, actual, expected in mismatches
+    ], apply_balances=False)
@@ -1,8 +1,24 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import stripe
+from django.conf import settings
 from django.test import TestCase, Client
+from account.helpers import get_stripe_account_status, invalidate_stripe_account_status
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from unittest.mock import patch, MagicMock
-from .models import Wallet, Transaction
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from .ledger import InsufficientFunds, deposit, post_entries, transfer, withdraw
+from .payouts import process_payouts
+from .reconcile import _sum_by_id, find_mismatches, repair_wallets
+from .webhooks import store_event
+from .models import JournalLine, Payout, PointsPurchase, StripeEvent, Wallet, WalletShard, Transaction
 from .forms import PurchasePointsForm, WithdrawPointsForm
 from django.db.utils import IntegrityError
 
@@ -75,29 +91,28 @@ class FinancesTests(TestCase):
         """
         self.client.login(username='testclient', password='testpassword')
 
-        mock_stripe_create.return_value = MagicMock(url='http://mock.stripe.url')
+        mock_stripe_create.return_value = MagicMock(id='cs_test_1234', url='http://mock.stripe.url')
         form_data = {'points': 1000}
         response = self.client.post(reverse('purchase'), data=form_data)
         self.assertEqual(response.status_code, 302)  # Redirect to Stripe checkout
+        self.assertTrue(PointsPurchase.objects.filter(session_id='cs_test_1234', points=1000).exists())
 
-    @patch('stripe.checkout.Session.retrieve')
-    def test_purchase_success_view(self, mock_stripe_retrieve):
+    def test_purchase_success_view(self):
         """
-        Test the purchase_success view. Ensures points are added to the client's wallet and transaction is recorded.
+        Test the purchase_success view. Ensures the page only shows the status and never credits points itself.
         """
         self.client.login(username='testclient', password='testpassword')
+        PointsPurchase.objects.create(user=self.client_user, session_id='cs_test_1234', points=1000)
 
-        mock_stripe_retrieve.return_value = MagicMock(id='cs_test_1234', payment_status='paid')
-        session_id = 'cs_test_1234'
-        points = 1000
-        response = self.client.get(reverse('purchase-success'), {'session_id': session_id, 'points': points})
-        self.assertEqual(response.status_code, 302)  # Redirect to home
+        for _ in range(2):
+            response = self.client.get(reverse('purchase-success'), {'session_id': 'cs_test_1234', 'points': 5000})
+            self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'finances/purchase_success.html')
         self.client_wallet.refresh_from_db()
-        self.assertEqual(self.client_wallet.balance, 2000)  # Points added
+        self.assertEqual(self.client_wallet.balance, 1000)  # Nothing credited by the redirect
 
-        transactions = Transaction.objects.filter(user=self.client_user, type='PURCHASE')
-        self.assertEqual(transactions.count(), 1)
-        self.assertEqual(transactions.first().amount, points)
+        response = self.client.get(reverse('purchase-status', args=['cs_test_1234']))
+        self.assertEqual(response.json(), {'status': 'PENDING', 'points': 1000})
 
     @patch('stripe.Account.retrieve')
     def test_withdraw_points_view_get(self, mock_stripe_account_retrieve):
@@ -140,3 +155,431 @@ class FinancesTests(TestCase):
         transactions = Transaction.objects.filter(user=self.creator_user, type='WITHDRAWAL')
         self.assertEqual(transactions.count(), 1)
         self.assertEqual(transactions.first().amount, 500)
+
+        mock_stripe_transfer_create.assert_not_called()  # Sent later by process_payouts
+        self.assertEqual(Payout.objects.get(user=self.creator_user).status, 'QUEUED')
+
+
+class LedgerTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up two wallets.
+        """
+        self.source = Wallet.objects.create(user=get_user_model().objects.create_user(
+            username='source', password='testpassword', email='source@example.com'), balance=100)
+        self.destination = Wallet.objects.create(user=get_user_model().objects.create_user(
+            username='destination', password='testpassword', email='destination@example.com'), balance=0)
+
+    def test_transfer_posts_balanced_entry(self):
+        """
+        A transfer moves the points and records balanced lines in a fixed number of statements.
+        """
+        with self.assertNumQueries(6):  # savepoint, entry, lines, striped lookup, balances, release
+            entry = transfer(self.source, self.destination, 60, 'SUBSCRIPTION')
+
+        self.source.refresh_from_db()
+        self.destination.refresh_from_db()
+        self.assertEqual((self.source.balance, self.destination.balance), (40, 60))
+        self.assertEqual(sorted(entry.lines.values_list('amount', flat=True)), [-60, 60])
+
+    def test_insufficient_funds_changes_nothing(self):
+        """
+        A transfer larger than the balance is refused and leaves no trace.
+        """
+        with self.assertRaises(InsufficientFunds):
+            transfer(self.source, self.destination, 150, 'SUBSCRIPTION')
+
+        self.source.refresh_from_db()
+        self.assertEqual(self.source.balance, 100)
+        self.assertFalse(JournalLine.objects.exists())
+
+    def test_unbalanced_entry_is_rejected(self):
+        """
+        Entries whose lines do not sum to zero are refused.
+        """
+        with self.assertRaises(ValueError):
+            post_entries([('PURCHASE', '', [('WALLET', self.destination.pk, 10)])])
+
+    def test_striped_wallet(self):
+        """
+        Credits to a striped wallet land on its shards, and debits and consolidation see the full balance.
+        """
+        Wallet.objects.filter(pk=self.destination.pk).update(shards=4)
+        self.destination.refresh_from_db()
+
+        for _ in range(5):
+            transfer(self.source, self.destination, 10, 'SUBSCRIPTION')
+        self.destination.refresh_from_db()
+        self.assertEqual((self.destination.balance, self.destination.total_balance), (0, 50))
+
+        transfer(self.destination, self.source, 30, 'SUBSCRIPTION')
+        self.destination.refresh_from_db()
+        self.assertEqual((self.destination.balance, self.destination.total_balance), (20, 20))
+
+        transfer(self.source, self.destination, 5, 'SUBSCRIPTION')
+        call_command('consolidate_wallets', stdout=StringIO())
+        self.destination.refresh_from_db()
+        self.assertEqual(self.destination.balance, 25)
+        self.assertFalse(WalletShard.objects.filter(balance__gt=0).exists())
+
+
+class ReconcileTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a wallet whose balance predates the ledger and one that only moved through it.
+        """
+        self.legacy = Wallet.objects.create(user=get_user_model().objects.create_user(
+            username='legacy', password='testpassword', email='legacy@example.com'), balance=100)
+        self.striped = Wallet.objects.create(user=get_user_model().objects.create_user(
+            username='striped', password='testpassword', email='striped@example.com'), shards=2)
+
+    def test_finds_mismatches(self):
+        """
+        Only wallets whose balance and shards differ from their ledger lines are reported.
+        """
+        transfer(self.legacy, self.striped, 30, 'SUBSCRIPTION')
+        self.assertEqual(find_mismatches(chunk_size=1), [(self.legacy.pk, 70, -30)])
+
+    def test_repair_wallets(self):
+        """
+        Repairing wallets sets their balances to the ledger total.
+        """
+        Wallet.objects.filter(pk=self.legacy.pk).update(balance=0)
+        deposit(self.legacy, 40, 'PURCHASE')
+        Wallet.objects.filter(pk=self.legacy.pk).update(balance=55)
+
+        out = StringIO()
+        call_command('reconcile_wallets', repair='wallets', stdout=out)
+        self.assertIn('Расхождений: 1', out.getvalue())
+        self.legacy.refresh_from_db()
+        self.assertEqual(self.legacy.balance, 40)
+        self.assertEqual(find_mismatches(), [])
+
+    def test_repair_wallets_below_current_balance(self):
+        """
+        Repairs set negative ledger totals and totals below the pending shards without a guard.
+        """
+        transfer(self.legacy, self.striped, 30, 'SUBSCRIPTION')
+        WalletShard.objects.filter(wallet=self.striped).delete()
+        WalletShard.objects.create(wallet=self.striped, index=0, balance=50)
+
+        repair_wallets(find_mismatches())
+
+        self.legacy.refresh_from_db()
+        self.striped.refresh_from_db()
+        self.assertEqual((self.legacy.balance, self.striped.balance), (-30, 30))
+        self.assertFalse(WalletShard.objects.filter(wallet=self.striped, balance__gt=0).exists())
+        self.assertEqual(find_mismatches(), [])
+
+    def test_sums_ignore_wallets_created_after_the_snapshot(self):
+        """
+        Ledger lines of wallets newer than the size read up front are left out instead of failing the sum.
+        """
+        transfer(self.legacy, self.striped, 30, 'SUBSCRIPTION')
+        lines = JournalLine.objects.filter(wallet__isnull=False).order_by().values_list('wallet_id', 'amount')
+
+        totals = _sum_by_id(lines, self.striped.pk, chunk_size=1)
+
+        self.assertEqual(totals[self.legacy.pk], -30)
+
+    def test_repair_ledger(self):
+        """
+        Repairing the ledger records adjustments for legacy balances without changing them.
+        """
+        call_command('reconcile_wallets', repair='ledger', stdout=StringIO())
+        self.legacy.refresh_from_db()
+        self.assertEqual(self.legacy.balance, 100)
+        self.assertEqual(find_mismatches(), [])
+        self.assertEqual(JournalLine.objects.get(account='ADJUSTMENTS').amount, -100)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up two users with transactions.
+        """
+        self.client = Client()
+        self.user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com')
+        other = get_user_model().objects.create_user(
+            username='other', password='testpassword', email='other@example.com')
+        for i in range(3):
+            Transaction.objects.create(user=self.user, type='PURCHASE', amount=10 + i)
+        Transaction.objects.create(user=self.user, type='WITHDRAWAL', amount=5)
+        Transaction.objects.create(user=other, type='PURCHASE', amount=99)
+
+    def test_export_view_streams_own_rows(self):
+        """
+        The export endpoint streams only the user's rows, filtered by type.
+        """
+        self.client.login(username='testclient', password='testpassword')
+
+        response = self.client.get(reverse('export-history', args=['transactions']), {'type': 'PURCHASE'})
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,user,type,amount,timestamp,description')
+        self.assertEqual([line.split(',')[3] for line in lines[1:]], ['10.00', '11.00', '12.00'])
+
+    def test_export_command(self):
+        """
+        The export command writes every matching row as CSV.
+        """
+        output = StringIO()
+        call_command('export_history', 'transactions', user='testclient', stdout=output, stderr=StringIO())
+
+        self.assertEqual(len(output.getvalue().splitlines()), 5)
+
+    def test_export_rejects_malformed_dates(self):
+        """
+        Malformed or impossible dates are a bad request, and the command refuses them instead of exporting everything.
+        """
+        self.client.login(username='testclient', password='testpassword')
+        for value in ('2024-02-30', 'yesterday'):
+            response = self.client.get(reverse('export-history', args=['transactions']), {'start': value})
+            self.assertEqual(response.status_code, 400)
+
+            with self.assertRaises(CommandError):
+                call_command('export_history', 'transactions', '--start', value, stdout=StringIO(), stderr=StringIO())
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """
+    A minimal stand-in for the Stripe API that creates checkout sessions.
+    """
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({
+            'id': 'cs_test_fake', 'object': 'checkout.session', 'url': 'https://checkout.example/cs_test_fake',
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StripeWebhookTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Start a fake Stripe server on a free local port and point the Stripe client at it.
+        """
+        super().setUpClass()
+        cls.server = HTTPServer(('127.0.0.1', 0), FakeStripeHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.api_base = stripe.api_base
+        stripe.api_base = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        stripe.api_base = cls.api_base
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        """
+        Set up a client without a wallet.
+        """
+        self.client = Client()
+        self.client_user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com', is_content_creator=False
+        )
+
+    def send_event(self, event, secret=settings.STRIPE_WEBHOOK_SECRET):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+        return self.client.post(reverse('stripe-webhook'), data=payload, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}')
+
+    def paid_event(self, event_id):
+        return {
+            'id': event_id, 'type': 'checkout.session.completed',
+            'data': {'object': {'id': 'cs_test_fake', 'object': 'checkout.session', 'payment_status': 'paid'}},
+        }
+
+    def test_purchase_is_credited_once(self):
+        """
+        A purchase made against the fake server is credited exactly once, however often Stripe reports it.
+        """
+        self.client.login(username='testclient', password='testpassword')
+        response = self.client.post(reverse('purchase'), data={'points': 1000})
+        self.assertEqual(response.url, 'https://checkout.example/cs_test_fake')
+
+        self.assertEqual(self.send_event(self.paid_event('evt_1')).status_code, 200)
+        self.assertEqual(self.send_event(self.paid_event('evt_1')).status_code, 200)
+        self.assertEqual(self.send_event(self.paid_event('evt_2')).status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 2)
+        self.assertFalse(Wallet.objects.filter(user=self.client_user).exists())
+
+        call_command('process_stripe_events', stdout=StringIO())
+        call_command('process_stripe_events', stdout=StringIO())
+
+        self.assertEqual(Wallet.objects.get(user=self.client_user).balance, 1000)
+        self.assertEqual(Transaction.objects.filter(user=self.client_user, type='PURCHASE').count(), 1)
+        response = self.client.get(reverse('purchase-status', args=['cs_test_fake']))
+        self.assertEqual(response.json()['status'], 'CREDITED')
+
+    def test_concurrent_redelivery_is_acknowledged(self):
+        """
+        A redelivery whose insert loses the race on the event ID is acknowledged instead of failing the request.
+        """
+        StripeEvent.objects.create(event_id='evt_1', type='checkout.session.completed', payload={})
+
+        with patch('finances.webhooks.StripeEvent.objects.create', side_effect=IntegrityError):
+            response = self.send_event(self.paid_event('evt_1'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(store_event(self.paid_event('evt_1')))
+        self.assertTrue(store_event(self.paid_event('evt_2')))
+        self.assertEqual(StripeEvent.objects.count(), 2)
+
+    def test_malformed_event_does_not_block_the_batch(self):
+        """
+        Stored events without an object are marked as processed and the events behind them are still credited.
+        """
+        PointsPurchase.objects.create(user=self.client_user, session_id='cs_test_fake', points=1000)
+        StripeEvent.objects.create(event_id='evt_0', type='checkout.session.completed', payload={'data': None})
+        StripeEvent.objects.create(event_id='evt_00', type='account.updated', payload={'data': {'object': 'acct'}})
+        store_event(self.paid_event('evt_1'))
+
+        call_command('process_stripe_events', stdout=StringIO())
+
+        self.assertFalse(StripeEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(Wallet.objects.get(user=self.client_user).balance, 1000)
+
+    def test_invalid_signature_is_rejected(self):
+        """
+        Events signed with the wrong secret are refused and not stored.
+        """
+        response = self.send_event(self.paid_event('evt_1'), secret='whsec_wrong')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+
+class StripeAccountCacheTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with a Stripe account.
+        """
+        self.client = Client()
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        self.creator_user.stripe_account_id = 'acct_1234'
+        self.creator_user.save()
+
+    @patch('stripe.Account.retrieve')
+    def test_withdraw_page_uses_cached_status(self, mock_stripe_account_retrieve):
+        """
+        The account is fetched once, then the withdraw page renders from the cache until it is invalidated.
+        """
+        self.client.login(username='testcreator', password='testpassword')
+        mock_stripe_account_retrieve.return_value = MagicMock(capabilities={'transfers': 'active'})
+
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('withdraw')).status_code, 200)
+        self.assertEqual(mock_stripe_account_retrieve.call_count, 1)
+
+        invalidate_stripe_account_status(self.creator_user)
+        self.client.get(reverse('withdraw'))
+        self.assertEqual(mock_stripe_account_retrieve.call_count, 2)
+
+    @patch('stripe.Account.retrieve')
+    def test_account_updated_webhook_refreshes_cache(self, mock_stripe_account_retrieve):
+        """
+        An account.updated event replaces the cached capabilities without calling Stripe.
+        """
+        mock_stripe_account_retrieve.return_value = MagicMock(capabilities={'transfers': 'inactive'})
+        self.assertFalse(get_stripe_account_status(self.creator_user).transfers_active)
+
+        StripeEvent.objects.create(event_id='evt_account', type='account.updated', payload={
+            'id': 'evt_account', 'type': 'account.updated',
+            'data': {'object': {'id': 'acct_1234', 'capabilities': {'transfers': 'active'},
+                                'requirements': {'currently_due': []}}},
+        })
+        call_command('process_stripe_events', stdout=StringIO())
+
+        status = get_stripe_account_status(self.creator_user)
+        self.assertTrue(status.transfers_active)
+        self.assertFalse(status.requirements_due)
+        self.assertEqual(mock_stripe_account_retrieve.call_count, 1)
+
+
+class PayoutTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with a queued payout of 300 reserved points.
+        """
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        self.wallet = Wallet.objects.create(user=self.creator_user, balance=1000)
+        withdraw(self.wallet, 300)
+        self.payout = Payout.objects.create(
+            user=self.creator_user, points=300, amount_cents=700, destination='acct_1234')
+
+    @patch('stripe.Transfer.create')
+    def test_payout_is_sent_with_idempotency_key(self, mock_stripe_transfer_create):
+        """
+        A queued payout is transferred once, with its idempotency key.
+        """
+        mock_stripe_transfer_create.return_value = MagicMock(id='tr_test_1234')
+
+        self.assertEqual(process_payouts(), (1, 0, 0))
+        self.assertEqual(process_payouts(), (0, 0, 0))
+
+        self.payout.refresh_from_db()
+        self.assertEqual((self.payout.status, self.payout.transfer_id), ('PAID', 'tr_test_1234'))
+        mock_stripe_transfer_create.assert_called_once()
+        self.assertEqual(mock_stripe_transfer_create.call_args.kwargs['idempotency_key'],
+                         str(self.payout.idempotency_key))
+
+    @patch('stripe.Transfer.create')
+    def test_failing_payout_is_retried_then_reversed(self, mock_stripe_transfer_create):
+        """
+        A payout that keeps failing is retried and finally returns its points to the wallet.
+        """
+        mock_stripe_transfer_create.side_effect = stripe.error.APIConnectionError('Timeout')
+
+        self.assertEqual(process_payouts(max_attempts=2), (0, 1, 0))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 700)
+
+        Payout.objects.filter(pk=self.payout.pk).update(next_attempt_at=self.payout.created_at)
+        self.assertEqual(process_payouts(max_attempts=2), (0, 0, 1))
+
+        self.payout.refresh_from_db()
+        self.wallet.refresh_from_db()
+        self.assertEqual((self.payout.status, self.payout.attempts), ('FAILED', 2))
+        self.assertEqual(self.wallet.balance, 1000)
+        self.assertTrue(Transaction.objects.filter(user=self.creator_user, type='WITHDRAWAL_REVERSAL',
+                                                   amount=300).exists())
+
+    @patch('stripe.Transfer.create')
+    def test_permanent_error_fails_payout_at_once(self, mock_stripe_transfer_create):
+        """
+        A payout rejected by Stripe, e.g. for an invalid destination, is reversed without retries.
+        """
+        mock_stripe_transfer_create.side_effect = stripe.error.InvalidRequestError('No such destination', 'destination')
+
+        self.assertEqual(process_payouts(), (0, 0, 1))
+
+        self.payout.refresh_from_db()
+        self.wallet.refresh_from_db()
+        self.assertEqual((self.payout.status, self.payout.attempts), ('FAILED', 1))
+        self.assertEqual(self.wallet.balance, 1000)
+        mock_stripe_transfer_create.assert_called_once()
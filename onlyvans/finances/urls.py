@@ -4,7 +4,10 @@ from . import views
 urlpatterns = [
     path('purchase/', views.purchase_points, name='purchase'),
     path('purchase-success/', views.purchase_success, name='purchase-success'),
+    path('purchase-status/<str:session_id>/', views.purchase_status, name='purchase-status'),
+    path('stripe/webhook/', views.stripe_webhook, name='stripe-webhook'),
     path('withdraw/', views.withdraw_points, name='withdraw'),
+    path('export/<str:kind>/', views.export_history, name='export-history'),
 ]
 
 """
@@ -15,6 +18,9 @@ linking URLs to their corresponding view functions.
 
 Patterns:
 - 'purchase/': Links to the purchase_points view, allowing users to purchase points.
-- 'purchase-success/': Links to the purchase_success view, handling the post-purchase process.
+- 'purchase-success/': Links to the purchase_success view, showing the status of a purchase.
+- 'purchase-status/<session_id>/': Links to the purchase_status view, polled by the purchase success page.
+- 'stripe/webhook/': Links to the stripe_webhook view, receiving Stripe events.
 - 'withdraw/': Links to the withdraw_points view, allowing users to withdraw points.
+- 'export/<kind>/': Links to the export_history view, streaming the user's transactions or events as CSV.
 """
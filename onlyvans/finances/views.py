@@ -1,17 +1,29 @@
+import json
 import stripe
+from account.helpers import get_stripe_account_status
+from account.events import record_event
 from account.models import Event
 from client.decorators import client_required
 from creator.decorators import creator_required
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render, redirect
+from django.db import transaction
+from django.http import (HttpResponse, HttpResponseBadRequest, HttpResponseNotFound, JsonResponse,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
+from .export import EXPORTS, export_rows, iter_csv, parse_day
 from .forms import PurchasePointsForm, WithdrawPointsForm
-from .models import Wallet, Transaction
+from .ledger import InsufficientFunds, withdraw
+from .models import Payout, PointsPurchase, Wallet, Transaction
+from .webhooks import store_event
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
+stripe.api_base = settings.STRIPE_API_BASE
 dollars_per_point = settings.DOLLARS_PER_POINT
 
 
@@ -51,9 +63,10 @@ def purchase_points(request):
                         "quantity": 1,
                     }],
                     success_url=request.build_absolute_uri(
-                        reverse("purchase-success")) + "?session_id={CHECKOUT_SESSION_ID}&points=" + str(points),
+                        reverse("purchase-success")) + "?session_id={CHECKOUT_SESSION_ID}",
                     cancel_url=request.build_absolute_uri(reverse("purchase")),
                 )
+                PointsPurchase.objects.create(user=request.user, session_id=session.id, points=points)
                 return redirect(session.url)
             except stripe.error.StripeError as e:
                 messages.error(request, f"Stripe ошибка: {str(e)}")
@@ -68,40 +81,64 @@ def purchase_points(request):
 @client_required
 def purchase_success(request):
     """
-    Handles the successful purchase of points. Updates the user's wallet balance, creates a transaction record,
-    and logs the event.
+    Shows the status of a purchase after Stripe redirects the user back.
+
+    Points are credited by the Stripe webhook, not by this page, so reloading it never
+    credits twice. The page polls `purchase_status` until the points arrive.
 
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        HttpResponse: Redirects to the home page with a success message.
+        HttpResponse: Renders the purchase status page.
+    """
+    purchase = get_object_or_404(
+        PointsPurchase, session_id=request.GET.get("session_id", ""), user=request.user)
+    return render(request, 'finances/purchase_success.html', {'purchase': purchase})
+
+
+@login_required(login_url='login')
+@client_required
+def purchase_status(request, session_id):
+    """
+    Returns the status of a purchase as JSON, for the purchase success page to poll.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        session_id (str): The ID of the Stripe Checkout session.
+
+    Returns:
+        JsonResponse: The status and number of points of the purchase.
+    """
+    purchase = PointsPurchase.objects.filter(session_id=session_id, user=request.user).first()
+    if purchase is None:
+        return JsonResponse({'status': None}, status=404)
+    return JsonResponse({'status': purchase.status, 'points': purchase.points})
+
+
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    """
+    Receives Stripe webhook events. The signature is verified and the raw event is stored
+    for `process_stripe_events`; nothing else happens inside the request, so Stripe gets
+    its acknowledgement immediately.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: 200 once the event is stored, 400 if the payload or signature is invalid.
     """
-    session_id = request.GET.get("session_id")
-    points = int(request.GET.get("points", 0))
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
-        user = request.user
-
-        wallet, created = Wallet.objects.get_or_create(user=user)
-        wallet.balance += points
-        wallet.save()
-
-        Transaction.objects.create(
-            user=user,
-            type='PURCHASE',
-            amount=points,
-            description='Purchase Points'
-        )
-        Event.objects.create(
-            user=user,
-            event_type='Purchase',
-            description=f'Заказано {points} монет'
-        )
-        messages.success(request, "Монеты успешно куплены!")
-    except stripe.error.StripeError as e:
-        messages.error(request, f"Ошибка оплаты: {str(e)}")
-    return redirect("home")
+        stripe.Webhook.construct_event(
+            request.body, request.headers.get('Stripe-Signature', ''), settings.STRIPE_WEBHOOK_SECRET)
+        event = json.loads(request.body)
+    except (ValueError, stripe.error.SignatureVerificationError):
+        return HttpResponseBadRequest()
+
+    store_event(event)
+    return HttpResponse(status=200)
 
 
 @login_required(login_url='login')
@@ -109,7 +146,7 @@ def purchase_success(request):
 def withdraw_points(request):
     """
     Handles the withdrawal of points by the user. Displays a form to enter the number of points to withdraw,
-    processes the withdrawal using Stripe, and updates the user's wallet balance.
+    reserves the points in the user's wallet and queues a payout for `process_payouts` to send through Stripe.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -126,8 +163,8 @@ def withdraw_points(request):
         return redirect('update-profile')
 
     try:
-        account = stripe.Account.retrieve(user.stripe_account_id)
-        if 'transfers' not in account.capabilities or account.capabilities['transfers'] != 'active':
+        account_status = get_stripe_account_status(user)
+        if not account_status.transfers_active:
             messages.error(request,
                            "В вашем аккаунте Stripe не включены необходимые возможности. Попробуйте переподключить аккаунт.")
             return redirect('update-profile')
@@ -139,44 +176,69 @@ def withdraw_points(request):
         form = WithdrawPointsForm(request.POST)
         if form.is_valid():
             amount = form.cleaned_data['points']
-            if wallet.balance < amount:
+            if wallet.total_balance < amount:
                 messages.error(
                     request, "Недостаточно монет для вывода.")
             else:
                 payout_amount = amount * dollars_per_point * 0.5  # 50%
 
                 try:
-                    stripe.Transfer.create(
-                        amount=int(payout_amount * 100),
-                        currency='usd',
-                        destination=user.stripe_account_id,
-                        description='Points Withdrawal'
-                    )
-
-                    wallet.balance -= amount
-                    wallet.save()
-                    Transaction.objects.create(
-                        user=user,
-                        type='WITHDRAWAL',
-                        amount=amount,
-                        description='Points Withdrawal'
-                    )
+                    # The points are reserved now; process_payouts sends the transfer later
+                    with transaction.atomic():
+                        withdraw(wallet, amount, description='Points Withdrawal')
+                        Payout.objects.create(
+                            user=user,
+                            points=amount,
+                            amount_cents=int(payout_amount * 100),
+                            destination=user.stripe_account_id,
+                        )
+                        Transaction.objects.create(
+                            user=user,
+                            type='WITHDRAWAL',
+                            amount=amount,
+                            description='Points Withdrawal'
+                        )
+                        record_event(user, Event.WITHDRAWAL, amount=amount)
                     messages.success(
-                        request, "Вывод успешно обработан!")
-
-                    Event.objects.create(
-                        user=user,
-                        event_type='Withdrawal',
-                        description=f'Withdrew {amount} points'
-                    )
-
+                        request, "Вывод принят и будет отправлен в ближайшее время!")
                     return redirect('home')
-                except stripe.error.StripeError as e:
-                    messages.error(request, f"Stripe ошибка: {e}")
+                except InsufficientFunds:
+                    messages.error(
+                        request, "Недостаточно монет для вывода.")
         else:
             messages.error(request, "Сумма затребована.")
     else:
-        form = WithdrawPointsForm(initial={'points': wallet.balance})
+        form = WithdrawPointsForm(initial={'points': wallet.total_balance})
 
     return render(request, 'finances/withdraw_points.html',
                   {'wallet': wallet, 'form': form, 'dollars_per_point': dollars_per_point})
+
+
+@login_required(login_url='login')
+def export_history(request, kind):
+    """
+    Streams the user's full transaction or event history as a CSV file.
+
+    Rows are read from the database in chunks and written to the response as they arrive,
+    so memory use does not grow with the size of the history. The `type`, `start` and `end`
+    query parameters narrow the export by type and by date range (YYYY-MM-DD).
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+        kind (str): 'transactions' or 'events'.
+
+    Returns:
+        StreamingHttpResponse: The CSV file.
+    """
+    if kind not in EXPORTS:
+        return HttpResponseNotFound()
+    try:
+        start = parse_day(request.GET.get('start', ''))
+        end = parse_day(request.GET.get('end', ''))
+    except ValueError:
+        return HttpResponseBadRequest('Неверная дата.')
+
+    rows = export_rows(kind, user=request.user, type=request.GET.get('type'), start=start, end=end)
+    response = StreamingHttpResponse(iter_csv(kind, rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{kind}.csv"'
+    return response
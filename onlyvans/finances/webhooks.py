@@ -0,0 +1,136 @@
+import logging
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from account.helpers import apply_account_updated
+from account.models import Event
+from .ledger import post_entries
+from .models import PointsPurchase, StripeEvent, Transaction, Wallet
+
+WEBHOOK_BATCH_SIZE = 100
+PAID_SESSION_EVENTS = ('checkout.session.completed', 'checkout.session.async_payment_succeeded')
+
+logger = logging.getLogger(__name__)
+
+
+def store_event(event):
+    """
+    Persist a verified Stripe event so it can be processed outside the webhook request.
+
+    Args:
+        event (dict): The event payload sent by Stripe.
+
+    A redelivery that races the first delivery loses on the unique event ID; the insert
+    runs in its own savepoint so the conflict is absorbed and the webhook still answers 200.
+
+    Returns:
+        bool: True if the event is new, False if it was delivered before.
+    """
+    try:
+        with transaction.atomic():
+            StripeEvent.objects.create(event_id=event['id'], type=event.get('type', ''), payload=event)
+    except IntegrityError:
+        return False
+    return True
+
+
+def credit_purchases(session_ids):
+    """
+    Credit the pending purchases of paid checkout sessions. Must run inside a transaction.
+
+    Purchases are locked and only credited while still pending, so a session is credited
+    once however many times Stripe reports it. All purchases are posted to the ledger with
+    one call, and their transactions and events are written with one statement each.
+
+    Args:
+        session_ids (iterable): IDs of paid Stripe Checkout sessions.
+
+    Returns:
+        int: The number of purchases credited.
+    """
+    purchases = list(PointsPurchase.objects.select_for_update().filter(
+        session_id__in=list(session_ids), status='PENDING').order_by('pk'))
+    if not purchases:
+        return 0
+
+    user_ids = {purchase.user_id for purchase in purchases}
+    Wallet.objects.bulk_create([Wallet(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+    wallets = dict(Wallet.objects.filter(user_id__in=user_ids).values_list('user_id', 'pk'))
+
+    post_entries([
+        ('PURCHASE', f'Stripe session {purchase.session_id}', [
+            ('PURCHASES', None, -purchase.points),
+            ('WALLET', wallets[purchase.user_id], purchase.points),
+        ])
+        for purchase in purchases
+    ])
+    PointsPurchase.objects.filter(pk__in=[purchase.pk for purchase in purchases]).update(
+        status='CREDITED', credited_at=timezone.now())
+    Transaction.objects.bulk_create([
+        Transaction(user_id=purchase.user_id, type='PURCHASE', amount=purchase.points,
+                    description='Purchase Points')
+        for purchase in purchases
+    ])
+    Event.objects.bulk_create([
+        Event(user_id=purchase.user_id, event_type=Event.PURCHASE, payload={'amount': purchase.points})
+        for purchase in purchases
+    ])
+    return len(purchases)
+
+
+def _event_object(event):
+    """
+    Get the object a stored Stripe event is about.
+
+    Events with an unexpected payload are logged and yield None, so they are marked as
+    processed without blocking the events stored after them.
+
+    Args:
+        event (StripeEvent): The stored event.
+
+    Returns:
+        dict: The `data.object` of the payload, or None if the payload has no such object.
+    """
+    data = event.payload.get('data') if isinstance(event.payload, dict) else None
+    obj = data.get('object') if isinstance(data, dict) else None
+    if not isinstance(obj, dict):
+        logger.warning('Skipping malformed Stripe event %s', event.event_id)
+        return None
+    return obj
+
+
+def process_stripe_events(batch_size=WEBHOOK_BATCH_SIZE):
+    """
+    Process stored Stripe events in batches until none are pending.
+
+    Each batch is claimed with `SELECT ... FOR UPDATE SKIP LOCKED`, so several workers can run
+    side by side. Paid checkout sessions are credited and `account.updated` events refresh the
+    cached Stripe account status; other event types, and events whose payload has no object,
+    are only marked as processed.
+
+    Args:
+        batch_size (int): The number of events processed per transaction.
+
+    Returns:
+        tuple: (processed events, credited purchases) counts.
+    """
+    processed = credited = 0
+    pending = StripeEvent.objects.filter(processed_at__isnull=True).order_by('received_at', 'pk')
+    while True:
+        with transaction.atomic():
+            events = list(pending.select_for_update(skip_locked=True)[:batch_size])
+            if not events:
+                break
+            objects = [(event, _event_object(event)) for event in events]
+            sessions = [
+                obj['id'] for event, obj in objects
+                if event.type in PAID_SESSION_EVENTS and obj is not None
+                and obj.get('payment_status') == 'paid' and obj.get('id')
+            ]
+            credited += credit_purchases(sessions)
+            for event, obj in objects:
+                if event.type == 'account.updated' and obj is not None:
+                    apply_account_updated(obj)
+            StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                processed_at=timezone.now())
+        processed += len(events)
+    return processed, credited
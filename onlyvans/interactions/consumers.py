@@ -0,0 +1,187 @@
+import asyncio
+import json
+import re
+from functools import wraps
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.exceptions import PermissionDenied
+from django.db import close_old_connections
+from django.http.request import split_domain_port, validate_host
+from .forms import MessageForm
+from .helpers import has_messaging_permission
+from .models import Thread
+from .realtime import get_broker, thread_channel
+
+THREAD_SOCKET_PATH = re.compile(r'^/ws/messages/thread/(?P<thread_id>\d+)/$')
+
+# Close codes sent before the socket is accepted or when a frame is refused
+CLOSE_NOT_FOUND = 4404
+CLOSE_FORBIDDEN = 4403
+
+INVALID_MESSAGE_FRAME = json.dumps(
+    {'error': 'Сообщение не может быть отправлено.'}, ensure_ascii=False)
+
+
+def _database_sync_to_async(func):
+    """
+    Run a function that uses the database in a worker thread, recycling stale connections
+    before and after like a request does.
+    """
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wraps(func)(wrapper))
+
+
+def _headers(scope):
+    return {name.decode('latin1').lower(): value.decode('latin1') for name, value in scope.get('headers', [])}
+
+
+def _same_origin(headers):
+    """
+    Check that a socket is opened by a page of this site, since browsers send the session
+    cookie to sockets opened by any page.
+
+    The origin must be an http(s) URL whose host is in `ALLOWED_HOSTS`; the opaque `null`
+    origin of sandboxed frames is refused. Clients that send no origin are not browsers.
+    """
+    origin = headers.get('origin')
+    if origin is None:
+        return True
+    parts = urlsplit(origin)
+    if parts.scheme not in ('http', 'https') or not parts.netloc:
+        return False
+    domain, _ = split_domain_port(parts.netloc)
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']
+    return bool(domain) and validate_host(domain, allowed_hosts)
+
+
+@_database_sync_to_async
+def _authorize(headers, thread_id):
+    """
+    Resolve the user from the session cookie and load the thread they may listen on.
+
+    Returns:
+        tuple: (user, thread), or None if the user is anonymous, not a participant of the
+            thread or no longer allowed to message the other participant.
+    """
+    cookies = SimpleCookie(headers.get('cookie', ''))
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    session = import_module(settings.SESSION_ENGINE).SessionStore(morsel.value if morsel else None)
+    user = get_user(SimpleNamespace(session=session))
+    if not user.is_authenticated:
+        return None
+
+    thread = Thread.objects.select_related('low_user', 'high_user').filter(id=thread_id).first()
+    if thread is None or not thread.has_participant(user):
+        return None
+    if not has_messaging_permission(user, thread.get_other_participant(user)):
+        return None
+    return user, thread
+
+
+@_database_sync_to_async
+def _send_message(user, thread, text):
+    """
+    Save a message sent over the socket. It reaches both participants, the sender included,
+    through the broker once it is committed.
+
+    Returns:
+        bool: False if the frame is not a valid message.
+
+    Raises:
+        PermissionDenied: If the user may no longer message the other participant.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return False
+    if not isinstance(data, dict):
+        return False
+    if not has_messaging_permission(user, thread.get_other_participant(user)):
+        raise PermissionDenied
+    form = MessageForm({'body': data.get('body')})
+    if not form.is_valid():
+        return False
+    message = form.save(commit=False)
+    message.sender = user
+    message.thread = thread
+    message.save()
+    return True
+
+
+async def _forward(queue, send):
+    while True:
+        frame = await queue.get()
+        await send({'type': 'websocket.send', 'text': frame})
+
+
+async def thread_socket(scope, receive, send, thread_id):
+    """
+    Exchange the messages of a thread over a WebSocket.
+
+    The client sends `{"body": "..."}` frames; every message committed in the thread, whether
+    sent over a socket or with the form, is pushed to both participants as one small JSON frame
+    (see `realtime.message_frame`).
+
+    Args:
+        scope (dict): The ASGI connection scope.
+        receive (callable): The ASGI receive channel.
+        send (callable): The ASGI send channel.
+        thread_id (int): The ID of the thread.
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    headers = _headers(scope)
+    access = await _authorize(headers, thread_id) if _same_origin(headers) else None
+    if access is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+    user, thread = access
+
+    broker = get_broker()
+    channel = thread_channel(thread.id)
+    queue = broker.subscribe(channel)
+    await send({'type': 'websocket.accept'})
+    forwarder = asyncio.create_task(_forward(queue, send))
+    try:
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            if event['type'] != 'websocket.receive' or not event.get('text'):
+                continue
+            try:
+                sent = await _send_message(user, thread, event['text'])
+            except PermissionDenied:
+                await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+                break
+            if not sent:
+                await send({'type': 'websocket.send', 'text': INVALID_MESSAGE_FRAME})
+    finally:
+        forwarder.cancel()
+        broker.unsubscribe(channel, queue)
+
+
+async def websocket_application(scope, receive, send):
+    """
+    Route WebSocket connections to their consumer. Unknown paths are refused.
+    """
+    match = THREAD_SOCKET_PATH.match(scope['path'])
+    if match is None:
+        await receive()
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    await thread_socket(scope, receive, send, int(match['thread_id']))
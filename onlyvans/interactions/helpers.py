@@ -1,4 +1,11 @@
-from client.models import Subscription
+from django.db import connection, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Subquery, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from creator.models import Post
+from .models import Like, Message, MessagingPermission, Thread
+
+MESSAGE_WINDOW = 50
 
 
 def has_messaging_permission(sender, recipient):
@@ -9,6 +16,8 @@ def has_messaging_permission(sender, recipient):
     1. The recipient has an active subscription to one of the sender's tiers that allows messaging.
     2. The sender has an active subscription to one of the recipient's tiers that allows messaging.
 
+    Both are precomputed in MessagingPermission, so the check is a single-row lookup.
+
     Args:
         sender (CustomUser): The user sending the message.
         recipient (CustomUser): The user receiving the message.
@@ -16,22 +25,134 @@ def has_messaging_permission(sender, recipient):
     Returns:
         bool: True if there is messaging permission between the sender and recipient, False otherwise.
     """
+    low, high = sorted((sender.id, recipient.id))
+    return MessagingPermission.objects.filter(low_user_id=low, high_user_id=high).exists()
+
+
+def inbox_threads(user):
+    """
+    Build the inbox of a user as a single queryset, ready to be paginated in SQL.
+
+    Each thread is annotated with correlated subqueries instead of being inspected one by one:
+    - other_id, other_username: The other participant.
+    - last_message_body, last_message_at: The newest message of the thread.
+    - message_count: The number of messages in the thread.
+    - can_message: Whether the pair has a MessagingPermission row.
+
+    Only threads the user may still message in are returned, newest activity first.
+
+    Args:
+        user (CustomUser): The owner of the inbox.
+
+    Returns:
+        QuerySet: The user's threads with the annotations above.
+    """
+    latest = Message.objects.filter(thread=OuterRef('pk')).order_by('-sent_at', '-id')
+    counts = Message.objects.filter(thread=OuterRef('pk')).order_by().values(
+        'thread').annotate(total=Count('pk')).values('total')
+    permitted = MessagingPermission.objects.filter(
+        low_user=OuterRef('low_user'), high_user=OuterRef('high_user'))
+
+    return Thread.objects.filter(Q(low_user=user) | Q(high_user=user)).annotate(
+        other_id=Case(When(low_user=user, then=F('high_user')), default=F('low_user')),
+        other_username=Case(When(low_user=user, then=F('high_user__username')), default=F('low_user__username')),
+        last_message_body=Subquery(latest.values('body')[:1]),
+        last_message_at=Subquery(latest.values('sent_at')[:1]),
+        message_count=Coalesce(Subquery(counts), 0),
+        can_message=Exists(permitted),
+    ).filter(can_message=True).order_by(F('last_message_at').desc(nulls_last=True), '-pk')
+
+
+def encode_cursor(message):
+    """
+    Encode the position of a message as a `(sent_at, id)` cursor for loading earlier messages.
+    """
+    return f'{message.sent_at.isoformat()}_{message.id}'
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by `encode_cursor`.
+
+    Returns:
+        tuple: (sent_at, id).
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    sent_at, message_id = cursor.rsplit('_', 1)
+    return timezone.datetime.fromisoformat(sent_at), int(message_id)
+
+
+def message_window(thread, before=None, size=MESSAGE_WINDOW):
+    """
+    Get a window of a thread's messages: the latest ones, or the ones just before a cursor.
+
+    The window is read backwards along the (thread, -sent_at, -id) index, with the sender and
+    their profile joined in, so its cost depends on `size` and not on the thread's length.
+
+    Args:
+        thread (Thread): The thread.
+        before (str, optional): A cursor from `encode_cursor`; only earlier messages are returned.
+        size (int): The maximum number of messages.
+
+    Returns:
+        tuple: (messages, cursor). The messages are oldest first; the cursor points before the
+            first of them, or is None if there are no earlier messages.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    messages = thread.messages.select_related('sender__profile').order_by('-sent_at', '-id')
+    if before is not None:
+        sent_at, message_id = decode_cursor(before)
+        messages = messages.filter(Q(sent_at__lt=sent_at) | Q(sent_at=sent_at, id__lt=message_id))
+    window = list(messages[:size + 1])
+    cursor = encode_cursor(window[size - 1]) if len(window) > size else None
+    return window[:size][::-1], cursor
+
+
+def toggle_like(user, post_id):
+    """
+    Like a post, or remove the like if the user already liked it, in a single transaction.
+
+    The toggle takes at most three statements: a DELETE of the existing like, an INSERT that
+    ignores a conflicting row created by a concurrent request, and an UPDATE of the post's
+    like counter that returns the new value. The statements are issued directly, so the
+    `Like` signal receivers do not run and the counter is adjusted here instead.
+
+    Args:
+        user (CustomUser): The user toggling the like.
+        post_id (int): The ID of the post.
+
+    Returns:
+        tuple: (liked, likes_count) where `liked` is True if the post is now liked by the user.
+
+    Raises:
+        Post.DoesNotExist: If there is no post with the given ID.
+    """
+    like_table = connection.ops.quote_name(Like._meta.db_table)
+    post_table = connection.ops.quote_name(Post._meta.db_table)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {like_table} WHERE user_id = %s AND post_id = %s RETURNING id',
+            [user.id, post_id])
+        if cursor.fetchone():
+            liked, delta = False, -1
+        else:
+            cursor.execute(
+                f'INSERT INTO {like_table} (user_id, post_id, liked_at) VALUES (%s, %s, %s) '
+                f'ON CONFLICT (user_id, post_id) DO NOTHING RETURNING id',
+                [user.id, post_id, connection.ops.adapt_datetimefield_value(timezone.now())])
+            # No row back means a concurrent request liked the post first
+            liked, delta = True, 1 if cursor.fetchone() else 0
 
-    # Check if the recipient has an active subscription to the sender's tier with messaging permission
-    creator_to_follower = Subscription.objects.filter(
-        user=recipient,
-        tier__user=sender,
-        tier__message_permission=True,
-        status='ACTIVE'
-    ).exists()
-
-    # Check if the sender has an active subscription to the recipient's tier with messaging permission
-    follower_to_creator = Subscription.objects.filter(
-        user=sender,
-        tier__user=recipient,
-        tier__message_permission=True,
-        status='ACTIVE'
-    ).exists()
-
-    # Return True if either condition is met, otherwise False
-    return creator_to_follower or follower_to_creator
+        cursor.execute(
+            f'UPDATE {post_table} SET likes_count = CASE WHEN likes_count + %s < 0 THEN 0 '
+            f'ELSE likes_count + %s END WHERE id = %s RETURNING likes_count',
+            [delta, delta, post_id])
+        row = cursor.fetchone()
+        if row is None:
+            raise Post.DoesNotExist
+    return liked, row[0]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interactions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['thread', '-sent_at', '-id'], name='message_thread_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+from collections import defaultdict
+from django.db import migrations
+
+CHUNK_SIZE = 1000
+
+
+def backfill_pairs(apps, schema_editor):
+    """
+    Store the normalized participant pair of every thread and merge threads of the same pair.
+
+    The oldest thread of a pair is kept and the messages of the others are moved into it.
+    Threads without participants cannot be opened by anyone and are deleted.
+    """
+    Thread = apps.get_model('interactions', 'Thread')
+    Message = apps.get_model('interactions', 'Message')
+    Participant = Thread.participants.through
+
+    participants = defaultdict(list)
+    for thread_id, user_id in Participant.objects.order_by('thread_id', 'customuser_id').values_list(
+            'thread_id', 'customuser_id').iterator(chunk_size=CHUNK_SIZE):
+        participants[thread_id].append(user_id)
+
+    kept, duplicates, empty = {}, defaultdict(list), []
+    for thread_id in Thread.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=CHUNK_SIZE):
+        users = participants.get(thread_id)
+        if not users:
+            empty.append(thread_id)
+            continue
+        pair = (users[0], users[-1])
+        if pair in kept:
+            duplicates[kept[pair]].append(thread_id)
+        else:
+            kept[pair] = thread_id
+
+    pairs = list(kept.items())
+    for start in range(0, len(pairs), CHUNK_SIZE):
+        threads = [Thread(pk=thread_id, low_user_id=low, high_user_id=high)
+                   for (low, high), thread_id in pairs[start:start + CHUNK_SIZE]]
+        Thread.objects.bulk_update(threads, ['low_user', 'high_user'])
+
+    for thread_id, merged in duplicates.items():
+        Message.objects.filter(thread_id__in=merged).update(thread_id=thread_id)
+        Thread.objects.filter(pk__in=merged).delete()
+    Thread.objects.filter(pk__in=empty).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interactions', '0003_thread_pair'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_pairs, migrations.RunPython.noop),
+    ]
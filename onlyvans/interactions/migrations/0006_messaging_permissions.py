@@ -0,0 +1,46 @@
+# Generated by Django 5.0.3 on 2026-10-17 04:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_permissions(apps, schema_editor):
+    """
+    Grant messaging between every creator and their active subscribers of tiers that allow it.
+    """
+    Subscription = apps.get_model('client', 'Subscription')
+    MessagingPermission = apps.get_model('interactions', 'MessagingPermission')
+
+    pairs = {
+        tuple(sorted(pair)) for pair in Subscription.objects.filter(
+            status='ACTIVE', tier__message_permission=True).values_list('user_id', 'tier__user_id').iterator()
+    }
+    MessagingPermission.objects.bulk_create(
+        [MessagingPermission(low_user_id=low, high_user_id=high) for low, high in pairs],
+        batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('interactions', '0005_thread_pair_unique'),
+        ('client', '0005_subscription_ended_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessagingPermission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('high_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('low_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='messagingpermission',
+            constraint=models.UniqueConstraint(fields=('low_user', 'high_user'), name='messaging_permission_pair_unique'),
+        ),
+        migrations.RunPython(backfill_permissions, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,74 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from functools import partial
 from account.models import CustomUser
-from creator.models import Post
+from client.models import Subscription
+from creator.models import Post, Tier
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from .realtime import publish_message
+
+
+class ThreadManager(models.Manager):
+
+    def between(self, user, other_user):
+        """
+        Get the thread between two users, creating it if it does not exist yet.
+
+        The lookup is a single probe of the unique (low_user, high_user) index. When two
+        requests create the same thread at once, the unique constraint makes the slower one
+        fetch the thread of the faster one.
+
+        Args:
+            user (CustomUser): One participant.
+            other_user (CustomUser): The other participant.
+
+        Returns:
+            Thread: The thread of the pair.
+        """
+        low, high = sorted((user, other_user), key=lambda participant: participant.id)
+        thread = self.filter(low_user=low, high_user=high).first()
+        if thread is not None:
+            return thread
+        with transaction.atomic():
+            thread, created = self.get_or_create(low_user=low, high_user=high)
+            if created:
+                thread.participants.add(low, high)
+        return thread
 
 
 class Thread(models.Model):
     """
     Represents a thread of messages between two users.
 
+    Each pair of users has at most one thread. The pair is stored in normalized order, lower
+    user id first, under a unique constraint, so a thread is found with one index probe and
+    concurrent first messages cannot create a second one. See `Thread.objects.between`.
+
     Fields:
     - participants: A many-to-many relationship with CustomUser, indicating the participants in the thread.
+    - low_user: The participant with the lower user id.
+    - high_user: The participant with the higher user id.
 
     Methods:
     - __str__(): Returns a string representation of the thread, listing the usernames of the participants.
     - get_other_participant(user): Given a user, returns the other participant in the thread.
+    - has_participant(user): Checks whether a user is one of the participants.
     - clean(): Validates that a thread can only have two participants.
     """
     participants = models.ManyToManyField(CustomUser, related_name='threads')
+    low_user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    high_user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+
+    objects = ThreadManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['low_user', 'high_user'], name='thread_pair_unique'),
+            models.CheckConstraint(check=models.Q(low_user__lte=F('high_user')), name='thread_pair_ordered'),
+        ]
 
     def __str__(self):
         return f"Чат между {', '.join(participant.username for participant in self.participants.all())}"
@@ -32,7 +83,10 @@ class Thread(models.Model):
         Returns:
             CustomUser: The other participant in the thread.
         """
-        return self.participants.exclude(id=user.id).first()
+        return self.high_user if self.low_user_id == user.id else self.low_user
+
+    def has_participant(self, user):
+        return user.id in (self.low_user_id, self.high_user_id)
 
     def clean(self):
         """
@@ -42,7 +96,7 @@ class Thread(models.Model):
             ValidationError: If the thread has more than two participants.
         """
         super().clean()
-        if self.participants.count() > 2:
+        if self.pk and self.participants.count() > 2:
             raise ValidationError("В чате может быть только два участника.")
 
 
@@ -66,10 +120,38 @@ class Message(models.Model):
     body = models.TextField()
     sent_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['thread', '-sent_at', '-id'],
+                         name='message_thread_recent_idx'),
+        ]
+
     def __str__(self):
         return f"Сообщения от {self.sender.username} в чате {self.thread}"
 
 
+class MessagingPermission(models.Model):
+    """
+    Marks a pair of users who may message each other.
+
+    A row exists while one of the two has an active subscription to a tier of the other that
+    allows messaging. Rows are kept up to date by `refresh_messaging_permissions`, which runs
+    when subscriptions are saved or deleted, when tiers are saved, and after bulk renewals.
+    The pair is normalized like `Thread`, so a thread's pair is also its permission key.
+
+    Fields:
+    - low_user: The user with the lower id.
+    - high_user: The user with the higher id.
+    """
+    low_user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    high_user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['low_user', 'high_user'], name='messaging_permission_pair_unique'),
+        ]
+
+
 class Like(models.Model):
     """
     Represents a like on a post by a user.
@@ -90,6 +172,20 @@ class Like(models.Model):
     class Meta:
         unique_together = ('user', 'post')
 
+    def save(self, *args, **kwargs):
+        """
+        Save the like and shift the post's like counter in one transaction.
+        """
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """
+        Delete the like and shift the post's like counter in one transaction.
+        """
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
 
 class Comment(models.Model):
     """
@@ -106,3 +202,139 @@ class Comment(models.Model):
         Post, on_delete=models.CASCADE, related_name='comments')
     text = models.TextField()
     commented_at = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        """
+        Save the comment and shift the post's comment counter in one transaction.
+        """
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """
+        Delete the comment and shift the post's comment counter in one transaction.
+        """
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+def _adjust_post_counter(post_id, field, delta):
+    """
+    Atomically shift one of the denormalized counters of a post.
+
+    The change is applied with an `F()` expression, so concurrent updates are not lost.
+    The receivers below run inside the transaction of the write that fired them, opened by
+    the `save` and `delete` of `Like` and `Comment`, so a failed counter update rolls the
+    like or comment back with it.
+    Decrements never take a counter below zero; drift is repaired by the
+    `reconcile_post_counters` management command.
+
+    Args:
+        post_id (int): The ID of the post to update.
+        field (str): The counter field, 'likes_count' or 'comments_count'.
+        delta (int): 1 to increment, -1 to decrement.
+    """
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(**{f'{field}__gte': -delta})
+    posts.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Like)
+def increment_likes_count(sender, instance, created, **kwargs):
+    """
+    Signal receiver that increments the post's like counter when a like is created.
+    """
+    if created:
+        _adjust_post_counter(instance.post_id, 'likes_count', 1)
+
+
+@receiver(post_delete, sender=Like)
+def decrement_likes_count(sender, instance, **kwargs):
+    """
+    Signal receiver that decrements the post's like counter when a like is deleted.
+    """
+    _adjust_post_counter(instance.post_id, 'likes_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comments_count(sender, instance, created, **kwargs):
+    """
+    Signal receiver that increments the post's comment counter when a comment is created.
+    """
+    if created:
+        _adjust_post_counter(instance.post_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comments_count(sender, instance, **kwargs):
+    """
+    Signal receiver that decrements the post's comment counter when a comment is deleted.
+    """
+    _adjust_post_counter(instance.post_id, 'comments_count', -1)
+
+
+@receiver(post_save, sender=Message)
+def push_message(sender, instance, created, **kwargs):
+    """
+    Signal receiver that pushes a new message to the sockets of its thread once it is committed.
+    """
+    if created:
+        transaction.on_commit(partial(publish_message, instance), robust=True)
+
+
+def refresh_messaging_permissions(pairs, batch_size=500):
+    """
+    Recompute the messaging permission of pairs of users.
+
+    Each batch costs three statements: one query for the active messaging subscriptions
+    between the pairs, one insert of the granted pairs and one delete of the revoked ones.
+
+    Args:
+        pairs (iterable): (user_id, user_id) tuples, in any order.
+        batch_size (int): The number of pairs recomputed at a time.
+    """
+    pairs = list({tuple(sorted(pair)) for pair in pairs})
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start:start + batch_size]
+        between = Q()
+        for low, high in batch:
+            between |= Q(user_id=low, tier__user_id=high) | Q(user_id=high, tier__user_id=low)
+        granted = {
+            tuple(sorted(pair)) for pair in Subscription.objects.filter(
+                between, status='ACTIVE', tier__message_permission=True).values_list('user_id', 'tier__user_id')
+        }
+        MessagingPermission.objects.bulk_create(
+            [MessagingPermission(low_user_id=low, high_user_id=high) for low, high in granted],
+            ignore_conflicts=True)
+        revoked = Q()
+        for low, high in set(batch) - granted:
+            revoked |= Q(low_user_id=low, high_user_id=high)
+        if revoked:
+            MessagingPermission.objects.filter(revoked).delete()
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    """
+    Signal receiver that recomputes the permission of a subscriber and creator when the
+    subscription starts, ends, changes tier or is deleted.
+    """
+    try:
+        creator_id = instance.tier.user_id
+    except Tier.DoesNotExist:  # The tier is being deleted with its subscriptions
+        return
+    refresh_messaging_permissions([(instance.user_id, creator_id)])
+
+
+@receiver(post_save, sender=Tier)
+def tier_changed(sender, instance, created, **kwargs):
+    """
+    Signal receiver that recomputes the permissions of a tier's active subscribers, since
+    `message_permission` may have changed.
+    """
+    if not created:
+        refresh_messaging_permissions(
+            (user_id, instance.user_id)
+            for user_id in instance.subscribers.filter(status='ACTIVE').values_list('user_id', flat=True))
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_MESSAGE_BROKER = 'interactions.realtime.LocalBroker'
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class BaseBroker:
+    """
+    The pub/sub layer that carries new messages to the sockets listening on a thread.
+
+    A broker delivers frames published on a channel to every subscriber of that channel.
+    `publish` is called from synchronous code, after the message is committed; `subscribe`
+    and `unsubscribe` are called by the socket on its event loop. Backends that span several
+    processes, e.g. on top of Redis, implement the same three methods and are selected with
+    the `MESSAGE_BROKER` setting.
+    """
+
+    def subscribe(self, channel):
+        """
+        Start listening on a channel.
+
+        Args:
+            channel (str): The channel name.
+
+        Returns:
+            asyncio.Queue: The queue the frames of the channel are put on.
+        """
+        raise NotImplementedError
+
+    def unsubscribe(self, channel, queue):
+        """
+        Stop listening on a channel.
+
+        Args:
+            channel (str): The channel name.
+            queue (asyncio.Queue): The queue returned by `subscribe`.
+        """
+        raise NotImplementedError
+
+    def publish(self, channel, frame):
+        """
+        Deliver a frame to every subscriber of a channel.
+
+        Args:
+            channel (str): The channel name.
+            frame (str): The text frame.
+        """
+        raise NotImplementedError
+
+
+class LocalBroker(BaseBroker):
+    """
+    A broker that keeps subscribers in memory and only reaches sockets of the same process.
+
+    Frames are handed to each subscriber's event loop with `call_soon_threadsafe`, so they can
+    be published from worker threads such as synchronous views.
+    """
+
+    def __init__(self):
+        self.subscribers = defaultdict(dict)
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        queue = asyncio.Queue()
+        with self.lock:
+            self.subscribers[channel][queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        with self.lock:
+            listeners = self.subscribers.get(channel, {})
+            listeners.pop(queue, None)
+            if not listeners:
+                self.subscribers.pop(channel, None)
+
+    def publish(self, channel, frame):
+        with self.lock:
+            listeners = list(self.subscribers.get(channel, {}).items())
+        for queue, loop in listeners:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, frame)
+
+
+def get_broker():
+    """
+    Get the broker of the process, built from the `MESSAGE_BROKER` setting on first use.
+
+    Returns:
+        BaseBroker: The broker.
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'MESSAGE_BROKER', DEFAULT_MESSAGE_BROKER))()
+    return _broker
+
+
+def thread_channel(thread_id):
+    return f'thread-{thread_id}'
+
+
+def message_data(message):
+    """
+    Get the fields of a message sent to the browser, over a socket or when loading earlier messages.
+
+    Args:
+        message (Message): The message.
+
+    Returns:
+        dict: The message id, sender, body and time.
+    """
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'sender': message.sender.username,
+        'body': message.body,
+        'sent_at': message.sent_at.isoformat(),
+    }
+
+
+def message_frame(message):
+    """
+    Serialize a message into the text frame sent to the sockets of its thread.
+
+    Args:
+        message (Message): The message.
+
+    Returns:
+        str: `message_data` as compact JSON.
+    """
+    return json.dumps(message_data(message), ensure_ascii=False, separators=(',', ':'))
+
+
+def publish_message(message):
+    """
+    Push a committed message to both participants of its thread.
+
+    Args:
+        message (Message): The message.
+    """
+    get_broker().publish(thread_channel(message.thread_id), message_frame(message))
@@ -0,0 +1,377 @@
+import asyncio
+import json
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import DatabaseError, connection
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from unittest.mock import patch
+from client.models import Subscription
+from creator.models import Post, Tier
+from .consumers import CLOSE_FORBIDDEN, websocket_application
+from .helpers import MESSAGE_WINDOW, has_messaging_permission
+from .models import Comment, Like, Message, Thread
+from .realtime import LocalBroker
+
+
+class LikeToggleTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with a free post and a logged-in client.
+        """
+        self.client = Client()
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        self.client_user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com', is_content_creator=False
+        )
+        self.post = Post.objects.create(title='Post', text='Text', is_free=True, user=self.creator_user)
+        self.client.login(username='testclient', password='testpassword')
+
+    def test_like_and_unlike(self):
+        """
+        Posting twice likes and then unlikes the post, keeping the counter in sync.
+        """
+        response = self.client.post(reverse('like_post', args=[self.post.id]))
+        self.assertEqual(response.json(), {'success': True, 'likes_count': 1, 'liked': True})
+        self.assertTrue(Like.objects.filter(user=self.client_user, post=self.post).exists())
+
+        response = self.client.post(reverse('like_post', args=[self.post.id]))
+        self.assertEqual(response.json(), {'success': True, 'likes_count': 0, 'liked': False})
+        self.assertFalse(Like.objects.filter(user=self.client_user, post=self.post).exists())
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_like_counts_other_users(self):
+        """
+        The returned count includes likes from other users.
+        """
+        Like.objects.create(user=self.creator_user, post=self.post)
+
+        response = self.client.post(reverse('like_post', args=[self.post.id]))
+
+        self.assertEqual(response.json()['likes_count'], 2)
+
+    def test_like_missing_post(self):
+        """
+        Liking a post that does not exist returns 404 and writes nothing.
+        """
+        response = self.client.post(reverse('like_post', args=[self.post.id + 100]))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Like.objects.exists())
+
+    def test_like_requires_post(self):
+        """
+        The toggle endpoint does not accept GET requests.
+        """
+        response = self.client.get(reverse('like_post', args=[self.post.id]))
+
+        self.assertEqual(response.status_code, 405)
+
+    def test_failed_counter_update_rolls_back_write(self):
+        """
+        A like or comment is not kept, or removed, when its counter update fails.
+        """
+        with patch('interactions.models._adjust_post_counter', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                Like.objects.create(user=self.client_user, post=self.post)
+            with self.assertRaises(DatabaseError):
+                Comment.objects.create(user=self.client_user, post=self.post, text='Text')
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+
+        comment = Comment.objects.create(user=self.client_user, post=self.post, text='Text')
+        with patch('interactions.models._adjust_post_counter', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                comment.delete()
+        self.assertTrue(Comment.objects.filter(pk=comment.pk).exists())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (0, 1))
+
+
+class InboxTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a creator with a messaging tier and a logged-in client.
+        """
+        self.client = Client()
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        self.client_user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com', is_content_creator=False
+        )
+        self.tier = Tier.objects.create(
+            name='Chat', points_price=100, description='Chat tier', user=self.creator_user, message_permission=True)
+        self.client.login(username='testcreator', password='testpassword')
+
+    def add_thread(self, username, messages=2, subscribed=True):
+        """
+        Create a client with a thread with the creator, optionally subscribed to the messaging tier.
+        """
+        other = get_user_model().objects.create_user(
+            username=username, password='testpassword', email=f'{username}@example.com')
+        if subscribed:
+            Subscription.objects.create(user=other, tier=self.tier, status='ACTIVE', start_date=timezone.now(),
+                                        end_date=timezone.now() + timezone.timedelta(days=30))
+        thread = Thread.objects.between(self.creator_user, other)
+        for index in range(messages):
+            Message.objects.create(thread=thread, sender=other, body=f'{username} message {index}')
+        return thread
+
+    def test_inbox_annotations(self):
+        """
+        Each thread comes with its other participant, last message and count, and unpermitted threads are left out.
+        """
+        thread = self.add_thread('fan1', messages=3)
+        self.add_thread('fan2', subscribed=False)
+
+        response = self.client.get(reverse('direct_messages'))
+
+        threads = list(response.context['threads'])
+        self.assertEqual([item.pk for item in threads], [thread.pk])
+        self.assertEqual((threads[0].other_username, threads[0].message_count, threads[0].last_message_body),
+                         ('fan1', 3, 'fan1 message 2'))
+        self.assertContains(response, 'Чат с fan1')
+
+    def test_inbox_query_count_is_constant(self):
+        """
+        The inbox costs the same number of queries for 3 and for 25 threads.
+        """
+        for index in range(3):
+            self.add_thread(f'fan{index}')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('direct_messages'))
+
+        for index in range(3, 25):
+            self.add_thread(f'fan{index}')
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('direct_messages'))
+
+        self.assertEqual(len(response.context['threads']), 20)
+        self.assertEqual(len(many), len(few))
+
+    def test_thread_between_is_one_lookup(self):
+        """
+        Opening a conversation finds the pair's thread with one query whichever side opens it.
+        """
+        thread = Thread.objects.between(self.client_user, self.creator_user)
+        self.assertEqual((thread.low_user, thread.high_user), (self.creator_user, self.client_user))
+        self.assertEqual(set(thread.participants.all()), {self.creator_user, self.client_user})
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Thread.objects.between(self.creator_user, self.client_user), thread)
+        self.assertEqual(Thread.objects.count(), 1)
+
+    def test_messaging_permission_follows_subscriptions(self):
+        """
+        Permission is granted on subscribing, revoked when the tier stops allowing messages or the
+        subscription ends, and checked with one query.
+        """
+        self.assertFalse(has_messaging_permission(self.creator_user, self.client_user))
+        subscription = Subscription.objects.create(
+            user=self.client_user, tier=self.tier, status='ACTIVE', start_date=timezone.now(),
+            end_date=timezone.now() + timezone.timedelta(days=30))
+        with self.assertNumQueries(1):
+            self.assertTrue(has_messaging_permission(self.client_user, self.creator_user))
+
+        self.tier.message_permission = False
+        self.tier.save()
+        self.assertFalse(has_messaging_permission(self.creator_user, self.client_user))
+
+        self.tier.message_permission = True
+        self.tier.save()
+        self.assertTrue(has_messaging_permission(self.creator_user, self.client_user))
+
+        subscription.delete()
+        self.assertFalse(has_messaging_permission(self.creator_user, self.client_user))
+
+
+class MessageHistoryTests(TestCase):
+
+    def setUp(self):
+        """
+        Set up a thread between a creator and a subscribed client with more messages than one window.
+        """
+        self.client = Client()
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        self.client_user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com', is_content_creator=False
+        )
+        tier = Tier.objects.create(
+            name='Chat', points_price=100, description='Chat tier', user=self.creator_user, message_permission=True)
+        Subscription.objects.create(user=self.client_user, tier=tier, status='ACTIVE', start_date=timezone.now(),
+                                    end_date=timezone.now() + timezone.timedelta(days=30))
+        self.thread = Thread.objects.between(self.creator_user, self.client_user)
+        start = timezone.now() - timezone.timedelta(days=1)
+        # Pairs of messages share a timestamp, so the id breaks ties
+        self.messages = Message.objects.bulk_create([
+            Message(thread=self.thread, sender=(self.client_user, self.creator_user)[index % 2],
+                    body=f'message {index}', sent_at=start + timezone.timedelta(seconds=index // 2))
+            for index in range(MESSAGE_WINDOW * 2 + 10)
+        ])
+        self.client.login(username='testclient', password='testpassword')
+
+    def test_thread_renders_latest_window(self):
+        """
+        The thread page renders only the latest messages, oldest first, with a cursor to earlier ones.
+        """
+        response = self.client.get(reverse('view_thread', args=[self.thread.id]))
+
+        rendered = [message.body for message in response.context['direct_messages']]
+        self.assertEqual(rendered, [message.body for message in self.messages[-MESSAGE_WINDOW:]])
+        self.assertIsNotNone(response.context['cursor'])
+        self.assertContains(response, 'load-earlier')
+
+    def test_earlier_messages_walk_back_to_the_start(self):
+        """
+        Following the cursors returns every earlier message exactly once, in fixed-size chunks.
+        """
+        cursor = self.client.get(reverse('view_thread', args=[self.thread.id])).context['cursor']
+        loaded, sizes = [], []
+        while cursor:
+            data = self.client.get(reverse('earlier_messages', args=[self.thread.id]), {'before': cursor}).json()
+            loaded = [message['body'] for message in data['messages']] + loaded
+            sizes.append(len(data['messages']))
+            cursor = data['cursor']
+
+        self.assertEqual(sizes, [MESSAGE_WINDOW, 10])
+        self.assertEqual(loaded, [message.body for message in self.messages[:-MESSAGE_WINDOW]])
+
+    def test_render_cost_does_not_depend_on_thread_length(self):
+        """
+        Rendering the thread costs the same number of queries however long the thread is.
+        """
+        with CaptureQueriesContext(connection) as short:
+            self.client.get(reverse('view_thread', args=[self.thread.id]))
+        Message.objects.bulk_create(
+            Message(thread=self.thread, sender=self.creator_user, body='more') for _ in range(100))
+        with CaptureQueriesContext(connection) as long:
+            self.client.get(reverse('view_thread', args=[self.thread.id]))
+
+        self.assertEqual(len(long), len(short))
+
+    def test_earlier_messages_rejects_outsiders_and_bad_cursors(self):
+        """
+        Only participants can load messages, and a malformed cursor is a bad request.
+        """
+        url = reverse('earlier_messages', args=[self.thread.id])
+        self.assertEqual(self.client.get(url, {'before': 'nonsense'}).status_code, 400)
+
+        get_user_model().objects.create_user(username='outsider', password='testpassword', email='outsider@example.com')
+        self.client.login(username='outsider', password='testpassword')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class RealtimeTests(TransactionTestCase):
+
+    def setUp(self):
+        """
+        Set up a creator and a client subscribed to a messaging tier, with a thread between them.
+        """
+        self.creator_user = get_user_model().objects.create_user(
+            username='testcreator', password='testpassword', email='creator@example.com', is_content_creator=True
+        )
+        self.client_user = get_user_model().objects.create_user(
+            username='testclient', password='testpassword', email='client@example.com', is_content_creator=False
+        )
+        tier = Tier.objects.create(
+            name='Chat', points_price=100, description='Chat tier', user=self.creator_user, message_permission=True)
+        Subscription.objects.create(user=self.client_user, tier=tier, status='ACTIVE', start_date=timezone.now(),
+                                    end_date=timezone.now() + timezone.timedelta(days=30))
+        self.thread = Thread.objects.between(self.creator_user, self.client_user)
+
+    def socket_scope(self, username, origin='http://testserver'):
+        """
+        Build the scope of a socket on the thread opened by a logged-in user from a page of `origin`.
+        """
+        client = Client()
+        client.login(username=username, password='testpassword')
+        scope = {
+            'type': 'websocket',
+            'path': f'/ws/messages/thread/{self.thread.id}/',
+            'headers': [(b'host', b'testserver'), (b'origin', origin.encode()),
+                        (b'cookie', f'sessionid={client.cookies["sessionid"].value}'.encode())],
+        }
+        return scope
+
+    def test_message_is_pushed_to_both_participants(self):
+        """
+        A message sent over one socket is saved and pushed to both participants as a small frame.
+        """
+        scopes = self.socket_scope('testclient'), self.socket_scope('testcreator')
+
+        async def exchange():
+            sender, recipient = (ApplicationCommunicator(websocket_application, scope) for scope in scopes)
+            for communicator in (sender, recipient):
+                await communicator.send_input({'type': 'websocket.connect'})
+                self.assertEqual((await communicator.receive_output())['type'], 'websocket.accept')
+            await sender.send_input({'type': 'websocket.receive', 'text': json.dumps({'body': 'Привет'})})
+            frames = [json.loads((await communicator.receive_output())['text']) for communicator in (sender, recipient)]
+            for communicator in (sender, recipient):
+                await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+                await communicator.wait()
+            return frames
+
+        frames = async_to_sync(exchange)()
+
+        message = Message.objects.get(thread=self.thread)
+        self.assertEqual(frames[0], frames[1])
+        self.assertEqual((frames[0]['id'], frames[0]['sender'], frames[0]['body']),
+                         (message.id, 'testclient', 'Привет'))
+
+    def test_outsider_is_refused(self):
+        """
+        A user who is not a participant of the thread cannot listen on it.
+        """
+        get_user_model().objects.create_user(username='outsider', password='testpassword', email='outsider@example.com')
+        scope = self.socket_scope('outsider')
+
+        async def connect():
+            communicator = ApplicationCommunicator(websocket_application, scope)
+            await communicator.send_input({'type': 'websocket.connect'})
+            return await communicator.receive_output()
+
+        self.assertEqual(async_to_sync(connect)(), {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_foreign_origins_are_refused(self):
+        """
+        Sockets opened from another site or from an opaque `null` origin are refused.
+        """
+        for origin in ('null', 'http://evil.example.com', 'file://testserver'):
+            scope = self.socket_scope('testclient', origin=origin)
+
+            async def connect():
+                communicator = ApplicationCommunicator(websocket_application, scope)
+                await communicator.send_input({'type': 'websocket.connect'})
+                return await communicator.receive_output()
+
+            self.assertEqual(async_to_sync(connect)(), {'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+
+    def test_local_broker_delivers_to_subscribers_of_the_channel(self):
+        """
+        Frames published from another thread reach the subscribers of their channel only.
+        """
+        broker = LocalBroker()
+
+        async def listen():
+            queue, other = broker.subscribe('thread-1'), broker.subscribe('thread-2')
+            await asyncio.to_thread(broker.publish, 'thread-1', 'frame')
+            frame = await asyncio.wait_for(queue.get(), 1)
+            broker.unsubscribe('thread-1', queue)
+            broker.unsubscribe('thread-2', other)
+            return frame, other.empty()
+
+        self.assertEqual(asyncio.run(listen()), ('frame', True))
+        self.assertEqual(broker.subscribers, {})
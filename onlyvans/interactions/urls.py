@@ -5,6 +5,7 @@ urlpatterns = [
     path('messages/', views.direct_messages, name='direct_messages'),
     path('messages/send/<str:username>/', views.view_thread, name='view_thread_with_user'),
     path('messages/thread/<int:thread_id>/', views.view_thread, name='view_thread'),
+    path('messages/thread/<int:thread_id>/earlier/', views.earlier_messages, name='earlier_messages'),
     path('like/<int:post_id>/', views.like_post, name='like_post'),
 ]
 
@@ -19,5 +20,6 @@ Paths:
 - 'messages/': Displays direct messages for the logged-in user. View: views.direct_messages
 - 'messages/send/<str:username>/': Displays a message thread with a specific user. View: views.view_thread
 - 'messages/thread/<int:thread_id>/': Displays a specific message thread by thread ID. View: views.view_thread
+- 'messages/thread/<int:thread_id>/earlier/': Loads earlier messages of a thread. View: views.earlier_messages
 - 'like/<int:post_id>/': Allows the logged-in user to like a specific post. View: views.like_post
 """
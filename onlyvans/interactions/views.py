@@ -4,11 +4,11 @@ from .forms import MessageForm
 from account.models import CustomUser
 from .models import Thread
 from creator.models import Post
-from interactions.models import Like
-from .helpers import has_messaging_permission
-from django.db.models import Max
+from .helpers import has_messaging_permission, inbox_threads, message_window, toggle_like
+from .realtime import message_data
 from django.core.paginator import Paginator
 from django.http import JsonResponse
+from django.views.decorators.http import require_POST
 from django.contrib import messages
 
 
@@ -17,12 +17,10 @@ def direct_messages(request):
     """
     Display the direct messages for the logged-in user.
 
-    This view retrieves all message threads involving the logged-in user,
-    annotates them with the date of the last message, and orders them by
-    this date. Threads are paginated with 20 threads per page.
-
-    Only threads where the user has messaging permission with the other
-    participant are included in the context.
+    The inbox is built by `inbox_threads`: each thread comes with its other participant,
+    last message, message count and messaging permission from a single query, and only the
+    requested page of 20 threads is fetched. Threads where the user no longer has messaging
+    permission with the other participant are left out.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -30,20 +28,7 @@ def direct_messages(request):
     Returns:
         HttpResponse: The rendered direct messages page with threads.
     """
-    user = request.user
-    threads = Thread.objects.filter(participants=user).annotate(
-        last_message_date=Max('messages__sent_at')
-    ).order_by('-last_message_date')
-
-    threads_context = [
-        {
-            'thread': thread,
-            'other_participant': thread.get_other_participant(user),
-        }
-        for thread in threads if has_messaging_permission(user, thread.get_other_participant(user))
-    ]
-
-    paginator = Paginator(threads_context, 20)
+    paginator = Paginator(inbox_threads(request.user), 20)
     page_number = request.GET.get('page')
     threads_page = paginator.get_page(page_number)
 
@@ -62,6 +47,8 @@ def view_thread(request, username=None, thread_id=None):
     the specific thread is retrieved.
 
     Messaging permissions are checked before displaying or sending messages.
+    Only the latest `MESSAGE_WINDOW` messages are rendered; earlier ones are loaded
+    in chunks from `earlier_messages`.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -81,15 +68,10 @@ def view_thread(request, username=None, thread_id=None):
             messages.error(request, "Вы не можете написать сами себе.")
             return redirect('direct_messages')
 
-        thread = Thread.objects.filter(participants=user).filter(
-            participants=other_user).first()
-        if not thread:
-            # Create a new thread
-            thread = Thread.objects.create()
-            thread.participants.add(user, other_user)
+        thread = Thread.objects.between(user, other_user)
     else:
-        thread = get_object_or_404(Thread, id=thread_id)
-        if user not in thread.participants.all():
+        thread = get_object_or_404(Thread.objects.select_related('low_user', 'high_user'), id=thread_id)
+        if not thread.has_participant(user):
             messages.error(
                 request, "У вас нет прав на просмотр этого чата.")
             return redirect('direct_messages')
@@ -110,23 +92,57 @@ def view_thread(request, username=None, thread_id=None):
         message.save()
         return redirect('view_thread', thread_id=thread.id)
 
+    direct_messages, cursor = message_window(thread)
     return render(request, 'direct_messages/view_thread.html', {
         'thread': thread,
-        'direct_messages': thread.messages.order_by('sent_at'),
+        'direct_messages': direct_messages,
+        'cursor': cursor,
         'form': form,
         'other_participant': other_user,
     })
 
 
 @login_required
+def earlier_messages(request, thread_id):
+    """
+    Load the chunk of a thread's messages just before a `(sent_at, id)` cursor.
+
+    Args:
+        request (HttpRequest): The HTTP request object, with the cursor in the `before` parameter.
+        thread_id (int): The ID of the thread.
+
+    Returns:
+        JsonResponse: The messages, oldest first, and the cursor of the next chunk, or null
+            when there are no earlier messages.
+    """
+    thread = Thread.objects.select_related('low_user', 'high_user').filter(id=thread_id).first()
+    if thread is None or not thread.has_participant(request.user):
+        return JsonResponse({'success': False}, status=404)
+    if not has_messaging_permission(request.user, thread.get_other_participant(request.user)):
+        return JsonResponse({'success': False}, status=403)
+
+    try:
+        chunk, cursor = message_window(thread, before=request.GET.get('before'))
+    except ValueError:
+        return JsonResponse({'success': False}, status=400)
+    return JsonResponse({
+        'success': True,
+        'messages': [message_data(message) for message in chunk],
+        'cursor': cursor,
+    })
+
+
+@login_required
+@require_POST
 def like_post(request, post_id):
     """
     Like or unlike a specific post.
 
     If the post is already liked by the user, the like is removed.
-    Otherwise, a new like is added. The view returns a JSON response
-    indicating the success status, the current number of likes, and
-    whether the post is now liked by the user.
+    Otherwise, a new like is added. The toggle runs in a single transaction
+    (see `toggle_like`). The view returns a JSON response indicating the
+    success status, the current number of likes, and whether the post is
+    now liked by the user.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -135,14 +151,8 @@ def like_post(request, post_id):
     Returns:
         JsonResponse: A JSON response with the success status, likes count, and liked status.
     """
-    post = get_object_or_404(Post, id=post_id)
-    like, created = Like.objects.get_or_create(user=request.user, post=post)
-
-    if not created:
-        like.delete()
-        liked = False
-    else:
-        like.save()
-        liked = True
-
-    return JsonResponse({'success': True, 'likes_count': post.likes_count, 'liked': liked})
+    try:
+        liked, likes_count = toggle_like(request.user, post_id)
+    except Post.DoesNotExist:
+        return JsonResponse({'success': False}, status=404)
+    return JsonResponse({'success': True, 'likes_count': likes_count, 'liked': liked})
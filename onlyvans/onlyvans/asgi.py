@@ -2,6 +2,8 @@
 ASGI config for onlyvans project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests are served by Django; WebSocket connections are routed to the
+consumers of the interactions application.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -13,4 +15,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'onlyvans.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up, since the consumers use the models
+from interactions.consumers import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -87,6 +87,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'onlyvans.wsgi.application'
+ASGI_APPLICATION = 'onlyvans.asgi.application'  # Serves WebSockets too, e.g. `uvicorn onlyvans.asgi:application`
 
 
 # Database
@@ -155,5 +156,13 @@ SECURE_CROSS_ORIGIN_OPENER_POLICY = 'same-origin-allow-popups'
 STRIPE_PUBLIC_KEY = "pk_test_OUX4U69NmHLC98Qyt5SyS0gO"
 STRIPE_SECRET_KEY = "sk_test_51BxwpQCgJvsRWmtc6TNu6ZKUpouPL5k4QNPkq3CZwB9MTT0gvdmZbIwA3m7CFbEGvureH9NmCdaD8UFUvyzFgqOt00h2fL0TUV"
 STRIPE_WEBHOOK_SECRET = "whsec_d95b26ac9f1390cd98d97779aca64367020032bab29333c38a3539056b3f9574"
+STRIPE_API_BASE = "https://api.stripe.com"  # Point at a local fake Stripe server in development
+STRIPE_ACCOUNT_CACHE_TTL = 60 * 60  # Seconds a cached Stripe account status stays fresh
+
+EVENT_BACKGROUND_WRITES = False  # Write committed events from a background thread instead of the request
+EVENT_ARCHIVE_DIR = BASE_DIR / 'archive' / 'events'  # Parquet files of archived event months
+EVENT_RETENTION_MONTHS = 6  # Months of events kept in the database, including the current one
+
+MESSAGE_BROKER = 'interactions.realtime.LocalBroker'  # Pub/sub backend pushing messages to sockets of one process
 
 DOLLARS_PER_POINT = 1 / 21.5  # 21.5 points = $1
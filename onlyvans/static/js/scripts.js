@@ -95,7 +95,94 @@ document.addEventListener('DOMContentLoaded', function () {
         messageForm.addEventListener('keydown', function (event) {
             if (event.key === 'Enter' && !event.shiftKey) {
                 event.preventDefault();
-                messageForm.submit();
+                messageForm.requestSubmit();
+            }
+        });
+    }
+
+    // Logic for real-time messages: new messages arrive over a WebSocket and are sent as one
+    // small frame; the form is posted as usual while the socket is not open
+    if (container && container.dataset.socketPath) {
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${window.location.host}${container.dataset.socketPath}`);
+        const userId = container.dataset.userId;
+
+        function messageRow(message) {
+            const own = String(message.sender_id) === userId;
+            const avatar = document.createElement('img');
+            avatar.src = own ? container.dataset.userAvatar : container.dataset.otherAvatar;
+            avatar.alt = 'Avatar';
+            avatar.className = own ? 'rounded-circle ms-2' : 'rounded-circle me-2';
+            avatar.style.width = '40px';
+            avatar.style.height = '40px';
+
+            const bubble = document.createElement('div');
+            bubble.className = (own ? 'bg-primary text-white' : 'bg-light') + ' rounded p-2 shadow-sm';
+            const body = document.createElement('p');
+            body.className = 'mb-1';
+            body.textContent = message.body;
+            const sentAt = document.createElement('small');
+            sentAt.className = 'text-muted';
+            sentAt.textContent = new Date(message.sent_at).toLocaleString();
+            bubble.append(body, sentAt);
+
+            const row = document.createElement('div');
+            row.className = 'd-flex mb-3 ' + (own ? 'justify-content-end' : 'justify-content-start');
+            if (own) {
+                row.append(bubble, avatar);
+            } else {
+                row.append(avatar, bubble);
+            }
+            return row;
+        }
+
+        function appendMessage(message) {
+            container.appendChild(messageRow(message));
+            container.scrollTop = container.scrollHeight;
+        }
+
+        // Load earlier messages in chunks, keeping the visible messages in place
+        const loadEarlierButton = document.getElementById('load-earlier');
+        if (loadEarlierButton) {
+            loadEarlierButton.addEventListener('click', function () {
+                const params = new URLSearchParams({ before: loadEarlierButton.dataset.cursor });
+                fetch(`${loadEarlierButton.dataset.url}?${params}`)
+                    .then(response => response.json())
+                    .then(data => {
+                        if (!data.success) {
+                            return;
+                        }
+                        const height = container.scrollHeight;
+                        const anchor = loadEarlierButton.parentNode.nextSibling;
+                        data.messages.forEach(message => container.insertBefore(messageRow(message), anchor));
+                        container.scrollTop += container.scrollHeight - height;
+                        if (data.cursor) {
+                            loadEarlierButton.dataset.cursor = data.cursor;
+                        } else {
+                            loadEarlierButton.parentNode.remove();
+                        }
+                    });
+            });
+        }
+
+        socket.addEventListener('message', function (event) {
+            const data = JSON.parse(event.data);
+            if (data.error) {
+                alert(data.error);
+            } else {
+                appendMessage(data);
+            }
+        });
+
+        messageForm.addEventListener('submit', function (event) {
+            if (socket.readyState !== WebSocket.OPEN) {
+                return;
+            }
+            event.preventDefault();
+            const body = messageInput.value.trim();
+            if (body) {
+                socket.send(JSON.stringify({ body: body }));
+                messageInput.value = '';
             }
         });
     }